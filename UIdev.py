@@ -4,19 +4,28 @@ import io
 import os
 import uuid
 import json
+import hashlib
+from collections import OrderedDict
+from functools import lru_cache
 
-from PyQt5.QtWidgets import QApplication, QMainWindow, QVBoxLayout, QWidget, QLabel, QPushButton, QPlainTextEdit, QHBoxLayout, QGridLayout, QListWidgetItem, QListWidget, QToolButton, QLineEdit, QFormLayout
+from PyQt5.QtWidgets import QApplication, QMainWindow, QVBoxLayout, QWidget, QLabel, QPushButton, QPlainTextEdit, QHBoxLayout, QGridLayout, QListWidgetItem, QListWidget, QToolButton, QLineEdit, QFormLayout, QScrollArea
 from PyQt5.QtGui import QImage, QPixmap
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QObject, QThread, QTimer, pyqtSignal, pyqtSlot
 import fitz  # PyMuPDF
 
 import music_parser as prs
 # import project_organiser as porg
-from kassia_main import Kassia
 
 
 absolute_path = os.path.dirname(__file__)
 
+# Milliseconds of no typing before the preview is rendered again
+PREVIEW_DEBOUNCE = 400
+
+# Most bytes of rasterized pages the PDF viewer keeps, and the space between its pages
+PIXMAP_CACHE_BYTES = 128 * 1024 * 1024
+PAGE_SPACING = 10
+
 
 class ProjectView(QMainWindow):
 
@@ -201,8 +210,64 @@ class ScoreSetup(QWidget):
         self.close()
 
 
+@lru_cache(maxsize = None)
+def header_template(name):
+    '''Read a header from the headers folder, once per run of the editor.'''
+    with open(absolute_path + f'\\headers\\{name}', 'r', encoding = 'utf-8') as f:
+        return f.read()
+
+
+class PreviewWorker(QObject):
+
+    '''
+    Renders previews on a background thread, with a renderer that stays warm between them.
+
+    Requests are numbered. A request that is no longer the latest when the worker gets to it is skipped,
+    and one that goes stale while it renders is dropped between its steps, or once it is done, so only the
+    latest preview ever reaches the viewer. A render can't be stopped halfway through a step.
+
+    Nothing is written to disk: the txt becomes a bnml element, which is rendered to PDF bytes.
+    '''
+
+    rendered = pyqtSignal(int, bytes)  # Request number, PDF
+    failed = pyqtSignal(int, str)  # Request number, error
+
+    def __init__(self, header):
+        super().__init__()
+        self.header = header
+        self.renderer = None
+        self.latest = 0  # Set from the UI thread
+
+    @pyqtSlot()
+    def warm_up(self):
+        # Imported here, so the window opens before the fonts are registered
+        from kassia.renderer import Renderer
+        from kassia.startup import warm_up
+        if self.renderer is None:
+            self.renderer = Renderer()
+            warm_up(self.renderer)
+
+    @pyqtSlot(int, str)
+    def render(self, request, raw_section):
+        if request != self.latest:
+            return
+        try:
+            self.warm_up()
+            music = prs.music_from_txt(raw_section, self.header)
+            if request != self.latest:
+                return
+            pdf = self.renderer.render(music.to_element())
+        except (Exception, SystemExit) as e:  # Kassia exits on XML parse errors
+            self.failed.emit(request, str(e))
+            return
+        if request == self.latest:
+            self.rendered.emit(request, pdf)
+
+
 class ScoreWriter(QWidget):
 
+    preview_requested = pyqtSignal(int, str)
+
     def __init__(
             self,
             score_id = None
@@ -231,9 +296,7 @@ class ScoreWriter(QWidget):
         
         self.music = None
 
-        headerfile = absolute_path + '\\headers\\psaltoglas1.xml'
-        with open(headerfile, 'r', encoding = 'utf-8') as f:
-            self.header = f.read()
+        self.header = header_template('psaltoglas1.xml')
 
         self.setWindowTitle(f"Score Writer - {self.metadata['Title']}")
         self.setGeometry(0, 0, 600, 700)
@@ -244,6 +307,28 @@ class ScoreWriter(QWidget):
         if self.raw_music:
             self.input.setPlainText(self.raw_music)
 
+        # Previews render on their own thread, a while after typing stops, and only the section at the cursor
+        self.preview_timer = QTimer(self)
+        self.preview_timer.setSingleShot(True)
+        self.preview_timer.setInterval(PREVIEW_DEBOUNCE)
+        self.preview_timer.timeout.connect(self.request_preview)
+        self.input.textChanged.connect(self.preview_timer.start)
+        self.input.cursorPositionChanged.connect(self.preview_timer.start)
+
+        self.preview_request = 0
+        self.preview_section = None
+        self.cursor_fraction = 0.0
+        self.preview_thread = QThread(self)
+        self.preview_worker = PreviewWorker(self.header)
+        self.preview_worker.moveToThread(self.preview_thread)
+        self.preview_worker.rendered.connect(self.show_preview)
+        self.preview_worker.failed.connect(self.preview_failed)
+        self.preview_requested.connect(self.preview_worker.render)
+        self.preview_thread.started.connect(self.preview_worker.warm_up)
+        self.preview_thread.start()
+
+        self.status = QLabel()
+
         self.preview_button = QPushButton('Preview')
         self.preview_button.clicked.connect(self.update)
 
@@ -258,6 +343,7 @@ class ScoreWriter(QWidget):
         self.buttons.addWidget(self.preview_button)
         self.buttons.addWidget(self.close_button)
 
+        self.layout.addWidget(self.status)
         self.layout.addWidget(self.preview_button)
         self.layout.addLayout(self.buttons)
         
@@ -266,25 +352,49 @@ class ScoreWriter(QWidget):
     def update_cache(self):
         self.raw_music = self.input.toPlainText()
     
-    def popup_pdf(self, filename):
-        self.pdf = PDFViewer(filename)
+    def popup_pdf(self, pdf, page_fraction = 0.0):
+        if self.pdf is None:
+            self.pdf = PDFViewer(pdf, page_fraction)
+        else:
+            self.pdf.load(pdf, page_fraction)
         self.pdf.show()
 
-    def render_score(self, cache_pdf_file = 'ttt.pdf', cache_xml_file = 'tt.xml'):
-
-        cache_pdf_path = f"{self.score_path}\\{cache_pdf_file}"
-        cache_xml_path = f"{self.score_path}\\{cache_xml_file}"
-
-        self.music = prs.music_from_txt(self.raw_music, self.header)
-        self.music.write_to_file(cache_xml_path)
-        kassia = Kassia(cache_xml_path, cache_pdf_path)
-
-        self.popup_pdf(cache_pdf_path)
+    def request_preview(self):
+        self.preview_timer.stop()
+        self.update_cache()
+        cursor = self.input.textCursor().position()
+        start, end = prs.section_at(self.raw_music, cursor)
+        section = self.raw_music[start:end]
+        self.cursor_fraction = (cursor - start) / max(end - start, 1)
+        if not section.strip():
+            return
+        if section == self.preview_section:
+            # Only the cursor moved within the section, so show its page of the preview already rendered
+            if self.pdf is not None and self.preview_request == self.preview_worker.latest:
+                self.pdf.show_page_at(self.cursor_fraction)
+            return
+
+        self.preview_section = section
+        self.preview_request += 1
+        self.preview_worker.latest = self.preview_request
+        self.status.setText('Rendering...')
+        self.preview_requested.emit(self.preview_request, section)
+
+    def show_preview(self, request, pdf):
+        if request != self.preview_request:
+            return
+        self.status.setText('')
+        self.popup_pdf(pdf, self.cursor_fraction)
+
+    def preview_failed(self, request, error):
+        if request != self.preview_request:
+            return
+        self.preview_section = None  # So the same text is tried again
+        self.status.setText(error)
 
     def update(self):
-        self.update_cache()
-        if self.raw_music:
-            self.render_score()
+        self.preview_section = None
+        self.request_preview()
 
     # def clear_layout(self, layout):
     #     for i in reversed(range(layout.count())):
@@ -299,45 +409,164 @@ class ScoreWriter(QWidget):
             f.write(self.raw_music)
         self.close()
 
+    def closeEvent(self, event):
+        self.preview_timer.stop()
+        self.preview_worker.latest = -1  # Drop whatever is still queued
+        self.preview_thread.quit()
+        self.preview_thread.wait()
+        super().closeEvent(event)
 
-class PDFViewer(QMainWindow):
-    def __init__(self, filename):
-        super().__init__()
 
-        self.setWindowTitle("PDF Viewer")
-        self.setGeometry(500, 30, 600, 700)
+class PixmapCache:
+
+    '''
+    Rasterized pages by key, dropping the least recently used ones once they take more than max_bytes.
+    '''
 
-        self.central_widget = QWidget(self)
-        self.setCentralWidget(self.central_widget)
+    def __init__(self, max_bytes = PIXMAP_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._pixmaps = OrderedDict()
 
-        self.layout = QVBoxLayout(self.central_widget)
+    def get(self, key):
+        pixmap = self._pixmaps.get(key)
+        if pixmap is not None:
+            self._pixmaps.move_to_end(key)
+        return pixmap
 
-        # Load PDF file
-        self.doc = fitz.open(filename)
+    def __setitem__(self, key, pixmap):
+        if key in self._pixmaps:
+            self.bytes -= self._size(self._pixmaps.pop(key))
+        self._pixmaps[key] = pixmap
+        self.bytes += self._size(pixmap)
+        while self.bytes > self.max_bytes and len(self._pixmaps) > 1:
+            _, dropped = self._pixmaps.popitem(last = False)
+            self.bytes -= self._size(dropped)
 
-        # Display first page
-        self.display_page(self.doc.page_count-1)
+    def __len__(self):
+        return len(self._pixmaps)
 
-    def display_page(self, page_num):
-        page = self.doc.load_page(page_num)
-        pix = page.get_pixmap()
-        image = QImage(pix.samples, pix.width, pix.height, pix.stride, QImage.Format_RGB888)
-        pixmap = QPixmap.fromImage(image)
+    @staticmethod
+    def _size(pixmap):
+        return pixmap.width() * pixmap.height() * pixmap.depth() // 8
 
-        # Create label to display the page
-        label = QLabel()
-        label.setPixmap(pixmap)
-        label.setAlignment(Qt.AlignCenter)
 
-        # Clear layout and add the label
-        self.clear_layout()
-        self.layout.addWidget(label)
+class PDFViewer(QMainWindow):
+
+    '''
+    Shows every page of a PDF in a scrollable column, fitted to the window's width.
+
+    Pages are only rasterized once they are scrolled near the view, at the resolution of the screen. Pixmaps
+    are cached by a hash of what the page draws, so when a new preview is loaded, the pages that didn't
+    change are shown straight away, without rasterizing them again.
+    '''
+
+    def __init__(self, pdf, page_fraction = 1.0):
+        super().__init__()
+
+        self.setWindowTitle("PDF Viewer")
+        self.setGeometry(500, 30, 600, 700)
 
-    def clear_layout(self):
-        for i in reversed(range(self.layout.count())):
-            widget = self.layout.itemAt(i).widget()
-            if widget is not None:
-                widget.deleteLater()
+        self.pixmaps = PixmapCache()
+        self.page_keys = []
+        self.page_sizes = []
+        self.labels = []
+        self.shown = []  # Cache key of the pixmap each label shows
+        self.zoom = 1.0
+        self.doc = None
+
+        self.pages_widget = QWidget()
+        self.layout = QVBoxLayout(self.pages_widget)
+        self.layout.setAlignment(Qt.AlignHCenter)
+        self.layout.setSpacing(PAGE_SPACING)
+
+        self.scroll_area = QScrollArea()
+        self.scroll_area.setWidgetResizable(True)
+        self.scroll_area.setWidget(self.pages_widget)
+        self.scroll_area.verticalScrollBar().valueChanged.connect(self.render_visible)
+        self.setCentralWidget(self.scroll_area)
+
+        self.load(pdf, page_fraction)
+
+    def load(self, pdf, page_fraction = 1.0):
+        '''Show a PDF, given as bytes, scrolled to the page that is page_fraction of the way through it.'''
+        if self.doc is not None:
+            self.doc.close()
+        self.doc = fitz.open(stream = pdf, filetype = 'pdf')
+        self.page_keys = [self.page_key(self.doc, page) for page in self.doc]
+        self.page_sizes = [(page.rect.width, page.rect.height) for page in self.doc]
+
+        while len(self.labels) < len(self.page_keys):
+            label = QLabel()
+            label.setAlignment(Qt.AlignCenter)
+            label.setStyleSheet('background: white')
+            self.layout.addWidget(label)
+            self.labels.append(label)
+        while len(self.labels) > len(self.page_keys):
+            self.labels.pop().deleteLater()
+        self.shown = [None] * len(self.labels)
+
+        self.layout_pages()
+        QTimer.singleShot(0, lambda: self.show_page_at(page_fraction))
+
+    @staticmethod
+    def page_key(doc, page):
+        # The text is decoded through the fonts, so a glyph that moved within a font subset changes the key
+        digest = hashlib.sha1(repr(tuple(page.rect)).encode())
+        for xref in page.get_contents():
+            digest.update(doc.xref_stream(xref))
+        digest.update(page.get_text().encode())
+        return digest.hexdigest()
+
+    def layout_pages(self):
+        '''Size the pages to fit the width of the window, and show the ones already rasterized at that size.'''
+        if not self.page_sizes:
+            return
+        width = self.scroll_area.viewport().width() - 2 * PAGE_SPACING
+        self.zoom = max(width, 100) / max(w for w, _ in self.page_sizes)
+        for i, (label, (w, h)) in enumerate(zip(self.labels, self.page_sizes)):
+            label.setFixedSize(int(w * self.zoom), int(h * self.zoom))
+            pixmap = self.pixmaps.get(self.pixmap_key(i))
+            label.setPixmap(pixmap if pixmap is not None else QPixmap())
+            self.shown[i] = self.pixmap_key(i) if pixmap is not None else None
+
+    def pixmap_key(self, page_num):
+        return self.page_keys[page_num], round(self.zoom * self.devicePixelRatioF(), 3)
+
+    def show_page_at(self, page_fraction):
+        if not self.labels:
+            return
+        page_num = min(int(page_fraction * len(self.labels)), len(self.labels) - 1)
+        self.scroll_area.verticalScrollBar().setValue(self.labels[page_num].y())
+        self.render_visible()
+
+    def render_visible(self):
+        '''Rasterize the pages in or within a screen of the view that aren't shown at the current size.'''
+        viewport_height = self.scroll_area.viewport().height()
+        top = self.scroll_area.verticalScrollBar().value() - viewport_height
+        bottom = top + 3 * viewport_height
+        missing = [i for i, label in enumerate(self.labels)
+                   if label.y() < bottom and label.y() + label.height() > top and self.shown[i] != self.pixmap_key(i)]
+        if not missing:
+            return
+
+        scale = self.zoom * self.devicePixelRatioF()
+        for i in missing:
+            key = self.pixmap_key(i)
+            pixmap = self.pixmaps.get(key)
+            if pixmap is None:
+                pix = self.doc.load_page(i).get_pixmap(matrix = fitz.Matrix(scale, scale))
+                image = QImage(pix.samples, pix.width, pix.height, pix.stride, QImage.Format_RGB888)
+                pixmap = QPixmap.fromImage(image)
+                pixmap.setDevicePixelRatio(self.devicePixelRatioF())
+                self.pixmaps[key] = pixmap
+            self.labels[i].setPixmap(pixmap)
+            self.shown[i] = key
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.layout_pages()
+        self.render_visible()
 
 
 if __name__ == "__main__":
@@ -1,42 +1,106 @@
 # main.py
-from fastapi import FastAPI, UploadFile, File
-from fastapi.responses import StreamingResponse
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, BinaryIO, List
 
-from io import BytesIO
+from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi.responses import Response, StreamingResponse
 
-from kassia_main import Kassia
+from io import BytesIO, TextIOWrapper
+
+from kassia import startup
+from kassia.trace import NullTracer, Tracer
 import music_parser as prs
 
+if TYPE_CHECKING:
+    from kassia.renderer import Renderer
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Fly suspends idle machines and resumes them from memory, so work done here isn't repeated on resume
+    warm_up()
+    yield
+
+
+app = FastAPI(lifespan=lifespan)
 
-app = FastAPI()
+_renderer = None
 
-def xml_to_pdf(xml_bytes: bytes) -> bytes:
+def get_renderer(tracer: Tracer = None) -> 'Renderer':
+    """The renderer shared by all requests, created on first use so fonts are only registered once."""
+    global _renderer
+    if _renderer is None:
+        tracer = tracer or NullTracer()
+        with tracer.span('import_renderer'):
+            # Imported here, so importing the app stays cheap and ReportLab is loaded while warming up
+            from kassia.renderer import Renderer
+        _renderer = Renderer(tracer=tracer)
+    return _renderer
+
+def warm_up(tracer: Tracer = None):
+    """Register the fonts and render a small document before serving, rather than in the first request."""
+    tracer = tracer or NullTracer()
+    renderer = get_renderer(tracer)
+    with tracer.span('warm_up_render'):
+        startup.warm_up(renderer)
+
+def xml_to_pdf(xml_bytes: bytes, profile=None) -> bytes:
     xml_stream = BytesIO(xml_bytes)
-    pdf_stream = BytesIO()
     
     try:
-        kassia_instance = Kassia(xml_stream, pdf_stream)
+        return get_renderer().render(xml_stream, profile=profile)
     except Exception as e:
         print(e)
         raise RuntimeError(f"Failed to process XML: {e}")
-    
-    return pdf_stream.getvalue()
+
+def xml_to_svg(xml_bytes: bytes) -> List[str]:
+    xml_stream = BytesIO(xml_bytes)
+
+    try:
+        return get_renderer().render_svg(xml_stream)
+    except Exception as e:
+        raise RuntimeError(f"Failed to process XML: {e}")
 
 def txt_to_pdf(txt_bytes: bytes, header: bytes) -> bytes:
-    header_stream = BytesIO(header)
-    txt_stream = BytesIO(txt_bytes)
-    
-    xml_stream = BytesIO()
-    music = prs.music_from_txt(txt_stream.read().decode('utf-8'), header_stream.read().decode('utf-8'))
-    music.write(xml_stream)
-    
-    return xml_to_pdf(xml_stream.getvalue())
+    return txt_stream_to_pdf(BytesIO(txt_bytes), header.decode('utf-8'))
+
+def txt_stream_to_pdf(txt_stream: BinaryIO, header: str, profile=None) -> bytes:
+    music = prs.Music(header)
+
+    # Sections are parsed and laid out as they are read, so the whole text is never held as objects at once
+    text_stream = TextIOWrapper(txt_stream, encoding='utf-8')
+    music_elements = (elem for obj in prs.iter_txt_stream(text_stream) for elem in music.object_elements(obj))
+    try:
+        return get_renderer().render(music.to_element(), music_elements=music_elements, profile=profile)
+    except prs.TxtSyntaxError:
+        raise
+    except Exception as e:
+        raise RuntimeError(f"Failed to process XML: {e}")
+    finally:
+        text_stream.detach()
     
+def trace_response(trace_stream: BytesIO) -> Response:
+    """The trace of a debug render, to open in chrome://tracing or https://ui.perfetto.dev."""
+    return Response(
+        trace_stream.getvalue(),
+        media_type="application/json",
+        headers={"Content-Disposition": "attachment; filename=trace.json"}
+    )
     
 
 @app.post("/xml-to-pdf")
-async def xml_to_pdf_endpoint(file: UploadFile = File(...)):
+async def xml_to_pdf_endpoint(file: UploadFile = File(...), debug: bool = False):
     xml_bytes = await file.read()
+    if debug:
+        trace_stream = BytesIO()
+        xml_to_pdf(xml_bytes, profile=trace_stream)
+        return trace_response(trace_stream)
     pdf_bytes = xml_to_pdf(xml_bytes)
     return StreamingResponse(
         BytesIO(pdf_bytes),
@@ -45,15 +109,78 @@ async def xml_to_pdf_endpoint(file: UploadFile = File(...)):
     )
 
 
+@app.post("/xml-to-svg")
+async def xml_to_svg_endpoint(file: UploadFile = File(...), page: int = 1):
+    xml_bytes = await file.read()
+    svg_pages = xml_to_svg(xml_bytes)
+    if not 1 <= page <= len(svg_pages):
+        raise HTTPException(status_code=404, detail=f"Page {page} not found, the score has {len(svg_pages)} pages")
+    return Response(
+        svg_pages[page - 1],
+        media_type="image/svg+xml",
+        headers={"X-Page-Count": str(len(svg_pages))}
+    )
+
+
 @app.post("/txt-to-pdf")
-async def txt_to_pdf_endpoint(file: UploadFile = File(...), header: UploadFile = File(...)):
-    txt_bytes = await file.read()
+async def txt_to_pdf_endpoint(file: UploadFile = File(...), header: UploadFile = File(...), debug: bool = False):
     h_bytes = await header.read()
-    pdf_bytes = txt_to_pdf(txt_bytes, h_bytes)
-    
-    
+    try:
+        if debug:
+            trace_stream = BytesIO()
+            txt_stream_to_pdf(file.file, h_bytes.decode('utf-8'), profile=trace_stream)
+            return trace_response(trace_stream)
+        pdf_bytes = txt_stream_to_pdf(file.file, h_bytes.decode('utf-8'))
+    except prs.TxtSyntaxError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
     return StreamingResponse(
         BytesIO(pdf_bytes),
         media_type="application/pdf",
         headers={"Content-Disposition": "attachment; filename=output.pdf"}
     )
+
+
+def measure_startup(sample_path: str):
+    """Warm up and render sample_path like the first request would, and print the trace events as JSON."""
+    tracer = Tracer()
+    with tracer.span('warm_up'):
+        warm_up(tracer)
+    with open(sample_path, 'rb') as f:
+        xml_bytes = f.read()
+    with tracer.span('first_request'):
+        xml_to_pdf(xml_bytes)
+    print(json.dumps(tracer.events))
+
+
+def startup_report(sample_path: str) -> bool:
+    """Start the app in a new interpreter, and report how long imports, warm-up and the first PDF take.
+
+    The app is started twice: once to time it, and once with -X importtime, which slows imports down, to
+    break their time down by package.
+
+    :return: Whether the time to the first PDF met the target.
+    """
+    command = [sys.executable, os.path.abspath(__file__), '--measure-startup', sample_path]
+    start = time.perf_counter()
+    result = subprocess.run(command, stdout=subprocess.PIPE, text=True, check=True)
+    seconds = time.perf_counter() - start
+    importtime = subprocess.run(command[:1] + ['-X', 'importtime'] + command[1:], capture_output=True, text=True,
+                                check=True)
+    return startup.print_startup_report(seconds, startup.parse_import_times(importtime.stderr),
+                                        json.loads(result.stdout.splitlines()[-1]))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Kassia web API. Serve it with: uvicorn app:app')
+    parser.add_argument('--startup-report', action='store_true',
+                        help='Break down the time from starting the app to rendering its first PDF')
+    parser.add_argument('--measure-startup', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('sample', nargs='?', default='examples/sample.xml', help='Document for the first request')
+    args = parser.parse_args()
+    if args.measure_startup:
+        measure_startup(args.sample)
+    elif args.startup_report:
+        sys.exit(0 if startup_report(args.sample) else 1)
+    else:
+        parser.print_help()
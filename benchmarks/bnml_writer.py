@@ -0,0 +1,66 @@
+"""Compare building BNML with nested tag() calls against streaming it with BnmlWriter.
+
+Usage: python benchmarks/bnml_writer.py [syllable count]
+"""
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import music_parser as prs  # noqa: E402
+
+NEUMES = ['ison', 'olig-kentU', 'apos', 'olig-gorgU', 'peta-oligU', 'hypo-gorgUR-haplD', 'malfa-mkeU', 'fdiesis']
+
+
+def synthetic_music(syllable_count: int, syllables_per_score: int = 500) -> prs.Music:
+    music = prs.Music('<defaults>\n    <page-layout/>\n</defaults>')
+    for first in range(0, syllable_count, syllables_per_score):
+        music.add_object(prs.Paragraph('Verse {}'.format(first // syllables_per_score), 'h3'))
+        syllables = [prs.Syllable('syl{}'.format(i), NEUMES[i % len(NEUMES)])
+                     for i in range(first, min(first + syllables_per_score, syllable_count))]
+        music.add_object(prs.Score(syllables, mode=1 + first // syllables_per_score % 8, mode_base='Pa'))
+    return music
+
+
+def render_with_tag(music: prs.Music) -> str:
+    """The nested tag() rendering that Music.render used before BnmlWriter."""
+    music_content = [prs.tag(prs.tag('', 'page-number', {'align': 'center'}), 'footer')]
+    for obj in music.objects:
+        if isinstance(obj, prs.Score):
+            music_content.append(obj.render_mode())
+        music_content.append(obj.render())
+    return prs.tag(music.header + '\n' + prs.tag('\n'.join(music_content), 'music'), 'bnml',
+                   {'bnml_version': music.bnml_version})
+
+
+def measure(name: str, run):
+    tracemalloc.start()
+    start = time.perf_counter()
+    run()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print('{:<10} {:8.3f} s {:10.1f} MiB peak'.format(name, elapsed, peak / 2 ** 20))
+
+
+def main():
+    syllable_count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    music = synthetic_music(syllable_count)
+
+    def write_tag():
+        with open(os.devnull, 'wb') as f:
+            f.write(render_with_tag(music).encode())
+
+    def write_stream():
+        with open(os.devnull, 'wb') as f:
+            music.write(f)
+
+    print('{} syllables'.format(syllable_count))
+    measure('tag()', write_tag)
+    measure('BnmlWriter', write_stream)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+"""Generate large synthetic scores, as BNML and as Kassia txt, for scaling tests.
+
+The same seed always gives the same documents. Neume groups are drawn from the KA New Stathis font
+config (registering the fonts first), so every group is valid, and the mix of special cases (ligatures, conditional neumes, martyriae,
+bare and syne) can be turned up with complexity.
+
+Usage:
+    python benchmarks/corpus.py OUTPUT_DIR --scores 20 --syllables 500 --seed 1
+
+writes OUTPUT_DIR/corpus.xml, OUTPUT_DIR/corpus.txt and OUTPUT_DIR/header.xml (the defaults to render
+the txt with).
+"""
+import argparse
+import os
+import random
+import sys
+from typing import List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from reportlab.pdfbase import pdfmetrics  # noqa: E402
+
+import music_parser as prs  # noqa: E402
+from kassia.font_reader import find_and_register_fonts  # noqa: E402
+
+NEUME_FONT = 'KA New Stathis'
+
+DEFAULTS = '''<defaults>
+    <page-layout>
+        <paper-size>letter</paper-size>
+        <page-margins top_margin="50" bottom_margin="50" left_margin="60" right_margin="60" />
+    </page-layout>
+    <score-layout>
+        <ligatures>true</ligatures>
+    </score-layout>
+    <styles>
+        <para-style name="h2" font_family="Alegreya-Medium" font_size="14" align="center" space_after="15" />
+        <para-style name="h3" font_family="Alegreya-Medium" font_size="16" align="center" space_before="15" />
+        <para-style name="verse" font_family="Alegreya-Regular" font_size="14" align="left" space_after="15" />
+        <para-style name="header" font_family="Alegreya-Italic" font_size="8" align="center" />
+        <para-style name="footer" font_family="Alegreya-Italic" font_size="8" align="center" />
+        <score-style font_family="KA New Stathis" font_size="30" align="justify" word_spacing="0" leading="60" />
+        <neume-style type="ordinary" color="#000000" />
+        <neume-style type="accidental" color="#cf232b" />
+        <neume-style type="chronos" color="#cf232b" />
+        <neume-style type="martyria" color="#cf232b" />
+        <lyric-style font_family="Alegreya-Regular" font_size="14" color="#000000" space_before="26" />
+        <dropcap-style font_family="Alegreya-Regular" font_size="46" color="#000000" />
+    </styles>
+</defaults>'''
+
+LYRIC_SYLLABLES = ['a', 'ka', 'lo', 'ri', 'se', 'ton', 'mi', 'ne', 'do', 'xa', 'pa', 'ge', 'ly', 'sto', 'ru', 'thi']
+WORDS = ['Glory', 'to', 'the', 'Father', 'and', 'Son', 'Holy', 'Spirit', 'now', 'ever', 'ages', 'amen', 'verse',
+         'tone', 'mode', 'of', 'the', 'feast']
+
+# Weights of the special cases, relative to a plain neume group, at complexity 1
+SPECIAL_WEIGHTS = {'ligature': 1., 'conditional': 1., 'martyria': .5, 'bare': .5, 'syne': .5, 'accidental': .5}
+
+
+class CorpusGenerator:
+    """Draws random but valid scores, paragraphs and headers from a seeded random generator."""
+
+    def __init__(self, seed: int = 0, complexity: float = .5):
+        """
+        :param seed: Seed of the random generator.
+        :param complexity: From 0 (plain neumes only) to 1 (many modifiers and special cases).
+        """
+        self.random = random.Random(seed)
+        self.complexity = complexity
+
+        config = find_and_register_fonts()[NEUME_FONT]
+        classes = config['classes']
+        # Some names in the config have no glyph in their font, and would be drawn as .notdef boxes
+        glyphnames = {name for name, glyph in config['glyphnames'].items()
+                      if ord(glyph['codepoint'][0]) in pdfmetrics.getFont(glyph['family']).face.charToGlyph}
+
+        def known(names) -> List[str]:
+            return [name for name in names if name in glyphnames and '-' not in name]
+
+        self.primaries = known(name for name in classes['takes_lyric'] if '_' not in name)
+        components = {part for name in classes['takes_lyric'] for part in name.split('_')[1:]}
+        self.secondaries = known(sorted(components)) + known(classes.get('chronos', []))
+        self.ligatures = [lig['component_glyphs'].split('_') for lig in classes['optional_ligatures'].values()
+                          if all(part in glyphnames for part in lig['component_glyphs'].split('_'))]
+        conditionals = [[cond['base_neume'][0], *cond['component_glyphs'], cond['draw_glyph']]
+                        for cond in classes['conditional_neumes'].values()]
+        self.conditionals = [names[:-1] for names in conditionals if all(name in glyphnames for name in names)]
+        martyriae = known(classes['martyriae'])
+        self.martyria_bases = [name for name in martyriae if not name.endswith('U')]
+        self.martyria_tops = [name for name in martyriae if name.endswith('U')]
+        self.accidentals = [name for name in known(classes['accidentals']) if name.startswith('f')]
+
+    def neume_group(self) -> List[str]:
+        choice = self.random
+        weights = [1.] + [weight * self.complexity for weight in SPECIAL_WEIGHTS.values()]
+        case = choice.choices(['plain'] + list(SPECIAL_WEIGHTS), weights)[0]
+        if case == 'ligature' and self.ligatures:
+            return list(choice.choice(self.ligatures))
+        if case == 'conditional' and self.conditionals:
+            return list(choice.choice(self.conditionals))
+        if case == 'martyria':
+            return [choice.choice(self.martyria_bases), choice.choice(self.martyria_tops)]
+        if case == 'bare':
+            return ['bare']
+
+        group = ['syne' if case == 'syne' else choice.choice(self.primaries)]
+        while len(group) < 4 and choice.random() < self.complexity:
+            group.append(choice.choice(self.secondaries))
+        if case == 'accidental' and self.accidentals:
+            group.append(choice.choice(self.accidentals))
+        return group
+
+    def syllable(self, first: bool = False) -> prs.Syllable:
+        group = self.neume_group()
+        while first and group[0] == 'bare':
+            group = self.neume_group()
+        if group[0] == 'bare' or group[0].startswith('m'):
+            lyric = ''
+        else:
+            lyric = ''.join(self.random.choices(LYRIC_SYLLABLES, k=self.random.randint(1, 2)))
+        if first:
+            lyric = lyric.capitalize() or 'A'
+        return prs.Syllable(lyric, '-'.join(group))
+
+    def score(self, syllable_count: int) -> prs.Score:
+        syllables = [self.syllable(first=i == 0) for i in range(syllable_count)]
+        mode = self.random.choice([None, *range(1, 9)])
+        return prs.Score(syllables, mode=mode, mode_base='Pa' if mode else None)
+
+    def paragraph(self) -> prs.Paragraph:
+        words = self.random.choices(WORDS, k=self.random.randint(3, 40))
+        return prs.Paragraph(' '.join(words).capitalize() + '.', self.random.choice(['h2', 'h3', 'verse']))
+
+    def music(self, scores: int, syllables_per_score: int, paragraph_density: float = .5) -> prs.Music:
+        """Generate a document.
+
+        :param scores: Number of scores.
+        :param syllables_per_score: Number of syllables in each score.
+        :param paragraph_density: Chance of a paragraph before each score.
+        """
+        music = prs.Music(DEFAULTS)
+        for _ in range(scores):
+            if self.random.random() < paragraph_density:
+                music.add_object(self.paragraph())
+            music.add_object(self.score(syllables_per_score))
+        return music
+
+
+def write_bnml(music: prs.Music, output_file: str, headers: bool = True):
+    """Write BNML, as Music.write does, with running headers on even and odd pages if headers is set."""
+    with open(output_file, 'w', encoding='utf-8', newline='') as f:
+        writer = prs.BnmlWriter(f)
+        writer.start('bnml', {'bnml_version': music.bnml_version})
+        writer.text(music.header)
+        writer.start('music')
+        if headers:
+            for tag, align in [('header-odd', 'right'), ('header-even', 'left')]:
+                writer.start(tag)
+                writer.line('Synthetic corpus')
+                writer.element('', 'page-number', {'align': align})
+                writer.end(tag)
+        writer.start('footer')
+        writer.element('', 'page-number', {'align': 'center'})
+        writer.end('footer')
+        for obj in music.objects:
+            if isinstance(obj, prs.Score):
+                obj.write_mode_to(writer)
+            obj.write_to(writer)
+        writer.end('music')
+        writer.end('bnml')
+
+
+def write_txt(music: prs.Music, output_file: str):
+    """Write the document in the Kassia txt format read by music_parser.music_from_txt."""
+    with open(output_file, 'w', encoding='utf-8') as f:
+        for index, obj in enumerate(music.objects):
+            if index:
+                f.write('\n---\n\n')
+            if isinstance(obj, prs.Paragraph):
+                f.write('(s: {})\n{}\n'.format(obj.style, obj.content))
+                continue
+            if obj.mode is not None:
+                f.write('(mode: {})\n(base: {})\n\n'.format(obj.mode, obj.mode_base))
+            if not obj.dropcap:
+                f.write('(dropcap: False)\n\n')
+            f.write(''.join('[{}: {}]'.format(s.text, '-'.join(s.neumes)) for s in obj.syllables) + '\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('output_dir')
+    parser.add_argument('--scores', type=int, default=10)
+    parser.add_argument('--syllables', type=int, default=200, help='Syllables per score')
+    parser.add_argument('--complexity', type=float, default=.5, help='0 (plain neumes) to 1 (many special cases)')
+    parser.add_argument('--paragraph-density', type=float, default=.5, help='Chance of a paragraph before a score')
+    parser.add_argument('--no-headers', action='store_true', help='Leave out page headers (BNML only)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    music = CorpusGenerator(args.seed, args.complexity).music(args.scores, args.syllables, args.paragraph_density)
+    os.makedirs(args.output_dir, exist_ok=True)
+    write_bnml(music, os.path.join(args.output_dir, 'corpus.xml'), headers=not args.no_headers)
+    write_txt(music, os.path.join(args.output_dir, 'corpus.txt'))
+    with open(os.path.join(args.output_dir, 'header.xml'), 'w', encoding='utf-8') as f:
+        f.write(DEFAULTS)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Measure how much memory the score model takes per syllable.
+
+A synthetic corpus (see corpus.py) is parsed into scores, then laid out and drawn again with tracemalloc
+on. Two numbers are reported per syllable:
+
+  - retained: the size of the parsed scores kept for the whole render (syllables, neume chunks, neumes
+    and lyrics, with objects shared between syllables, like colors, counted once)
+  - peak: the peak traced memory while laying out and drawing the PDF
+
+Usage: python benchmarks/memory.py [--scores 20] [--syllables 500] [--seed 0]
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from enum import Enum
+from io import BytesIO
+from types import FunctionType, ModuleType
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from corpus import CorpusGenerator  # noqa: E402
+from kassia.parsed_score import ParsedScore  # noqa: E402
+from kassia_main import Kassia  # noqa: E402
+
+SHARED_TYPES = (type, ModuleType, FunctionType, Enum)
+
+
+def deep_size(root) -> int:
+    """Add up sys.getsizeof of everything reachable from root, counting each object once."""
+    seen = set()
+    stack = [root]
+    total = 0
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, SHARED_TYPES):
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        if hasattr(obj, '__dict__'):
+            stack.append(obj.__dict__)
+        for cls in type(obj).__mro__:
+            for slot in getattr(cls, '__slots__', ()):
+                if slot not in ('__dict__', '__weakref__') and hasattr(obj, slot):
+                    stack.append(getattr(obj, slot))
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--scores', type=int, default=20)
+    parser.add_argument('--syllables', type=int, default=500, help='Syllables per score')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    music = CorpusGenerator(args.seed).music(args.scores, args.syllables)
+    start = time.perf_counter()
+    kassia = Kassia(music.to_element(), BytesIO())
+    elapsed = time.perf_counter() - start
+
+    scores = [flowable for flowable in kassia.story if isinstance(flowable, ParsedScore)]
+    syllable_count = sum(len(score.syllables) for score in scores)
+    retained = deep_size(scores)
+
+    tracemalloc.start()
+    kassia.create_pdf(kassia._new_document(BytesIO()))
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    print('{} syllables, rendered in {:.2f} s'.format(syllable_count, elapsed))
+    print('retained: {:8.0f} bytes/syllable ({:.1f} MiB)'.format(retained / syllable_count, retained / 2 ** 20))
+    print('peak:     {:8.0f} bytes/syllable ({:.1f} MiB)'.format(peak / syllable_count, peak / 2 ** 20))
+
+
+if __name__ == '__main__':
+    main()
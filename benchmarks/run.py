@@ -0,0 +1,179 @@
+"""Time the stages of rendering the example and test documents, and compare them against a baseline.
+
+Each document is rendered several times, and the fastest time of each stage is kept. Stages are timed
+where they are called, so create_pdf includes the line_break and line_justify time spent inside it.
+
+Usage:
+    python benchmarks/run.py                      # Print timings, compare with benchmarks/baseline.json
+    python benchmarks/run.py --update-baseline    # Save the timings as the new baseline
+    python benchmarks/run.py --output results.json --threshold 0.5
+
+Exits with status 1 if any stage is slower than its baseline by more than the threshold.
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from io import BytesIO
+from typing import Callable, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import kassia_main  # noqa: E402
+import music_parser as prs  # noqa: E402
+from kassia.font_reader import find_and_register_fonts  # noqa: E402
+from kassia_main import Kassia  # noqa: E402
+
+DEFAULT_INPUTS = ['examples/*.xml', 'tests/*.xml', 'tests/txt/*.txt']
+DEFAULT_TXT_HEADER = 'tests/headers/header1.xml'
+DEFAULT_BASELINE = os.path.join(ROOT, 'benchmarks', 'baseline.json')
+
+# Stages faster than this are too noisy to compare
+MIN_COMPARED_SECONDS = 0.002
+
+Timings = Dict[str, float]
+
+
+class StageTimer:
+    """Adds up the time spent in each stage while patched into Kassia."""
+
+    def __init__(self):
+        self.times: Timings = defaultdict(float)
+
+    def wrap(self, stage: str, function: Callable) -> Callable:
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.times[stage] += time.perf_counter() - start
+        return timed
+
+    @contextmanager
+    def patched(self):
+        stages = ['parse_file', 'parse_music', 'line_break', 'line_justify', 'create_pdf']
+        originals = {name: Kassia.__dict__[name] for name in stages}
+        original_fonts = kassia_main.find_and_register_fonts
+        try:
+            for name, original in originals.items():
+                if isinstance(original, staticmethod):
+                    setattr(Kassia, name, staticmethod(self.wrap(name, original.__func__)))
+                else:
+                    setattr(Kassia, name, self.wrap(name, original))
+            kassia_main.find_and_register_fonts = self.wrap('find_and_register_fonts', original_fonts)
+            yield self
+        finally:
+            for name, original in originals.items():
+                setattr(Kassia, name, original)
+            kassia_main.find_and_register_fonts = original_fonts
+
+
+def time_document(path: str, header: str, repeat: int) -> Timings:
+    """Render a BNML or txt document repeat times, and get the fastest time of each stage."""
+    best: Timings = {}
+    for _ in range(repeat):
+        timer = StageTimer()
+        with timer.patched():
+            if path.endswith('.txt'):
+                with open(path, encoding='utf-8') as f:
+                    raw_music = f.read()
+                music = timer.wrap('music_from_txt', prs.music_from_txt)(raw_music, header)
+                Kassia(music.to_element(), BytesIO())
+            else:
+                Kassia(path, BytesIO())
+        for stage, seconds in timer.times.items():
+            best[stage] = min(seconds, best.get(stage, seconds))
+    return best
+
+
+def run(inputs: List[str], header_path: str, repeat: int) -> Dict:
+    with open(os.path.join(ROOT, header_path), encoding='utf-8') as f:
+        header = f.read()
+
+    # Font registration is timed on its own, since the first call in a process does the real work
+    start = time.perf_counter()
+    find_and_register_fonts()
+    cold_fonts = time.perf_counter() - start
+
+    documents = {}
+    for pattern in inputs:
+        for path in sorted(glob.glob(os.path.join(ROOT, pattern))):
+            documents[os.path.relpath(path, ROOT)] = time_document(path, header, repeat)
+
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': repeat,
+        'cold_find_and_register_fonts': cold_fonts,
+        'documents': documents,
+    }
+
+
+def regressions(results: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """Describe every stage that is slower than its baseline by more than threshold (a fraction)."""
+    found = []
+    for document, stages in results['documents'].items():
+        for stage, seconds in stages.items():
+            base = baseline.get('documents', {}).get(document, {}).get(stage)
+            if base is None or max(base, seconds) < MIN_COMPARED_SECONDS:
+                continue
+            if seconds > base * (1 + threshold):
+                found.append('{} {}: {:.1f} ms, baseline {:.1f} ms (+{:.0%})'.format(
+                    document, stage, seconds * 1000, base * 1000, seconds / base - 1))
+    return found
+
+
+def print_results(results: Dict):
+    print('cold find_and_register_fonts: {:.1f} ms'.format(results['cold_find_and_register_fonts'] * 1000))
+    stages = sorted({stage for timings in results['documents'].values() for stage in timings})
+    widths = [max(len(stage), 9) + 2 for stage in stages]
+    print('{:<32}'.format('document (ms)') + ''.join(stage.rjust(width) for stage, width in zip(stages, widths)))
+    for document, timings in results['documents'].items():
+        print('{:<32}'.format(document[-32:]) + ''.join(
+            ('{:.1f}'.format(timings[stage] * 1000) if stage in timings else '-').rjust(width)
+            for stage, width in zip(stages, widths)))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('inputs', nargs='*', default=DEFAULT_INPUTS,
+                        help='Glob patterns of .xml and .txt documents, relative to the repository')
+    parser.add_argument('--header', default=DEFAULT_TXT_HEADER, help='BNML header for txt documents')
+    parser.add_argument('--repeat', type=int, default=3, help='Renders per document; the fastest is kept')
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='Results to compare against')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='Allowed slowdown of a stage, as a fraction of its baseline time')
+    parser.add_argument('--update-baseline', action='store_true', help='Save the results as the baseline')
+    args = parser.parse_args()
+
+    results = run(args.inputs, args.header, args.repeat)
+    print_results(results)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print('Saved baseline to {}'.format(args.baseline))
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print('No baseline at {}; run with --update-baseline to create one'.format(args.baseline))
+        return 0
+    with open(args.baseline) as f:
+        found = regressions(results, json.load(f), args.threshold)
+    for regression in found:
+        print('REGRESSION ' + regression)
+    return 1 if found else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
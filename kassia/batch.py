@@ -0,0 +1,176 @@
+import glob
+import hashlib
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import reportlab
+
+from .font_reader import LOCAL_FONT_DIR
+from .renderer import Renderer
+
+MANIFEST_NAME = '.kassia-manifest.json'
+MANIFEST_VERSION = 1
+
+FONT_SUFFIXES = ('.ttf', '.otf', '.yaml')
+
+
+class BatchJob:
+    """A BNML file to render, where to write it, and the hash that decides whether it needs rendering."""
+    def __init__(self, input_path: str, output_path: str):
+        self.input_path: str = input_path
+        self.output_path: str = output_path
+        self.key: str or None = None  # Content hash of the input, fonts and code
+        self.seconds: float = 0
+        self.error: str or None = None
+        self.skipped: bool = False
+
+
+def find_inputs(patterns: List[str], output_dir: str) -> List[BatchJob]:
+    """Expand directories and globs into BNML files, and give each an output path in output_dir.
+
+    Files in a directory keep their path relative to it, other files are written by name. Files that would
+    be written to the same output path are all given an error, rather than overwriting each other.
+    """
+    jobs: Dict[str, BatchJob] = {}
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            found = [(path, os.path.relpath(path, pattern))
+                     for path in sorted(glob.glob(os.path.join(pattern, '**', '*.xml'), recursive=True))]
+        else:
+            found = [(path, os.path.basename(path)) for path in sorted(glob.glob(pattern, recursive=True))]
+            if not found:
+                logging.warning("No files match {}".format(pattern))
+        for path, relative_path in found:
+            output_path = os.path.join(output_dir, os.path.splitext(relative_path)[0] + '.pdf')
+            jobs.setdefault(os.path.abspath(path), BatchJob(path, output_path))
+
+    by_output: Dict[str, List[BatchJob]] = {}
+    for job in jobs.values():
+        by_output.setdefault(os.path.abspath(job.output_path), []).append(job)
+    for same_output in by_output.values():
+        if len(same_output) > 1:
+            for job in same_output:
+                job.error = 'Output {} is also the output of {}'.format(
+                    job.output_path, ', '.join(other.input_path for other in same_output if other is not job))
+    return list(jobs.values())
+
+
+def environment_hash() -> str:
+    """Hash everything besides the input that affects a render: the font files and configs, the Kassia
+    code, and the ReportLab version."""
+    digest = hashlib.sha256(reportlab.Version.encode())
+    package_dir = Path(__file__).parent
+    code_files = sorted(package_dir.glob('*.py')) + [package_dir.parent / 'kassia_main.py']
+    font_files = sorted(path for path in Path(LOCAL_FONT_DIR).rglob('*') if path.suffix.lower() in FONT_SUFFIXES)
+    for path in code_files + font_files:
+        digest.update(str(path.relative_to(package_dir.parent)).encode())
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def load_manifest(output_dir: str) -> Dict[str, str]:
+    """Get the hash each output was last rendered from, by output path relative to output_dir."""
+    try:
+        with open(os.path.join(output_dir, MANIFEST_NAME)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get('version') != MANIFEST_VERSION:
+        return {}
+    return manifest.get('outputs', {})
+
+
+def save_manifest(output_dir: str, outputs: Dict[str, str]):
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    with open(path + '.tmp', 'w') as f:
+        json.dump({'version': MANIFEST_VERSION, 'outputs': outputs}, f, indent=1, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+_worker_renderer: Optional[Renderer] = None
+
+
+def _init_worker(use_system_fonts: bool):
+    """Register the fonts once per worker process, before it takes any job."""
+    global _worker_renderer
+    _worker_renderer = Renderer(use_system_fonts)
+
+
+def _render_job(paths: Tuple[str, str]) -> Tuple[float, Optional[str]]:
+    input_path, output_path = paths
+    start = time.perf_counter()
+    try:
+        os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+        _worker_renderer.render(input_path, output_path)
+    except (Exception, SystemExit) as e:  # Kassia exits on XML parse errors
+        return time.perf_counter() - start, '{}: {}'.format(type(e).__name__, e)
+    return time.perf_counter() - start, None
+
+
+def render_batch(patterns: List[str], output_dir: str, jobs: int = None, force: bool = False,
+                 use_system_fonts: bool = False) -> List[BatchJob]:
+    """Render many BNML files to PDFs, skipping those that haven't changed since the last batch.
+
+    An output is skipped if it exists and the manifest in output_dir records it as rendered from the same
+    input, font files, font configs and code. The rest are rendered across a pool of worker processes,
+    each of which registers the fonts once.
+
+    :param patterns: Directories (searched recursively for .xml files) and glob patterns.
+    :param output_dir: Where to write the PDFs and the manifest.
+    :param jobs: Number of worker processes. Defaults to the number of CPUs.
+    :param force: Render every file, even if unchanged.
+    :param use_system_fonts: Whether to search system for fonts.
+    :return: The jobs, with their timings and any errors.
+    """
+    batch = find_inputs(patterns, output_dir)
+    manifest = load_manifest(output_dir)
+    environment = environment_hash()
+    for job in batch:
+        if job.error is not None:
+            manifest.pop(os.path.relpath(job.output_path, output_dir), None)
+            continue
+        with open(job.input_path, 'rb') as f:
+            job.key = hashlib.sha256(environment.encode() + f.read()).hexdigest()
+        unchanged = manifest.get(os.path.relpath(job.output_path, output_dir)) == job.key
+        job.skipped = not force and unchanged and os.path.exists(job.output_path)
+
+    pending = [job for job in batch if not job.skipped and job.error is None]
+    paths = [(job.input_path, job.output_path) for job in pending]
+    jobs = min(jobs or os.cpu_count() or 1, len(pending))
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                                 initargs=(use_system_fonts,)) as executor:
+            results = list(executor.map(_render_job, paths))
+    elif pending:
+        _init_worker(use_system_fonts)
+        results = [_render_job(job_paths) for job_paths in paths]
+    else:
+        results = []
+
+    for job, (seconds, error) in zip(pending, results):
+        job.seconds, job.error = seconds, error
+        manifest_key = os.path.relpath(job.output_path, output_dir)
+        if error is None:
+            manifest[manifest_key] = job.key
+        else:
+            manifest.pop(manifest_key, None)
+    os.makedirs(output_dir, exist_ok=True)
+    save_manifest(output_dir, manifest)
+    return batch
+
+
+def print_summary(batch: List[BatchJob], seconds: float, slowest: int = 5):
+    rendered = [job for job in batch if not job.skipped and job.error is None]
+    failed = [job for job in batch if job.error is not None]
+    print('{} rendered, {} unchanged, {} failed in {:.2f} s (render time {:.2f} s)'.format(
+        len(rendered), sum(job.skipped for job in batch), len(failed), seconds,
+        sum(job.seconds for job in rendered)))
+    for job in sorted(rendered, key=lambda job: job.seconds, reverse=True)[:slowest]:
+        print('  {:8.2f} s  {}'.format(job.seconds, job.input_path))
+    for job in failed:
+        print('  FAILED {}: {}'.format(job.input_path, job.error))
@@ -0,0 +1,306 @@
+import hashlib
+import logging
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from io import BytesIO
+from typing import BinaryIO, Callable, Dict, List, Optional, Tuple, Union
+
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfgen.canvas import Canvas
+
+from .batch import environment_hash
+from .display_list import DisplayList
+from .font_reader import cache_dir as kassia_cache_dir, find_and_register_fonts
+from .project_organizer import Project
+from .renderer import Renderer
+
+TOC_MARGIN = 72
+TOC_TITLE = 'Contents'
+
+
+class BookFragment:
+    """A score of a book: its BNML, where it goes in the book, and its laid out pages."""
+    def __init__(self, title: str, source: bytes or None):
+        self.title: str = title
+        self.source: bytes or None = source
+        self.first_page_number: int = 1  # Where it starts in the book
+        self.laid_out_as: int = 1  # The first page number it was laid out for, which has the same parity
+        self.display_list: DisplayList or None = None
+        self.seconds: float = 0
+        self.cached: bool = False  # Whether its pages came from the fragment cache
+        self.error: str or None = None
+
+    @property
+    def page_count(self) -> int:
+        return len(self.display_list) if self.display_list is not None else 0
+
+
+class FragmentCache:
+    """Laid out scores from earlier builds of a book, kept as display lists in a directory.
+
+    A score is looked up by a hash of its BNML, the parity of the page it was laid out to start on, and
+    everything else a render depends on (see batch.environment_hash). Page numbers are drawn when the
+    pages are replayed, so a score only has to be laid out again when it changed, or when it moved between
+    starting on an odd and an even page.
+    """
+    def __init__(self, directory: str):
+        self.directory: str = directory
+        self._environment: str = environment_hash()
+
+    def key(self, fragment: BookFragment, laid_out_as: int = None) -> str:
+        laid_out_as = fragment.laid_out_as if laid_out_as is None else laid_out_as
+        digest = hashlib.sha256(self._environment.encode())
+        digest.update(b'odd' if laid_out_as % 2 else b'even')
+        digest.update(fragment.source)
+        return digest.hexdigest()
+
+    def get(self, fragment: BookFragment, either_parity: bool = False) -> Optional[DisplayList]:
+        """Get the fragment's pages, laid out for the parity of fragment.laid_out_as.
+
+        :param either_parity: Whether to fall back to the other parity, and set fragment.laid_out_as to it. Only
+            the parity a score had in the last build is kept, which is the best guess before a book is numbered.
+        """
+        for laid_out_as in [fragment.laid_out_as, fragment.laid_out_as + 1][:2 if either_parity else 1]:
+            try:
+                display_list = DisplayList.load(self._path(self.key(fragment, laid_out_as)))
+            except (OSError, ValueError, KeyError):
+                continue
+            fragment.laid_out_as = laid_out_as
+            return display_list
+        return None
+
+    def put(self, fragment: BookFragment):
+        path = self._path(self.key(fragment))
+        os.makedirs(self.directory, exist_ok=True)
+        with open(path + '.tmp', 'wb') as f:
+            fragment.display_list.save(f)
+        os.replace(path + '.tmp', path)
+
+    def prune(self, fragments: List[BookFragment]):
+        """Delete every fragment but these, as laid out for the book, so the cache only holds the latest book."""
+        keep = {self.key(fragment) + '.npz' for fragment in fragments if fragment.display_list is not None}
+        if not os.path.isdir(self.directory):
+            return
+        for file_name in os.listdir(self.directory):
+            if file_name.endswith('.npz') and file_name not in keep:
+                os.remove(os.path.join(self.directory, file_name))
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + '.npz')
+
+
+def default_cache_dir(output_path: str) -> str:
+    """The fragment cache directory of the book written to output_path, in Kassia's cache directory."""
+    return os.path.join(kassia_cache_dir(), 'books', hashlib.sha256(os.path.abspath(output_path).encode()).hexdigest()[:16])
+
+
+_worker_renderer: Optional[Renderer] = None
+
+
+def _init_worker(use_system_fonts: bool):
+    """Register the fonts once per worker process, before it lays out any score."""
+    global _worker_renderer
+    _worker_renderer = Renderer(use_system_fonts)
+
+
+def _layout_fragment(job: Tuple[bytes, int]) -> Tuple[Optional[DisplayList], float, Optional[str]]:
+    source, first_page_number = job
+    start = time.perf_counter()
+    try:
+        display_list = _worker_renderer.layout(BytesIO(source), first_page_number=first_page_number)
+    except (Exception, SystemExit) as e:  # Kassia exits on XML parse errors
+        return None, time.perf_counter() - start, '{}: {}'.format(type(e).__name__, e)
+    return display_list, time.perf_counter() - start, None
+
+
+def build_book(project: Project, output_file: Union[str, BinaryIO], header: str = '', jobs: int = None,
+               toc: bool = True, toc_font: Tuple[str, float] = ('Helvetica', 12),
+               use_system_fonts: bool = False, cache_dir: str = None) -> List[BookFragment]:
+    """Render every score of a project, and combine them into one PDF, in the project's order.
+
+    Scores are laid out into display lists across a pool of worker processes, each of which registers the
+    fonts once. The pool is only started if there are scores to lay out that aren't cached. The display
+    lists are then replayed onto a single canvas, so the pages are numbered continuously and each font is
+    embedded once for the whole book. Each score gets a bookmark, and an entry in a table of contents on the
+    first pages.
+
+    Even and odd page headers and footers depend on whether a score starts on an even or odd page, which
+    is only known once the scores before it are laid out. Scores are laid out as if they started on an odd
+    page, then those that start on an even page are laid out again, in parallel. Since that only changes
+    headers and footers, page counts stay the same.
+
+    With a cache directory, scores are only laid out if they aren't in the cache from an earlier build
+    (see FragmentCache). Editing one score of a book then lays out that score, and any after it that now
+    start on a page of the other parity, while the whole book is still numbered and written again.
+
+    :param project: The project to build.
+    :param output_file: PDF file (path or file object) to write.
+    :param header: BNML defaults and identification for scores written as txt.
+    :param jobs: Number of worker processes. Defaults to the number of CPUs.
+    :param toc: Whether to start the book with a table of contents.
+    :param toc_font: Registered font name and size of the table of contents.
+    :param use_system_fonts: Whether to search system for fonts.
+    :param cache_dir: Directory to keep laid out scores in between builds of this book. None to not cache them.
+    :return: One fragment per score, with its page numbers and timings, or the error that left it out.
+    """
+    fragments = []
+    for score in project.scores:
+        fragment = BookFragment(score.title or 'Untitled', None)
+        try:
+            fragment.source = score.to_bnml(header)
+        except Exception as e:
+            fragment.error = '{}: {}'.format(type(e).__name__, e)
+        fragments.append(fragment)
+
+    fragment_cache = FragmentCache(cache_dir) if cache_dir is not None else None
+    pending = [fragment for fragment in fragments if fragment.error is None]
+    jobs = jobs or os.cpu_count() or 1
+    with ExitStack() as stack:
+        executor = None
+
+        def map_jobs(function, job_list):
+            # The pool is started, or the fonts registered, only once a score isn't cached
+            nonlocal executor
+            if executor is None and jobs > 1 and len(job_list) > 1:
+                executor = stack.enter_context(ProcessPoolExecutor(
+                    max_workers=min(jobs, len(job_list)), initializer=_init_worker, initargs=(use_system_fonts,)))
+            if executor is not None:
+                return executor.map(function, job_list)
+            if _worker_renderer is None:
+                _init_worker(use_system_fonts)
+            return map(function, job_list)
+        if pending:
+            _layout_book(pending, map_jobs, toc, toc_font[1], fragment_cache)
+    if fragment_cache is not None:
+        fragment_cache.prune(pending)
+
+    for fragment in fragments:
+        if fragment.error is not None:
+            logging.error("Left {} out of the book. {}".format(fragment.title, fragment.error))
+    find_and_register_fonts(use_system_fonts)  # The display lists are replayed here, not in the workers
+    included = [fragment for fragment in fragments if fragment.error is None and fragment.page_count]
+    _write_book(included, output_file, project.metadata, toc, toc_font)
+    return fragments
+
+
+def _layout_book(fragments: List[BookFragment], map_jobs: Callable, toc: bool, toc_font_size: float,
+                 fragment_cache: FragmentCache = None):
+    """Lay out the fragments, and number their pages.
+
+    :param map_jobs: Runs _layout_fragment on a list of jobs, like map or Executor.map.
+    :param fragment_cache: Where to look for fragments laid out before, and keep the new ones. None to not cache.
+    """
+    _layout_fragments(fragments, map_jobs, fragment_cache, first_pass=True)
+    for _ in range(3):  # Only if laying scores out again changed their page counts is more than one pass needed
+        laid_out = [fragment for fragment in fragments if fragment.error is None]
+        page_number = 1 + (_toc_page_count(laid_out, toc_font_size) if toc else 0)
+        for fragment in laid_out:
+            fragment.first_page_number = page_number
+            page_number += fragment.page_count
+        stale = [fragment for fragment in laid_out if (fragment.first_page_number - fragment.laid_out_as) % 2]
+        if not stale:
+            return
+        for fragment in stale:
+            fragment.laid_out_as = fragment.first_page_number
+        _layout_fragments(stale, map_jobs, fragment_cache)
+
+
+def _layout_fragments(fragments: List[BookFragment], map_jobs: Callable, fragment_cache: FragmentCache = None,
+                      first_pass: bool = False):
+    missing = []
+    for fragment in fragments:
+        fragment.display_list = fragment_cache.get(fragment, first_pass) if fragment_cache is not None else None
+        fragment.cached = fragment.display_list is not None
+        if not fragment.cached:
+            missing.append(fragment)
+    if not missing:
+        return
+    results = map_jobs(_layout_fragment, [(fragment.source, fragment.laid_out_as) for fragment in missing])
+    for fragment, (display_list, seconds, error) in zip(missing, results):
+        fragment.display_list, fragment.error = display_list, error
+        fragment.seconds += seconds
+        if fragment_cache is not None and error is None:
+            fragment_cache.put(fragment)
+
+
+def _toc_page_size(fragments: List[BookFragment]) -> Tuple[float, float]:
+    """The size of the first page of the book, which the table of contents is drawn in."""
+    for fragment in fragments:
+        if fragment.page_count:
+            return fragment.display_list.page_sizes[0]
+    return letter
+
+
+def _toc_lines_per_page(page_size: Tuple[float, float], font_size: float) -> int:
+    return max(1, int((page_size[1] - 2 * TOC_MARGIN - 3 * font_size) // (1.5 * font_size)))
+
+
+def _toc_page_count(fragments: List[BookFragment], font_size: float) -> int:
+    entries = sum(1 for fragment in fragments if fragment.page_count)
+    return math.ceil(entries / _toc_lines_per_page(_toc_page_size(fragments), font_size))
+
+
+def _write_book(fragments: List[BookFragment], output_file: Union[str, BinaryIO], metadata: Dict, toc: bool,
+                toc_font: Tuple[str, float]):
+    page_size = _toc_page_size(fragments)
+    canvas = Canvas(output_file, pagesize=page_size)
+    if metadata.get('title'):
+        canvas.setTitle(metadata['title'])
+    if metadata.get('author'):
+        canvas.setAuthor(metadata['author'])
+
+    if toc and fragments:
+        _draw_toc(canvas, fragments, page_size, toc_font)
+    for index, fragment in enumerate(fragments):
+        key = 'score{}'.format(index)
+        canvas.bookmarkPage(key)
+        canvas.addOutlineEntry(fragment.title, key, level=0)
+        fragment.display_list.replay(canvas)
+    canvas.showOutline()
+    canvas.save()
+
+
+def _draw_toc(canvas: Canvas, fragments: List[BookFragment], page_size: Tuple[float, float],
+              toc_font: Tuple[str, float]):
+    """Draw the table of contents: a title, then a line per score with its first page number, joined by dot
+    leaders. Each line links to the score."""
+    font_name, font_size = toc_font
+    width, height = page_size
+    leading = 1.5 * font_size
+    lines_per_page = _toc_lines_per_page(page_size, font_size)
+    dot_width = pdfmetrics.stringWidth('.', font_name, font_size)
+    for page_start in range(0, len(fragments), lines_per_page):
+        canvas.setPageSize(page_size)
+        y = height - TOC_MARGIN - 2 * font_size
+        if page_start == 0:
+            canvas.setFont(font_name, 2 * font_size)
+            canvas.drawString(TOC_MARGIN, y, TOC_TITLE)
+        y -= font_size
+        canvas.setFont(font_name, font_size)
+        for index in range(page_start, min(page_start + lines_per_page, len(fragments))):
+            fragment = fragments[index]
+            y -= leading
+            number = str(fragment.first_page_number)
+            title_end = TOC_MARGIN + pdfmetrics.stringWidth(fragment.title, font_name, font_size) + dot_width
+            number_start = width - TOC_MARGIN - pdfmetrics.stringWidth(number, font_name, font_size) - dot_width
+            canvas.drawString(TOC_MARGIN, y, fragment.title)
+            canvas.drawRightString(width - TOC_MARGIN, y, number)
+            if number_start > title_end:
+                canvas.drawRightString(number_start, y, '.' * int((number_start - title_end) // dot_width))
+            canvas.linkRect('', 'score{}'.format(index),
+                            (TOC_MARGIN, y - 0.3 * font_size, width - TOC_MARGIN, y + font_size))
+        canvas.showPage()
+
+
+def print_summary(fragments: List[BookFragment], seconds: float):
+    included = [fragment for fragment in fragments if fragment.error is None]
+    print('{} scores ({} unchanged), {} pages in {:.2f} s (layout time {:.2f} s)'.format(
+        len(included), sum(1 for fragment in included if fragment.cached),
+        sum(fragment.page_count for fragment in included), seconds, sum(fragment.seconds for fragment in fragments)))
+    for fragment in fragments:
+        if fragment.error is not None:
+            print('  FAILED {}: {}'.format(fragment.title, fragment.error))
@@ -1,6 +1,8 @@
-import sys
-from typing import Dict
+import logging
+from numbers import Real
+from typing import Dict, Tuple, Union
 
+from reportlab.lib import pagesizes
 from reportlab.pdfgen import canvas
 from reportlab.platypus import BaseDocTemplate, Frame, PageTemplate
 from reportlab.platypus.doctemplate import _doNothing
@@ -14,6 +16,7 @@ class ComplexDocTemplate(BaseDocTemplate):
 
     def __init__(self, *args, **kwargs):
         BaseDocTemplate.__init__(self, *args, **kwargs)
+        self.first_page_number: int = 1  # Number of the first page, for documents that are part of a book
 
     def build(self, flowables, onFirstPage=_doNothing, onEvenPages=_doNothing, onOddPages=_doNothing, canvasmaker=canvas.Canvas):
         self._calc()  # In case we changed margins sizes etc. Copied from SampleDocTemplate
@@ -38,8 +41,13 @@ class ComplexDocTemplate(BaseDocTemplate):
 
         BaseDocTemplate.build(self, flowables, canvasmaker=canvasmaker)
 
+    def _makeCanvas(self, filename=None, canvasmaker=canvas.Canvas):
+        canv = BaseDocTemplate._makeCanvas(self, filename=filename, canvasmaker=canvasmaker)
+        canv._pageNumber = self.first_page_number
+        return canv
+
     def handle_pageBegin(self):
-        curr_page_number = self.page
+        curr_page_number = self.page + self.first_page_number - 1
         self._handle_pageBegin()
 
         if curr_page_number % 2 == 0:
@@ -48,13 +56,30 @@ class ComplexDocTemplate(BaseDocTemplate):
             self._handle_nextPageTemplate('Odd')
 
     def set_pagesize_by_name(self, name: str):
-        """Sets a ReportLab page size with the passed name.
+        """Sets a ReportLab page size with the passed name. An unknown name leaves the page size as it is.
         :param name: The name of the page size.
         """
         try:
-            self.pagesize = getattr(sys.modules[__name__], name)
-        except AttributeError:
-            pass
+            self.set_pagesize(name)
+        except ValueError as e:
+            logging.warning("{} Keeping the page size {}.".format(e, self.pagesize))
+
+    def set_pagesize(self, pagesize: Union[str, Tuple[float, float]]):
+        """Sets the page size from a name in reportlab.lib.pagesizes (e.g. 'letter', 'A4'), or a (width, height) tuple.
+        :param pagesize: The page size name or dimensions.
+        :raises ValueError: If the name isn't a page size, or the dimensions aren't two numbers.
+        """
+        if isinstance(pagesize, str):
+            name = pagesize
+            pagesize = getattr(pagesizes, name, None)
+            if not _is_page_size(pagesize):
+                pagesize = getattr(pagesizes, name.upper(), None)
+            if not _is_page_size(pagesize):
+                raise ValueError("Unknown paper size: {}".format(name))
+        elif not _is_page_size(pagesize):
+            raise ValueError("Paper size must be a (width, height) tuple: {!r}".format(pagesize))
+        self.pagesize = tuple(pagesize)
+        self._calc()
 
     def set_margins(self, margins: Dict[str, int] = None):
         """Sets the page margins.
@@ -120,3 +145,10 @@ class ComplexDocTemplate(BaseDocTemplate):
         :return: Position at the center of the page.
         """
         return self.pagesize[0] / 2
+
+
+def _is_page_size(pagesize) -> bool:
+    """Whether pagesize is a (width, height) pair of numbers."""
+    if not isinstance(pagesize, (tuple, list)) or len(pagesize) != 2:
+        return False
+    return all(isinstance(side, Real) and not isinstance(side, bool) for side in pagesize)
@@ -0,0 +1,272 @@
+import hashlib
+from typing import BinaryIO, Dict, List, Tuple, Union
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+from reportlab.lib import colors
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfgen.canvas import Canvas
+
+from .pdf_writer import PdfWriter
+
+# Op codes
+GLYPHS = 0  # A run of glyphs. x0, y0 is the start of the baseline, x1 is where the run ends.
+LINE = 1  # A stroked line from x0, y0 to x1, y1.
+RECT = 2  # A rectangle with corners x0, y0 and x1, y1. Rounded if radius is set.
+
+# Flags
+FILL = 1
+STROKE = 2
+PAGE_NUMBER = 4  # A glyph run that is the page number. It is replaced by the number of the page it is replayed on.
+ALIGN_RIGHT = 8  # A page number whose right end, rather than its start, stays where it is when it is replaced
+ALIGN_CENTER = 16  # A page number whose middle stays where it is when it is replaced
+
+OP_DTYPE = np.dtype([
+    ('op', 'u1'),
+    ('flags', 'u1'),
+    ('font', 'i2'),  # Index into DisplayList.fonts, or -1
+    ('fill', 'i2'),  # Index into DisplayList.colors, or -1
+    ('stroke', 'i2'),  # Index into DisplayList.colors, or -1
+    ('text', 'i4'),  # Index into DisplayList.strings, or -1
+    ('x0', 'f8'),
+    ('y0', 'f8'),
+    ('x1', 'f8'),
+    ('y1', 'f8'),
+    ('line_width', 'f4'),
+    ('radius', 'f4'),
+    ('word_space', 'f4'),
+])
+
+# Fields that don't refer to one of the lookup tables
+_VALUE_FIELDS = ('op', 'flags', 'x0', 'y0', 'x1', 'y1', 'line_width', 'radius', 'word_space')
+
+
+class DisplayList:
+    """The drawing operations of a laid out document, one flat array of ops per page.
+
+    Fonts, colors and strings are stored once in lookup tables and referred to by index, so a page is a
+    plain NumPy structured array (see OP_DTYPE) that can be cached, compared and replayed without laying
+    out the document again. Coordinates are absolute page coordinates, in points from the bottom left.
+    """
+    def __init__(self):
+        self.pages: List[np.ndarray] = []
+        self.page_sizes: List[Tuple[float, float]] = []
+        self.fonts: List[Tuple[str, float]] = []  # (font name, font size)
+        self.colors: List[Tuple[float, float, float, float]] = []  # (red, green, blue, alpha)
+        self.strings: List[str] = []
+        self._font_ids: Dict[Tuple[str, float], int] = {}
+        self._color_ids: Dict[Tuple[float, float, float, float], int] = {}
+        self._string_ids: Dict[str, int] = {}
+
+    def __len__(self):
+        return len(self.pages)
+
+    def font_id(self, font_name: str, font_size: float) -> int:
+        key = (font_name, float(font_size))
+        if key not in self._font_ids:
+            self._font_ids[key] = len(self.fonts)
+            self.fonts.append(key)
+        return self._font_ids[key]
+
+    def color_id(self, color) -> int:
+        if color is None:
+            return -1
+        key = _to_rgba(color)
+        if key not in self._color_ids:
+            self._color_ids[key] = len(self.colors)
+            self.colors.append(key)
+        return self._color_ids[key]
+
+    def string_id(self, text: str) -> int:
+        if text not in self._string_ids:
+            self._string_ids[text] = len(self.strings)
+            self.strings.append(text)
+        return self._string_ids[text]
+
+    def add_page(self, page_size: Tuple[float, float], ops: List[tuple]):
+        """Add a page.
+        :param page_size: Width and height of the page.
+        :param ops: Op records, as tuples in the field order of OP_DTYPE.
+        """
+        self.page_sizes.append((float(page_size[0]), float(page_size[1])))
+        self.pages.append(np.array(ops, dtype=OP_DTYPE))
+
+    def page_digest(self, page_index: int) -> str:
+        """Hash the contents of a page. Pages that draw the same thing have the same digest, even if they
+        come from different display lists. Coordinates are compared to a thousandth of a point, so rounding
+        differences from replaying a page don't count as changes.
+        """
+        page = self.pages[page_index]
+        digest = hashlib.sha1(repr(self.page_sizes[page_index]).encode())
+        for field in _VALUE_FIELDS:
+            values = page[field]
+            if values.dtype.kind == 'f':
+                values = np.round(values, 3) + 0.  # Adding 0 turns -0.0 into 0.0
+            digest.update(values.tobytes())
+        digest.update(repr([self.fonts[i] if i >= 0 else None for i in page['font']]).encode())
+        digest.update(repr([self.colors[i] if i >= 0 else None for i in page['fill']]).encode())
+        digest.update(repr([self.colors[i] if i >= 0 else None for i in page['stroke']]).encode())
+        digest.update('\0'.join(self.strings[i] if i >= 0 else '' for i in page['text']).encode())
+        return digest.hexdigest()
+
+    def diff(self, other: 'DisplayList') -> List[int]:
+        """Get the indices of pages that differ from another display list, including pages only one of them has.
+        """
+        changed = [i for i in range(min(len(self), len(other))) if self.page_digest(i) != other.page_digest(i)]
+        changed.extend(range(min(len(self), len(other)), max(len(self), len(other))))
+        return changed
+
+    def replay(self, canvas: Canvas):
+        """Draw every page onto a canvas, finishing each with showPage. Page numbers are those of the canvas,
+        so display lists replayed one after another onto the same canvas are numbered continuously.
+        """
+        for page_size, page in zip(self.page_sizes, self.pages):
+            canvas.setPageSize(page_size)
+            self._replay_page(canvas, page)
+            canvas.showPage()
+
+    def _replay_page(self, canvas: Canvas, page: np.ndarray):
+        writer = PdfWriter(canvas)
+        color_objs = [colors.Color(*rgba) for rgba in self.colors]
+        in_text = False
+        for op in page.tolist():
+            kind, flags, font, fill, stroke, text, x0, y0, x1, y1, line_width, radius, word_space = op
+            if kind == GLYPHS:
+                if not in_text:
+                    writer.begin_text()
+                    in_text = True
+                string = self.strings[text]
+                if flags & PAGE_NUMBER:
+                    string = str(canvas.getPageNumber())
+                    width = pdfmetrics.stringWidth(string, *self.fonts[font])
+                    if flags & ALIGN_RIGHT:
+                        x0 = x1 - width
+                    elif flags & ALIGN_CENTER:
+                        x0 = (x0 + x1 - width) / 2
+                    x1 = x0 + width
+                writer.draw_string(x0, y0, string, *self.fonts[font], color_objs[fill], x1 - x0, word_space)
+                continue
+            if in_text:
+                writer.end_text()
+                in_text = False
+            if kind == LINE:
+                writer.draw_line(x0, y0, x1, y1, color_objs[stroke], line_width)
+            elif kind == RECT:
+                writer.draw_rect(x0, y0, x1 - x0, y1 - y0,
+                                 color_objs[fill] if flags & FILL else None,
+                                 color_objs[stroke] if flags & STROKE else None,
+                                 line_width if flags & STROKE else None,
+                                 radius)
+        if in_text:
+            writer.end_text()
+
+    def write_pdf(self, output_file: Union[str, BinaryIO]):
+        """Write the display list as a PDF.
+        :param output_file: PDF file (path or file object) to write.
+        """
+        canvas = Canvas(output_file, pagesize=self.page_sizes[0] if self.page_sizes else None)
+        self.replay(canvas)
+        canvas.save()
+
+    def render_image(self, page_index: int, scale: float = 1.0) -> Image.Image:
+        """Rasterize a page for previewing. Glyphs are drawn with the TrueType file the font was registered
+        from, so the result is close to, but not exactly, what a PDF viewer shows.
+
+        :param page_index: The page to draw.
+        :param scale: Pixels per point.
+        :return: An RGB image of the page.
+        """
+        page_width, page_height = self.page_sizes[page_index]
+        image = Image.new('RGB', (round(page_width * scale), round(page_height * scale)), 'white')
+        draw = ImageDraw.Draw(image)
+        image_fonts = {}
+        fill_rgb = [tuple(round(c * 255) for c in rgba[:3]) for rgba in self.colors]
+
+        def to_px(x, y):
+            return x * scale, (page_height - y) * scale
+
+        for op in self.pages[page_index].tolist():
+            kind, flags, font, fill, stroke, text, x0, y0, x1, y1, line_width, radius, word_space = op
+            if kind == GLYPHS:
+                if font not in image_fonts:
+                    image_fonts[font] = _image_font(*self.fonts[font], scale)
+                if word_space:
+                    font_name, font_size = self.fonts[font]
+                    space_width = pdfmetrics.stringWidth(' ', font_name, font_size) + word_space
+                    for word in self.strings[text].split(' '):
+                        draw.text(to_px(x0, y0), word, font=image_fonts[font], fill=fill_rgb[fill], anchor='ls')
+                        x0 += pdfmetrics.stringWidth(word, font_name, font_size) + space_width
+                else:
+                    draw.text(to_px(x0, y0), self.strings[text], font=image_fonts[font], fill=fill_rgb[fill],
+                              anchor='ls')
+            elif kind == LINE:
+                draw.line([to_px(x0, y0), to_px(x1, y1)], fill=fill_rgb[stroke],
+                          width=max(1, round(line_width * scale)))
+            elif kind == RECT:
+                left, top = to_px(min(x0, x1), max(y0, y1))
+                right, bottom = to_px(max(x0, x1), min(y0, y1))
+                draw.rounded_rectangle([left, top, right, bottom], radius=radius * scale,
+                                       fill=fill_rgb[fill] if flags & FILL else None,
+                                       outline=fill_rgb[stroke] if flags & STROKE else None,
+                                       width=max(1, round(line_width * scale)))
+        return image
+
+    def save(self, file: Union[str, BinaryIO]):
+        """Save the display list in NumPy's .npz format.
+        """
+        strings = ''.join(self.strings)
+        string_ends = np.cumsum([len(s) for s in self.strings], dtype=np.int64)
+        np.savez_compressed(file,
+                            ops=np.concatenate(self.pages) if self.pages else np.zeros(0, OP_DTYPE),
+                            page_ends=np.cumsum([len(page) for page in self.pages], dtype=np.int64),
+                            page_sizes=np.array(self.page_sizes, dtype=np.float64).reshape(-1, 2),
+                            font_names=np.array([name for name, _ in self.fonts], dtype=str),
+                            font_sizes=np.array([size for _, size in self.fonts], dtype=np.float64),
+                            colors=np.array(self.colors, dtype=np.float64).reshape(-1, 4),
+                            strings=np.array(strings),
+                            string_ends=string_ends)
+
+    @classmethod
+    def load(cls, file: Union[str, BinaryIO]) -> 'DisplayList':
+        """Load a display list written by save.
+        """
+        display_list = cls()
+        with np.load(file) as data:
+            page_starts = np.concatenate(([0], data['page_ends'][:-1])).astype(np.int64)
+            ops = data['ops']
+            display_list.pages = [ops[start:end] for start, end in zip(page_starts, data['page_ends'])]
+            display_list.page_sizes = [tuple(size) for size in data['page_sizes'].tolist()]
+            for name, size in zip(data['font_names'].tolist(), data['font_sizes'].tolist()):
+                display_list.font_id(name, size)
+            for rgba in data['colors'].tolist():
+                display_list._color_ids[tuple(rgba)] = len(display_list.colors)
+                display_list.colors.append(tuple(rgba))
+            strings = str(data['strings'])
+            start = 0
+            for end in data['string_ends'].tolist():
+                display_list.string_id(strings[start:end])
+                start = end
+        return display_list
+
+
+def _to_rgba(color) -> Tuple[float, float, float, float]:
+    """Convert a ReportLab color, color name, or RGB/CMYK tuple to RGBA. CMYK colors are converted to RGB.
+    """
+    if isinstance(color, str):
+        color = colors.toColor(color)
+    if isinstance(color, colors.Color):
+        alpha = color.alpha if color.alpha is not None else 1.
+        return float(color.red), float(color.green), float(color.blue), float(alpha)
+    if len(color) == 4:
+        return (*(float(c) for c in colors.cmyk2rgb(color)), 1.)
+    return float(color[0]), float(color[1]), float(color[2]), 1.
+
+
+def _image_font(font_name: str, font_size: float, scale: float) -> ImageFont.ImageFont:
+    """Load a font for rasterizing, falling back to Pillow's default font for non-TrueType fonts.
+    """
+    face = getattr(pdfmetrics.getFont(font_name), 'face', None)
+    filename = getattr(face, 'filename', None)
+    if filename and str(filename).lower().endswith(('.ttf', '.otf')):
+        return ImageFont.truetype(filename, max(1, round(font_size * scale)))
+    return ImageFont.load_default(font_size * scale)
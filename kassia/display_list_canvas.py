@@ -0,0 +1,178 @@
+from typing import Dict, List
+
+from reportlab.lib.enums import TA_CENTER, TA_RIGHT
+from reportlab.pdfgen.canvas import Canvas
+from reportlab.pdfgen.textobject import PDFTextObject
+
+from .display_list import ALIGN_CENTER, ALIGN_RIGHT, FILL, GLYPHS, LINE, PAGE_NUMBER, RECT, STROKE, DisplayList
+from .text_metrics import drawn_width
+
+
+class DisplayListCanvas(Canvas):
+    """A canvas that records glyph runs, lines and rectangles into a DisplayList instead of writing a PDF.
+
+    It can be passed as the canvasmaker to ComplexDocTemplate.build. Coordinates are converted to page
+    coordinates with the current transformation matrix, which is expected to be a translation (that is all
+    Kassia's flowables use). Forms are flattened: their ops are copied into the page wherever they are placed.
+    Other drawing operations, such as images, are not recorded.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.display_list: DisplayList = DisplayList()
+        self._ops: List[tuple] = []
+        self._forms: Dict[str, List[tuple]] = {}
+        self._form_stack: List[tuple] = []  # (form name, ops of the enclosing page or form)
+
+    def beginForm(self, name, lowerx=0, lowery=0, upperx=None, uppery=None):
+        self._form_stack.append((name, self._ops))
+        self._ops = []
+        self.push_state_stack()
+        self.init_graphics_state()
+
+    def endForm(self, **extra_attributes):
+        name, ops = self._form_stack.pop()
+        self._forms[name] = self._ops
+        self._ops = ops
+        self.pop_state_stack()
+
+    def hasForm(self, name):
+        return name in self._forms
+
+    def doForm(self, name):
+        for op in self._forms[name]:
+            x0, y0 = self._page_coord(op[6], op[7])
+            x1, y1 = self._page_coord(op[8], op[9])
+            self._ops.append(op[:6] + (x0, y0, x1, y1) + op[10:])
+
+    def beginText(self, x=0, y=0, direction=None):
+        return _RecordingTextObject(self, x, y, direction=direction)
+
+    def drawText(self, aTextObject):
+        if not isinstance(aTextObject, _RecordingTextObject):
+            return super().drawText(aTextObject)
+
+        display_list = self.display_list
+        for x, y, end_x, text, font_name, font_size, color, word_space in aTextObject.glyph_runs:
+            x0, y0 = self._page_coord(x, y)
+            x1, _ = self._page_coord(end_x, y)
+            self._ops.append((GLYPHS, FILL, display_list.font_id(font_name, font_size),
+                              display_list.color_id(color if color is not None else self._fillColorObj), -1,
+                              display_list.string_id(text), x0, y0, x1, y0, 0, 0, word_space))
+        # As in a PDF, a fill color set inside the text object stays in effect afterwards
+        if aTextObject.fill_color is not None:
+            self._fillColorObj = aTextObject.fill_color
+
+    def draw_page_number(self, x, y, alignment):
+        """Draw the page number like drawString, drawRightString or drawCentredString would, for an alignment of
+        TA_LEFT, TA_RIGHT or TA_CENTER. It is recorded as a page number, which is numbered again on replay.
+        """
+        text = str(self.getPageNumber())
+        width = self.stringWidth(text, self._fontname, self._fontsize)
+        start = {TA_RIGHT: x - width, TA_CENTER: x - width / 2}.get(alignment, x)
+        flags = FILL | PAGE_NUMBER | {TA_RIGHT: ALIGN_RIGHT, TA_CENTER: ALIGN_CENTER}.get(alignment, 0)
+        x0, y0 = self._page_coord(start, y)
+        x1, _ = self._page_coord(start + width, y)
+        display_list = self.display_list
+        self._ops.append((GLYPHS, flags, display_list.font_id(self._fontname, self._fontsize),
+                          display_list.color_id(self._fillColorObj), -1, display_list.string_id(text),
+                          x0, y0, x1, y0, 0, 0, 0))
+
+    def line(self, x1, y1, x2, y2):
+        x1, y1 = self._page_coord(x1, y1)
+        x2, y2 = self._page_coord(x2, y2)
+        self._ops.append((LINE, STROKE, -1, -1, self.display_list.color_id(self._strokeColorObj), -1,
+                          x1, y1, x2, y2, self._lineWidth, 0, 0))
+
+    def lines(self, linelist):
+        for x1, y1, x2, y2 in linelist:
+            self.line(x1, y1, x2, y2)
+
+    def rect(self, x, y, width, height, stroke=1, fill=0):
+        self._record_rect(x, y, width, height, 0, stroke, fill)
+
+    def roundRect(self, x, y, width, height, radius, stroke=1, fill=0):
+        self._record_rect(x, y, width, height, radius, stroke, fill)
+
+    def showPage(self):
+        """Finish the current page. Nothing is written, only the page counter and graphics state are reset.
+        """
+        self.display_list.add_page(self._pagesize, self._ops)
+        self._ops = []
+        if self._onPage:
+            self._onPage(self._pageNumber)
+        self._startPage()
+
+    def save(self):
+        if self._ops or len(self._code):
+            self.showPage()
+
+    def _record_rect(self, x, y, width, height, radius, stroke, fill):
+        x0, y0 = self._page_coord(x, y)
+        x1, y1 = self._page_coord(x + width, y + height)
+        display_list = self.display_list
+        self._ops.append((RECT, (FILL if fill else 0) | (STROKE if stroke else 0), -1,
+                          display_list.color_id(self._fillColorObj) if fill else -1,
+                          display_list.color_id(self._strokeColorObj) if stroke else -1, -1,
+                          x0, y0, x1, y1, self._lineWidth if stroke else 0, radius, 0))
+
+    def _page_coord(self, x, y):
+        a, b, c, d, e, f = self._currentMatrix
+        return a * x + c * y + e, b * x + d * y + f
+
+
+class _RecordingTextObject(PDFTextObject):
+    """A text object that keeps the glyph runs it is given, instead of writing them as PDF operators.
+
+    The text line matrix is followed the way a PDF viewer would: _textOut and textOut advance the current
+    point, by the widths the glyphs are drawn with (see text_metrics.drawn_width), while T* (textLine, or
+    _textOut with TStar) starts a new line one leading below the line start.
+    """
+    def __init__(self, canvas, x=0, y=0, direction=None):
+        self.glyph_runs: List[tuple] = []  # (x, y, end x, text, font name, font size, color, word space)
+        self.fill_color = None  # None until set in this text object, then the canvas fill color is used
+        self._pen_x: float = x
+        self._text_rise: float = 0
+        super().__init__(canvas, x, y, direction)
+
+    def setTextOrigin(self, x, y):
+        super().setTextOrigin(x, y)
+        self._pen_x = x
+
+    def moveCursor(self, dx, dy):
+        super().moveCursor(dx, dy)
+        self._pen_x = self._x0
+
+    def setFillColor(self, aColor, alpha=None):
+        super().setFillColor(aColor, alpha)
+        self.fill_color = self._fillColorObj
+
+    def setRise(self, rise):
+        super().setRise(rise)
+        self._text_rise = rise
+
+    def _textOut(self, text, TStar=0):
+        self._record(text)
+        if TStar:
+            self._next_line()
+
+    def textOut(self, text):
+        self._record(text)
+
+    def textLine(self, text=''):
+        self._record(text)
+        self._next_line()
+
+    def _record(self, text):
+        if not text:
+            return
+        word_space = getattr(self, '_wordSpace', 0)
+        width = drawn_width(text, self._fontname, self._fontsize)
+        width += word_space * (text.count(' ') + text.count('\xa0')) + getattr(self, '_charSpace', 0) * len(text)
+        self.glyph_runs.append((self._pen_x, self._y0 + self._text_rise, self._pen_x + width, text,
+                                self._fontname, self._fontsize, self.fill_color, word_space))
+        self._pen_x += width
+
+    def _next_line(self):
+        self._y0 -= self._leading
+        self._x, self._y = self._x0, self._y0
+        self._pen_x = self._x0
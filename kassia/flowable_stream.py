@@ -0,0 +1,45 @@
+from typing import Iterable, Iterator
+
+from reportlab.platypus import Flowable
+
+
+class FlowableStream(list):
+    """A story for BaseDocTemplate.build that pulls flowables from an iterator as layout reaches them.
+
+    Platypus treats the story as a list: it looks at and deletes the front item, puts split parts back at
+    the front, and looks a few items ahead for keepWithNext. The list holds only that window, topped up
+    from the iterator whenever its length or an item past its end is asked for, so a long document is
+    never held in memory as a whole.
+    """
+    def __init__(self, flowables: Iterable[Flowable], lookahead: int = 8):
+        """
+        :param flowables: The flowables of the story, in order.
+        :param lookahead: How many flowables to keep ready, which is as far as keepWithNext can look.
+        """
+        super().__init__()
+        self._source: Iterator[Flowable] or None = iter(flowables)
+        self.lookahead: int = lookahead
+
+    def __len__(self):
+        self._fill(self.lookahead)
+        return super().__len__()
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def __getitem__(self, index):
+        if isinstance(index, int) and index >= 0:
+            self._fill(index + 1)
+        elif self._source is not None:
+            # Slices and negative indices need the rest of the story
+            self._fill(None)
+        return super().__getitem__(index)
+
+    def _fill(self, count: int or None):
+        """Pull flowables until the list holds count of them, or all of them if count is None.
+        """
+        while self._source is not None and (count is None or super().__len__() < count):
+            try:
+                self.append(next(self._source))
+            except StopIteration:
+                self._source = None
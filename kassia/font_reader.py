@@ -1,17 +1,27 @@
 #!/usr/bin/python
+import hashlib
+import json
 import logging
+import mmap
 import os
+import threading
+from fnmatch import fnmatch
 from pathlib import Path
-from typing import Dict
+from types import MappingProxyType
+from weakref import WeakKeyDictionary
+from typing import Any, Dict, List, Mapping
 
-from reportlab import rl_settings
+import reportlab
+from reportlab import rl_config, rl_settings
 from reportlab.lib import fontfinder
 from reportlab.lib.fonts import addMapping
 from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFError, TTFont
-from ruyaml import YAML, YAMLError
+from reportlab.pdfbase import ttfonts
+from reportlab.pdfbase.ttfonts import TTEncoding, TTFError, TTFont, TTFontFace, TTFontFile
 from schema import And, Optional, Schema, SchemaError
 
+from .trace import NullTracer, Tracer
+
 font_classes_schema = Schema({
     'family_name': str,
     'takes_lyric': [str],
@@ -38,91 +48,283 @@ font_glyphnames_schema = Schema({
 })
 
 
-def _get_neume_dict(font_folder_path: str) -> Dict:
+def _get_neume_dict(font_folder_path: str, snapshot: '_Snapshot' = None) -> Dict:
     """Search folder path for font configs, load them, and return in Dict.
 
     :param font_folder_path: Path to font.
+    :param snapshot: Startup snapshot to take unchanged configs from. Read from disk if None.
     :return: Dictionary representation of yaml config file.
     """
+    snapshot = snapshot if snapshot is not None else _Snapshot.read()
     font_config_dict = {}
     for glyphname_path in Path(font_folder_path).rglob('glyphnames.yaml'):
         folder = glyphname_path.parent.name
         classes_path = Path.joinpath(glyphname_path.parent, 'classes.yaml')
-        font_config = {'glyphnames': _load_font_config(str(glyphname_path), font_glyphnames_schema),
-                       'classes': _load_font_config(str(classes_path), font_classes_schema)}
+        font_config = {'glyphnames': _load_font_config(str(glyphname_path), font_glyphnames_schema, snapshot),
+                       'classes': _load_font_config(str(classes_path), font_classes_schema, snapshot)}
         font_config_dict[folder] = font_config
+    snapshot.write()
     return font_config_dict
 
 
-def _load_font_config(filepath: str, validator: Schema) -> Dict:
+def _load_font_config(filepath: str, validator: Schema, snapshot: '_Snapshot' = None) -> Dict:
     """Read, load, and validate a font configuration (in YAML), and return it as a Dict.
 
+    If the snapshot has the config of a file with the same content, it is taken from there, without
+    parsing the YAML again.
+
     :param filepath: Path of font config file.
     :param validator: Schema to validate against.
+    :param snapshot: Startup snapshot to look the config up in, and to add it to.
     :return: Font configuration as a dictionary.
     """
-    font_config = None
-    with open(filepath, 'r') as fp:
-        try:
-            yaml = YAML(typ='safe', pure=True)
-            font_config = yaml.load(fp)
-            validator.validate(font_config)
-        except (IOError, YAMLError, SchemaError) as exc:
-            logging.error("Failed to read {} font configuration. {}".format(filepath, exc))
-            font_config = None
-        except Exception as exc:
-            raise exc
+    try:
+        with open(filepath, 'rb') as fp:
+            content = fp.read()
+    except IOError as exc:
+        logging.error("Failed to read {} font configuration. {}".format(filepath, exc))
+        return None
+    content_hash = hashlib.sha256(content).hexdigest()
+    cached = snapshot.configs.get(filepath) if snapshot is not None else None
+    if cached is not None and cached['sha256'] == content_hash:
+        return cached['config']
+
+    # Imported here, since the YAML parser is only needed when a config isn't in the snapshot
+    from ruyaml import YAML, YAMLError
+    try:
+        yaml = YAML(typ='safe', pure=True)
+        font_config = yaml.load(content)
+        validator.validate(font_config)
+    except (YAMLError, SchemaError) as exc:
+        logging.error("Failed to read {} font configuration. {}".format(filepath, exc))
+        return None
+    if snapshot is not None:
+        snapshot.configs[filepath] = {'sha256': content_hash, 'config': font_config}
+        snapshot.changed = True
     return font_config
 
 
-def find_and_register_fonts(check_sys_fonts: bool = False) -> Dict:
+LOCAL_FONT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fonts/')
+
+SNAPSHOT_VERSION = 2
+
+# The style name of each (bold, italic) face of a font family
+FAMILY_STYLE_NAMES = {(False, False): b'Regular', (False, True): b'Italic',
+                      (True, False): b'Bold', (True, True): b'Bold Italic'}
+
+
+def cache_dir() -> str:
+    """Where Kassia keeps its caches: $KASSIA_CACHE_DIR, or kassia in the user's cache directory."""
+    directory = os.environ.get('KASSIA_CACHE_DIR')
+    if not directory:
+        directory = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), 'kassia')
+    return directory
+
+
+def snapshot_path() -> str:
+    return os.path.join(cache_dir(), 'startup-snapshot.json')
+
+
+class _Snapshot:
+    """What font discovery and config loading found, kept on disk for the next process to start from.
+
+    Finding the fonts means parsing every font file for its family and style, and the configs are YAML
+    read by a pure Python parser. Together they take most of the time to start, and their results only
+    change when the files do. Fonts are looked up by path, size and modification time, configs by path
+    and content hash. Anything that doesn't match is parsed again and the snapshot rewritten.
+    """
+    def __init__(self, fonts: Dict[str, Dict] = None, configs: Dict[str, Dict] = None):
+        self.fonts: Dict[str, Dict] = fonts if fonts is not None else {}
+        self.configs: Dict[str, Dict] = configs if configs is not None else {}
+        self.changed: bool = False
+
+    @classmethod
+    def read(cls) -> '_Snapshot':
+        try:
+            with open(snapshot_path()) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            return cls()
+        if snapshot.get('version') != SNAPSHOT_VERSION or snapshot.get('reportlab') != reportlab.Version:
+            return cls()
+        return cls(snapshot['fonts'], snapshot['configs'])
+
+    def write(self):
+        """Save the snapshot, if anything was added to it. Failing to is only logged, since it is a cache."""
+        if not self.changed:
+            return
+        path = snapshot_path()
+        temp_path = '{}.{}.tmp'.format(path, os.getpid())
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(temp_path, 'w') as f:
+                json.dump({'version': SNAPSHOT_VERSION, 'reportlab': reportlab.Version,
+                           'fonts': self.fonts, 'configs': self.configs}, f)
+            os.replace(temp_path, path)
+            self.changed = False
+        except OSError as e:
+            logging.warning("Failed to save startup snapshot {}. {}".format(path, e))
+
+
+# ReportLab's font registries are global to the process. They are only written to by the first call of
+# find_and_register_fonts (for each value of check_sys_fonts), under this lock, and only read after that.
+_registration_lock = threading.Lock()
+_font_configs: Dict[bool, Mapping] = {}
+
+
+def find_and_register_fonts(check_sys_fonts: bool = False, tracer: Tracer = None) -> Mapping:
     """Search for fonts and register them.
 
     If check_sys_fonts is false, function will only use fonts in local
     /fonts folder.
 
+    Fonts are only searched for and registered the first time this is called in a process. Later calls
+    return the same configuration without taking a lock, so they are cheap and safe from any thread. Since
+    other threads may be rendering by then, a later call can't register more fonts: asking for a different
+    check_sys_fonts than the first call raises RuntimeError.
+
     :param check_sys_fonts: Whether to search system for fonts.
-    :return: Font configuration as a dictionary.
+    :param tracer: Records how long each step of the first call takes.
+    :return: Font configuration, read-only (mappings and tuples).
     """
-    ff = fontfinder.FontFinder(useCache=False)
+    font_config = _font_configs.get(check_sys_fonts)
+    if font_config is not None:
+        return font_config
+    with _registration_lock:
+        if _font_configs and check_sys_fonts not in _font_configs:
+            raise RuntimeError("Fonts were already registered with check_sys_fonts={}, so can't be registered "
+                               "again with check_sys_fonts={}".format(not check_sys_fonts, check_sys_fonts))
+        if check_sys_fonts not in _font_configs:
+            font_config = _search_and_register_fonts(check_sys_fonts, tracer or NullTracer())
+            _font_configs[check_sys_fonts] = _freeze(font_config)
+        return _font_configs[check_sys_fonts]
 
-    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    local_font_dir = os.path.join(str(base_dir), 'kassia/fonts/')
-    logging.info("Searching {} path for local fonts...".format(local_font_dir))
-    
-    ff.addDirectory(local_font_dir, recur=True)
 
+def reload_font_configs(check_sys_fonts: bool = False) -> Mapping:
+    """Load the font configs (the YAML files) again, after they were edited. The registered fonts stay as they are.
+
+    Renders already running keep the configuration they started with.
+
+    :param check_sys_fonts: Whether to search system for fonts, if they haven't been registered yet.
+    :return: The new font configuration.
+    """
+    find_and_register_fonts(check_sys_fonts)
+    with _registration_lock:
+        _font_configs[check_sys_fonts] = _freeze(_get_neume_dict(LOCAL_FONT_DIR))
+        return _font_configs[check_sys_fonts]
+
+
+def _search_and_register_fonts(check_sys_fonts: bool, tracer: Tracer) -> Dict:
+    font_dirs = [LOCAL_FONT_DIR]
     if check_sys_fonts:
-        system_font_dirs = rl_settings.TTFSearchPath
-        ff.addDirectory(system_font_dirs, recur=True)
+        font_dirs.extend(rl_settings.TTFSearchPath)
+    logging.info("Searching {} for fonts...".format(', '.join(font_dirs)))
+
+    with tracer.span('read_snapshot'):
+        snapshot = _Snapshot.read()
+    tracer.begin('discover_fonts')
+    fonts = _discover_fonts(font_dirs, snapshot)
+    tracer.end(fonts=len(fonts), from_snapshot=not snapshot.changed)
+    with tracer.span('register_fonts', fonts=len(fonts)):
+        _register_fonts(fonts)
+
+    # Standard fonts are otherwise registered the first time a render uses one
+    with tracer.span('register_standard_fonts'):
+        for font_name in pdfmetrics.standardFonts:
+            pdfmetrics.getFont(font_name)
+
+    with tracer.span('load_font_configs'):
+        return _get_neume_dict(LOCAL_FONT_DIR, snapshot)
 
+
+def _discover_fonts(font_dirs: List[str], snapshot: _Snapshot) -> List[fontfinder.FontDescriptor]:
+    """Find the TrueType fonts in font_dirs and their subfolders, and read their family and style.
+
+    A font is only parsed if the snapshot has no entry for it with the same size and modification time.
+    """
+    fonts = []
+    for font_dir in font_dirs:
+        for root, _, file_names in os.walk(font_dir):
+            for file_name in sorted(file_names):
+                if os.path.splitext(file_name)[1].lower() not in ('.ttf', '.ttc'):
+                    continue
+                path = os.path.normpath(os.path.join(root, file_name))
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entry = snapshot.fonts.get(path)
+                if entry is None or entry['stat'] != [stat.st_size, stat.st_mtime_ns]:
+                    entry = _read_font_names(path)
+                    entry['stat'] = [stat.st_size, stat.st_mtime_ns]
+                    snapshot.fonts[path] = entry
+                    snapshot.changed = True
+                if entry['family_name'] is not None:
+                    fonts.append(_font_descriptor(path, entry))
+    return fonts
+
+
+def _read_font_names(path: str) -> Dict:
+    """Parse a font file for what registering it needs, the way ReportLab's FontFinder does.
+
+    Names are kept as latin-1 strings in the snapshot, and turned back into the same bytes when read.
+    """
     try:
-        ff.search()
-    except (KeyError, Exception) as fferror:
-        logging.warning("Font search exception: {}".format(fferror))
+        font = TTFontFile(path, validate=0)
+    except TTFError as e:
+        logging.warning("Failed to read font {}, {}".format(path, e))
+        return {'family_name': None}
+    return {'family_name': font.familyName.decode('latin-1'), 'style_name': font.styleName.decode('latin-1'),
+            'face_name': font.name.decode('latin-1'),
+            'is_bold': font.flags & fontfinder.FF_FORCEBOLD == fontfinder.FF_FORCEBOLD,
+            'is_italic': font.flags & fontfinder.FF_ITALIC == fontfinder.FF_ITALIC}
+
 
-    _register_fonts(ff)
+def _font_descriptor(path: str, entry: Dict) -> fontfinder.FontDescriptor:
+    font = fontfinder.FontDescriptor()
+    font.fileName = path
+    font.familyName = entry['family_name'].encode('latin-1')
+    font.styleName = entry['style_name'].encode('latin-1')
+    font.faceName = entry['face_name'].encode('latin-1')  # Not a FontDescriptor field, but registering needs it
+    font.isBold = entry['is_bold']
+    font.isItalic = entry['is_italic']
+    return font
 
-    return _get_neume_dict(local_font_dir)
 
+def _freeze(value: Any) -> Any:
+    """Make a read-only copy of a loaded config, so renders sharing it can't change it."""
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
 
-def _register_fonts(font_finder: fontfinder.FontFinder):
-    """Search font_path for TTF's and register them.
+
+def _register_fonts(fonts: List[fontfinder.FontDescriptor]):
+    """Register discovered TTF's.
 
     Registers discovered fonts as part of family if multiple weights are found.
-    ReportLab usually keeps a cache after searching a directory.
-    I have this cache disabled because it doesn't seem to work correctly.
+    ReportLab's FontFinder can keep a cache after searching a directory, but
+    it doesn't seem to work correctly, so the startup snapshot is used instead.
     If only one font in family, use family name as font name, otherwise
     use familyname-fontface.
 
-    :param font_finder: Path to search for fonts.
+    Paragraphs draw any face of a family as the family's font of the same weight and slant (and <b> and <i>
+    pick another of those). Those regular, bold, italic and bold italic fonts are the faces with those
+    style names, or if a family has none, its first face with that weight and slant.
+
+    :param fonts: Fonts found by _discover_fonts.
     """
-    for family_name in font_finder.getFamilyNames():
-        fonts_in_family = font_finder.getFontsInFamily(family_name)
+    families: Dict[bytes, List[fontfinder.FontDescriptor]] = {}
+    for font in fonts:
+        families.setdefault(font.familyName, []).append(font)
+    for family_name in sorted(families):
+        fonts_in_family = families[family_name]
+        registered = []
         for font in fonts_in_family:
             if len(fonts_in_family) == 1:
                 try:
-                    ttfont = TTFont(family_name.decode("utf-8"), font.fileName)
+                    ttfont = LazyTTFont(family_name.decode("utf-8"), font.fileName, font.faceName)
                     pdfmetrics.registerFont(ttfont)
                     pdfmetrics.registerFontFamily(family_name)
                 except TTFError as e:
@@ -132,12 +334,94 @@ def _register_fonts(font_finder: fontfinder.FontFinder):
                 font_name = family_name + "-".encode() + font.styleName
                 font_name = font_name.decode("utf-8")
                 try:
-                    ttfont = TTFont(font_name, font.fileName)
+                    ttfont = LazyTTFont(font_name, font.fileName, font.faceName)
                     pdfmetrics.registerFont(ttfont)
                     addMapping(font.familyName, font.isBold, font.isItalic, font_name)
+                    registered.append((font, font_name))
                 except TTFError as e:
                     logging.warning("Failed to register font {}, {}".format(family_name, e))
                     continue
+        for (bold, italic), style_name in FAMILY_STYLE_NAMES.items():
+            by_name = [font_name for font, font_name in registered if font.styleName == style_name]
+            by_flags = [font_name for font, font_name in registered
+                        if (bool(font.isBold), bool(font.isItalic)) == (bold, italic)]
+            if by_name or by_flags:
+                addMapping(family_name, bold, italic, (by_name or by_flags)[0])
+
+
+class MappedFontFile:
+    """A font file for ReportLab to parse, mapped into memory rather than read into it.
+
+    ReportLab keeps the whole file of every registered font, to embed subsets from. Mapped read-only, its
+    pages are shared by every process using the font (server workers, and batch and book workers) through
+    the page cache, and only the parts a process touches count towards it at all.
+    """
+    def __init__(self, path: str):
+        self.name: str = path  # ReportLab takes the font's file name from this
+
+    def read(self) -> mmap.mmap:
+        with open(self.name, 'rb') as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class LazyTTFont(TTFont):
+    """A TrueType font that is only parsed when a render first uses it.
+
+    Parsing a font builds its metrics (widths, glyph maps and positions) as Python objects, which can't be
+    shared between processes, and most documents only use a few of the registered fonts. So a process
+    holds the metrics of the fonts it renders with, and of the rest only their names.
+    """
+    def __init__(self, name: str, path: str, face_name: bytes):
+        # As TTFont.__init__, but with the face parsed later
+        self.fontName = name
+        self.face = _LazyFace(path, face_name)
+        self.encoding = TTEncoding()
+        self.state = WeakKeyDictionary()
+        self._asciiReadable = rl_config.ttfAsciiReadable
+        self.shapable = not any(fnmatch(name, pattern) for pattern in getattr(ttfonts, 'unShapedFontGlob', ()))
+
+
+class _LazyFace:
+    """Stands in for a font's TTFontFace, parsing the font file the first time anything but its name is needed.
+    """
+    def __init__(self, path: str, name: bytes):
+        self._path: str = path
+        self._name: bytes = name
+        self._face: TTFontFace or None = None
+        self._lock = threading.Lock()
+
+    @property
+    def name(self) -> bytes:
+        return self._name if self._face is None else self._face.name
+
+    def _parse(self) -> TTFontFace:
+        with self._lock:
+            if self._face is None:
+                face = TTFontFace(MappedFontFile(self._path))
+                _lock_subsetting(face)
+                self._face = face
+        return self._face
+
+    def __getattr__(self, attribute):
+        # Only called for what isn't an attribute of the stand-in itself
+        return getattr(self._face or self._parse(), attribute)
+
+
+def _lock_subsetting(face: TTFontFace):
+    """Let only one document at a time embed a subset of the font.
+
+    Subsetting reads the font file through a read position shared by the whole font, so two documents
+    saved at once from different threads would corrupt each other's subsets. Everything else a render does
+    with a registered font only reads it.
+    """
+    make_subset = face.makeSubset
+    lock = threading.Lock()
+
+    def locked_make_subset(subset):
+        with lock:
+            return make_subset(subset)
+
+    face.makeSubset = locked_make_subset
 
 
 def is_registered_font(font_name: str) -> bool:
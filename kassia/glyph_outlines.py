@@ -0,0 +1,171 @@
+import struct
+from typing import Dict, List, Tuple
+
+from reportlab.pdfbase.ttfonts import TTFontFace
+
+from .font_reader import MappedFontFile
+
+# Composite glyph flags
+ARG_1_AND_2_ARE_WORDS = 0x0001
+ARGS_ARE_XY_VALUES = 0x0002
+WE_HAVE_A_SCALE = 0x0008
+MORE_COMPONENTS = 0x0020
+WE_HAVE_AN_X_AND_Y_SCALE = 0x0040
+WE_HAVE_A_TWO_BY_TWO = 0x0080
+
+# Simple glyph flags
+ON_CURVE = 0x01
+X_SHORT = 0x02
+Y_SHORT = 0x04
+REPEAT = 0x08
+X_SAME_OR_POSITIVE = 0x10
+Y_SAME_OR_POSITIVE = 0x20
+
+Contour = List[Tuple[float, float, bool]]  # (x, y, on curve)
+
+
+class GlyphOutlines:
+    """Reads glyph outlines from the glyf table of a registered TrueType font, as SVG path data.
+
+    Paths are scaled to 1000 units per em (the units of the font's charWidths) and flipped so that y
+    points down, as in SVG. Each glyph is converted once and then cached. The outlines are read from the
+    font's file, mapped into memory, so the pages are shared with ReportLab's copy rather than duplicated.
+    """
+    def __init__(self, face: TTFontFace):
+        self.face: TTFontFace = face
+        self._data = MappedFontFile(face.filename).read()
+        self._glyf_offset: int = face.get_table_pos('glyf')[0]
+        self._scale: float = 1000. / face.unitsPerEm
+        self._paths: Dict[int, str] = {}
+
+    def glyph_id(self, char: str) -> int:
+        return self.face.charToGlyph.get(ord(char), 0)
+
+    def path(self, glyph_id: int) -> str:
+        """Get the outline of a glyph as SVG path data. Glyphs without an outline (e.g. space) give ''.
+        """
+        if glyph_id not in self._paths:
+            self._paths[glyph_id] = self._contours_to_path(self._contours(glyph_id))
+        return self._paths[glyph_id]
+
+    def _contours(self, glyph_id: int) -> List[Contour]:
+        glyph_pos = self.face.glyphPos
+        if glyph_id + 1 >= len(glyph_pos) or glyph_pos[glyph_id] == glyph_pos[glyph_id + 1]:
+            return []
+        data = self._data
+        pos = self._glyf_offset + glyph_pos[glyph_id]
+        num_contours = struct.unpack_from('>h', data, pos)[0]
+        pos += 10  # Skip the bounding box
+        if num_contours >= 0:
+            return self._simple_contours(data, pos, num_contours)
+        return self._composite_contours(data, pos)
+
+    @staticmethod
+    def _simple_contours(data: bytes, pos: int, num_contours: int) -> List[Contour]:
+        end_points = struct.unpack_from('>%dH' % num_contours, data, pos)
+        pos += 2 * num_contours
+        num_points = end_points[-1] + 1 if end_points else 0
+        instruction_length = struct.unpack_from('>H', data, pos)[0]
+        pos += 2 + instruction_length
+
+        flags = []
+        while len(flags) < num_points:
+            flag = data[pos]
+            pos += 1
+            flags.append(flag)
+            if flag & REPEAT:
+                flags.extend([flag] * data[pos])
+                pos += 1
+
+        coords = []
+        for short, same_or_positive in ((X_SHORT, X_SAME_OR_POSITIVE), (Y_SHORT, Y_SAME_OR_POSITIVE)):
+            values, value = [], 0
+            for flag in flags[:num_points]:
+                if flag & short:
+                    value += data[pos] if flag & same_or_positive else -data[pos]
+                    pos += 1
+                elif not flag & same_or_positive:
+                    value += struct.unpack_from('>h', data, pos)[0]
+                    pos += 2
+                values.append(value)
+            coords.append(values)
+
+        contours, start = [], 0
+        for end in end_points:
+            contours.append([(coords[0][i], coords[1][i], bool(flags[i] & ON_CURVE)) for i in range(start, end + 1)])
+            start = end + 1
+        return contours
+
+    def _composite_contours(self, data: bytes, pos: int) -> List[Contour]:
+        contours = []
+        flags = MORE_COMPONENTS
+        while flags & MORE_COMPONENTS:
+            flags, component_id = struct.unpack_from('>HH', data, pos)
+            pos += 4
+            if flags & ARG_1_AND_2_ARE_WORDS:
+                arg1, arg2 = struct.unpack_from('>hh', data, pos)
+                pos += 4
+            else:
+                arg1, arg2 = struct.unpack_from('>bb', data, pos)
+                pos += 2
+            # Anchor points (args that aren't x, y offsets) are rare in practice, and are treated as no offset
+            dx, dy = (arg1, arg2) if flags & ARGS_ARE_XY_VALUES else (0, 0)
+
+            a, b, c, d = 1., 0., 0., 1.
+            if flags & WE_HAVE_A_SCALE:
+                a = d = struct.unpack_from('>h', data, pos)[0] / 16384.
+                pos += 2
+            elif flags & WE_HAVE_AN_X_AND_Y_SCALE:
+                a, d = (v / 16384. for v in struct.unpack_from('>hh', data, pos))
+                pos += 4
+            elif flags & WE_HAVE_A_TWO_BY_TWO:
+                a, b, c, d = (v / 16384. for v in struct.unpack_from('>hhhh', data, pos))
+                pos += 8
+
+            for contour in self._contours(component_id):
+                contours.append([(a * x + c * y + dx, b * x + d * y + dy, on) for x, y, on in contour])
+        return contours
+
+    def _contours_to_path(self, contours: List[Contour]) -> str:
+        """Convert contours to path data with relative commands and whole-number coordinates, which keeps the
+        path short.
+        """
+        scale = self._scale
+        commands = []
+        pen = (0, 0)
+
+        def to(command: str, *points: Tuple[float, float]) -> str:
+            nonlocal pen
+            deltas = []
+            for x, y in points:
+                x, y = round(x * scale), round(-y * scale)
+                deltas.extend((x - pen[0], y - pen[1]))  # Relative to the start of the segment
+            pen = (x, y)
+            return command + ' '.join(str(d) for d in deltas).replace(' -', '-')
+
+        for contour in contours:
+            if not contour:
+                continue
+            # Start from an on-curve point, or the midpoint of the first two off-curve points
+            start = next((i for i, point in enumerate(contour) if point[2]), None)
+            if start is None:
+                (x0, y0, _), (x1, y1, _) = contour[0], contour[1 % len(contour)]
+                points = [((x0 + x1) / 2., (y0 + y1) / 2., True)] + contour[1:] + contour[:1]
+            else:
+                points = contour[start:] + contour[:start]
+            commands.append(to('m', points[0][:2]))
+            contour_start = pen
+
+            control = None
+            for x, y, on in points[1:] + points[:1]:
+                if on:
+                    commands.append(to('q', control, (x, y)) if control else to('l', (x, y)))
+                    control = None
+                else:
+                    if control:
+                        # Two off-curve points in a row imply an on-curve point between them
+                        commands.append(to('q', control, ((control[0] + x) / 2., (control[1] + y) / 2.)))
+                    control = (x, y)
+            commands.append('z')
+            pen = contour_start
+        return ''.join(commands)
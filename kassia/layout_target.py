@@ -0,0 +1,15 @@
+from typing import BinaryIO, Dict, Tuple, Union
+
+
+class LayoutTarget:
+    """A page size and set of page margins to lay out a parsed document for.
+
+    Any setting left as None falls back to the value from the document's page-layout defaults.
+    """
+    def __init__(self,
+                 output_file: Union[str, BinaryIO],
+                 paper_size: Union[str, Tuple[float, float]] = None,
+                 page_margins: Dict[str, int] = None):
+        self.output_file: Union[str, BinaryIO] = output_file
+        self.paper_size: Union[str, Tuple[float, float]] = paper_size  # A ReportLab page size name, or (width, height)
+        self.page_margins: Dict[str, int] = page_margins  # Any of top_margin, bottom_margin, left_margin, right_margin
@@ -1,17 +1,29 @@
+from functools import lru_cache
+from typing import List
+
 from reportlab.pdfbase import pdfmetrics
 
+from . import text_metrics
 from .connector import Connector
 
 
 class Lyric:
-    def __init__(self, text, font_family, font_size, color, top_margin, connector: str):
+    __slots__ = 'text', 'font_family', 'font_size', 'color', 'top_margin', 'connector', 'width', 'height'
+
+    def __init__(self, text, font_family, font_size, color, top_margin, connector: str, width: float = None):
+        """
+        :param width: The width of the text, if it was measured along with other lyrics (see measure_lyrics).
+        """
         self.text: str = text
         self.font_family: str = font_family
         self.font_size: int = font_size
         self.color: str = color
         self.top_margin: float = top_margin
         self.connector: Connector = connector
-        self.recalc_width()
+        if width is None:
+            self.recalc_width()
+        else:
+            self.width = width
         self.calc_height()
 
     def recalc_width(self):
@@ -21,5 +33,17 @@ class Lyric:
             self.width = 0
 
     def calc_height(self):
-        ascent, descent = pdfmetrics.getAscentDescent(self.font_family, self.font_size)
-        self.height = ascent - descent
+        self.height = _line_height(self.font_family, self.font_size)
+
+
+def measure_lyrics(lyrics: List[Lyric]):
+    """Set the width of each lyric, measuring all the lyrics of a font and size at once."""
+    widths = text_metrics.measure((lyric.text or '', lyric.font_family, lyric.font_size) for lyric in lyrics)
+    for lyric, width in zip(lyrics, widths):
+        lyric.width = width
+
+
+@lru_cache(maxsize=None)
+def _line_height(font_family: str, font_size: float) -> float:
+    ascent, descent = pdfmetrics.getAscentDescent(font_family, font_size)
+    return ascent - descent
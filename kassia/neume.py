@@ -7,6 +7,8 @@ from .neume_type import NeumeType
 
 
 class NeumeBnml:
+    __slots__ = 'name', 'category'
+
     def __init__(self,
                  name: str,
                  category: NeumeType):
@@ -15,6 +17,9 @@ class NeumeBnml:
 
 
 class Neume:
+    __slots__ = ('name', 'char', 'font_family', 'font_fullname', 'font_size', 'color', 'width', 'height', 'standalone',
+                 'takes_lyric', 'lyric_offset', 'keep_with_next', 'offset', 'category')
+
     def __init__(self, name: str,
                  char: str,
                  font_family: str,
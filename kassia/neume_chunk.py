@@ -7,6 +7,8 @@ class NeumeChunk(MutableSequence):
     """A collection of Neumes, but with a calculated width and height.
     A chunk contains one base neume, and other neumes that are anchored to the base neume.
     """
+    __slots__ = 'width', 'height', 'base_neume', 'takes_lyric', 'list'
+
     def __init__(self, *args):
         self.width: float = 0
         self.height: float = 0
@@ -0,0 +1,16 @@
+from typing import List
+
+from .drop_cap import Dropcap
+from .syllable import Syllable
+
+
+class ParsedScore:
+    """A score whose neumes and lyrics have been resolved, but which has not been broken into lines yet.
+
+    Everything stored here is independent of the page width, so a single ParsedScore can be laid out
+    for several page sizes.
+    """
+    def __init__(self, syllables: List[Syllable], dropcap: Dropcap = None, dropcap_offset: float = 0):
+        self.syllables: List[Syllable] = syllables
+        self.dropcap: Dropcap = dropcap
+        self.dropcap_offset: float = dropcap_offset
@@ -0,0 +1,138 @@
+from typing import List
+
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfgen.canvas import Canvas
+from reportlab.pdfgen.textobject import PDFTextObject
+
+
+class PdfWriter:
+    """Draws glyphs and lines onto a canvas, keeping track of the current graphics state.
+
+    Glyphs are collected into a single PDF text object between begin_text and end_text, and font, colour
+    and line width operators are only written when they change. A glyph that starts exactly where the
+    previous glyph ended (same font, size, colour and baseline) is appended to the previous run, so a
+    whole neume chunk is usually written as a single string.
+    """
+    def __init__(self, canvas: Canvas):
+        self.canvas: Canvas = canvas
+        self._text: PDFTextObject or None = None
+        self._font: tuple or None = None  # (font name, font size) of the text object
+        self._fill_color = None
+        self._stroke_color = None
+        self._line_width: float or None = None
+        self._word_space: float = 0
+
+        # Glyph run waiting to be written
+        self._run_chars: List[str] = []
+        self._run_font: tuple or None = None
+        self._run_color = None
+        self._run_word_space: float = 0
+        self._run_x: float = 0
+        self._run_y: float = 0
+        self._run_end_x: float = 0
+
+    def begin_text(self):
+        """Start collecting glyphs into a text object.
+        """
+        self._text = self.canvas.beginText()
+        self._font = None
+
+    def end_text(self):
+        """Write any pending glyphs, and draw the text object onto the canvas.
+        """
+        self._flush_run()
+        self.canvas.drawText(self._text)
+        self._text = None
+
+    def draw_string(self, x: float, y: float, text: str, font_name: str, font_size: float, color,
+                    width: float = None, word_space: float = 0):
+        """Draw a string with its baseline starting at x, y. Must be called between begin_text and end_text.
+
+        :param x: Left side of string.
+        :param y: Baseline of string.
+        :param text: The characters to draw.
+        :param font_name: Registered name of font.
+        :param font_size: Size of font.
+        :param color: Fill color.
+        :param width: Advance width of the text, if already known.
+        :param word_space: Extra space added after each space character, for justified text.
+        """
+        if width is None:
+            width = pdfmetrics.stringWidth(text, font_name, font_size) + word_space * text.count(' ')
+
+        font = (font_name, font_size)
+        continues_run = font == self._run_font and color == self._run_color and y == self._run_y and abs(x - self._run_end_x) < 1e-6
+        if not (self._run_chars and continues_run and word_space == self._run_word_space):
+            self._flush_run()
+            self._run_font = font
+            self._run_color = color
+            self._run_word_space = word_space
+            self._run_x = x
+            self._run_y = y
+            self._run_end_x = x
+
+        self._run_chars.append(text)
+        self._run_end_x += width
+
+    def draw_centred_string(self, x: float, y: float, text: str, font_name: str, font_size: float, color):
+        """Draw a string horizontally centred on x.
+        """
+        width = pdfmetrics.stringWidth(text, font_name, font_size)
+        self.draw_string(x - width / 2., y, text, font_name, font_size, color, width)
+
+    def draw_line(self, x1: float, y1: float, x2: float, y2: float, color, line_width: float = None):
+        """Stroke a line. Must be called outside begin_text and end_text.
+
+        :param line_width: Width of line. Leaves the current line width alone if None.
+        """
+        if color != self._stroke_color:
+            self.canvas.setStrokeColor(color)
+            self._stroke_color = color
+        if line_width is not None and line_width != self._line_width:
+            self.canvas.setLineWidth(line_width)
+            self._line_width = line_width
+        self.canvas.line(x1, y1, x2, y2)
+
+    def draw_rect(self, x: float, y: float, width: float, height: float, fill_color=None, stroke_color=None,
+                  line_width: float = None, radius: float = 0):
+        """Fill and/or stroke a rectangle. Must be called outside begin_text and end_text.
+
+        :param fill_color: Fill color. The rectangle isn't filled if None.
+        :param stroke_color: Stroke color. The rectangle isn't stroked if None.
+        :param radius: Corner radius, for a rounded rectangle.
+        """
+        if fill_color is not None and fill_color != self._fill_color:
+            self.canvas.setFillColor(fill_color)
+            self._fill_color = fill_color
+        if stroke_color is not None and stroke_color != self._stroke_color:
+            self.canvas.setStrokeColor(stroke_color)
+            self._stroke_color = stroke_color
+        if line_width is not None and line_width != self._line_width:
+            self.canvas.setLineWidth(line_width)
+            self._line_width = line_width
+        stroke, fill = int(stroke_color is not None), int(fill_color is not None)
+        if radius:
+            self.canvas.roundRect(x, y, width, height, radius, stroke=stroke, fill=fill)
+        else:
+            self.canvas.rect(x, y, width, height, stroke=stroke, fill=fill)
+
+    def _flush_run(self):
+        if not self._run_chars:
+            return
+
+        text = self._text
+        if self._run_font != self._font:
+            text.setFont(*self._run_font)
+            self._font = self._run_font
+        if self._run_color != self._fill_color:
+            text.setFillColor(self._run_color)
+            self._fill_color = self._run_color
+        if self._run_word_space != self._word_space:
+            text.setWordSpace(self._run_word_space)
+            self._word_space = self._run_word_space
+        text.setTextOrigin(self._run_x, self._run_y)
+        # Unlike textOut, doesn't measure the run to move a cursor that setTextOrigin overrides anyway.
+        # It is private, so ReportLab is pinned
+        text._textOut(''.join(self._run_chars))
+
+        self._run_chars = []
@@ -1,11 +1,45 @@
 import json
 import os
+from typing import Dict, List
+from xml.etree.ElementTree import tostring
+
+import music_parser as prs
 
 
 class ScoreSession:
+    """A score of a project: its metadata, and its music, either as a BNML file or as txt to be converted
+    with the project's header.
+    """
+    def __init__(self, title: str = '', author: str = '', raw_music: str = '', score_id: str = None,
+                 bnml_path: str = None) -> None:
+        self.title: str = title
+        self.author: str = author
+        self.raw_music: str = raw_music
+        self.score_id: str or None = score_id
+        self.bnml_path: str or None = bnml_path
+
+    @classmethod
+    def from_dict(cls, score: Dict) -> 'ScoreSession':
+        """Create a score from its entry in a project file, as written by UIdev.ProjectView.save_project."""
+        return cls(score.get('Title', ''), score.get('Author', ''), score.get('raw_music', ''), score.get('id'),
+                   score.get('bnml'))
+
+    def to_dict(self) -> Dict:
+        score = {'Title': self.title, 'Author': self.author, 'id': self.score_id, 'raw_music': self.raw_music}
+        if self.bnml_path is not None:
+            score['bnml'] = self.bnml_path
+        return score
+
+    def to_bnml(self, header: str = '') -> bytes:
+        """Get the score as a BNML document.
+
+        :param header: BNML defaults and identification to put before the music, if the score is txt.
+        """
+        if self.bnml_path is not None:
+            with open(self.bnml_path, 'rb') as f:
+                return f.read()
+        return tostring(prs.music_from_txt(self.raw_music, header).to_element(), encoding='utf-8')
 
-    def __init__(self) -> None:
-        pass
 
 class Project:
 
@@ -15,8 +49,25 @@ class Project:
             scores = None
         ) -> None:
 
-        self.metadata = {}
-        self.scores = []
+        self.metadata: Dict = metadata if metadata is not None else {}
+        self.scores: List[ScoreSession] = scores if scores is not None else []
+
+    @classmethod
+    def from_file(cls, filename: str) -> 'Project':
+        """Load a project file, as written by save or UIdev.ProjectView.save_project. Relative BNML paths are
+        relative to the project file."""
+        with open(filename, 'r', encoding='utf-8') as f:
+            project = json.load(f)
+        scores = [ScoreSession.from_dict(score) for score in project.get('scores', [])]
+        for score in scores:
+            if score.bnml_path is not None:
+                score.bnml_path = os.path.join(os.path.dirname(filename), score.bnml_path)
+        return cls(project.get('metadata'), scores)
+
+    def save(self, filename: str):
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump({'metadata': self.metadata, 'scores': [score.to_dict() for score in self.scores]}, f,
+                      indent=6)
 
     def _metadata_from_file(self, filename):
         with open(filename, 'r', encoding='utf-8') as f:
@@ -32,5 +83,16 @@ class Project:
         self.scores.pop(i)
 
     def move_score(self, score, move_by = 1):
-        
+        """Move a score up (negative move_by) or down the book, stopping at either end."""
+        i = self.scores.index(score)
+        new_index = min(max(i + move_by, 0), len(self.scores) - 1)
+        self.scores.insert(new_index, self.scores.pop(i))
+
+    def build_book(self, output_file, header: str = '', **options):
+        """Render every score and combine them into one PDF. See kassia.book.build_book.
 
+        :return: The book's fragments, one per score, with their page numbers and any errors.
+        """
+        # Imported here, since building a book needs the renderer, and editing a project doesn't
+        from .book import build_book
+        return build_book(self, output_file, header, **options)
@@ -0,0 +1,79 @@
+from io import BytesIO
+from typing import TYPE_CHECKING, BinaryIO, Dict, List, Union
+from xml.etree.ElementTree import Element
+
+from kassia_main import Kassia
+
+from .font_reader import find_and_register_fonts, reload_font_configs
+from .trace import Tracer
+
+if TYPE_CHECKING:
+    from .display_list import DisplayList
+
+Source = Union[str, BinaryIO, Element]  # A BNML path, a BNML file object, or a bnml Element
+
+
+class Renderer:
+    """Renders BNML documents, keeping what doesn't change between them.
+
+    Fonts are searched for, registered and their configs loaded once, when the renderer is created, so a
+    long-lived renderer skips all of that on every render after the first. Everything that depends on the
+    document (styles, parsed scores, headers and footers) lives in a Kassia instance made for that render
+    and thrown away after, so nothing carries over from one document to the next.
+
+    A renderer can be used from several threads at once:
+
+    - ReportLab's font registries are global to the process. They are only written to while the first
+      renderer (or the first find_and_register_fonts call) registers the fonts, and only read after that.
+      So every renderer in a process has to use the same use_system_fonts.
+    - The font configs are read-only, and shared by every render without locking.
+    - Per-render state lives only in that render's Kassia instance and document template.
+    - A font is parsed the first time a render uses it, once, under a lock of its own (see
+      font_reader.LazyTTFont).
+    - The one step that isn't a pure read is embedding font subsets when a PDF is saved, which is
+      serialized per font (see font_reader._lock_subsetting).
+
+    Profiling uses tracemalloc, which is global to the process, so only profile one render at a time.
+    """
+    def __init__(self, use_system_fonts: bool = False, tracer: Tracer = None):
+        """
+        :param use_system_fonts: Whether to search system for fonts.
+        :param tracer: Records the steps of registering the fonts, if this is the first renderer.
+        """
+        self.use_system_fonts: bool = use_system_fonts
+        self.fonts: Dict = find_and_register_fonts(use_system_fonts, tracer)
+
+    def reload_fonts(self):
+        """Load the font configs again, after they were edited."""
+        self.fonts = reload_font_configs(self.use_system_fonts)
+
+    def render(self, source: Source, output_file: Union[str, BinaryIO] = None, **options) -> bytes or None:
+        """Render a document as PDF.
+
+        :param source: The BNML document.
+        :param output_file: Path or file object to write the PDF to. If None, the PDF is returned instead.
+        :param options: Other arguments of Kassia, like targets, music_elements or profile.
+        :return: The PDF, if output_file is None.
+        """
+        pdf_stream = BytesIO() if output_file is None else output_file
+        self._kassia(source, pdf_stream, output_format='pdf', **options)
+        if output_file is None:
+            return pdf_stream.getvalue()
+        return None
+
+    def render_svg(self, source: Source, **options) -> List[str]:
+        """Render a document as SVG.
+
+        :return: One SVG document per page.
+        """
+        return self._kassia(source, None, output_format='svg', **options).svg_pages
+
+    def layout(self, source: Source, **options) -> 'DisplayList':
+        """Lay out a document for its page layout, without writing it.
+
+        :return: What is drawn on each page, which can be replayed into a PDF or rasterized.
+        """
+        return self._kassia(source, None, output_format='display_list', **options).display_list
+
+    def _kassia(self, source: Source, output_file, **options) -> Kassia:
+        return Kassia(source, output_file, use_system_fonts=self.use_system_fonts, fonts=self.fonts, **options)
@@ -64,6 +64,21 @@ class Score(Flowable):
 
         if self.dropcap:
             first_line = Score([self.syl_lines.pop(0)], self.dropcap, avail_width)
-            return [first_line, *self.syl_lines]
+            return [first_line, *map(LineFlowable, self.syl_lines)]
         else:
-            return self.syl_lines
+            return list(map(LineFlowable, self.syl_lines))
+
+
+class LineFlowable(Flowable):
+    """Lets platypus place a single line of a score that was split across pages.
+    """
+    def __init__(self, line: SyllableLine):
+        super().__init__()
+        self.line: SyllableLine = line
+
+    def wrap(self, *args):
+        self.width, self.height = self.line.wrap(*args)
+        return self.width, self.height
+
+    def draw(self):
+        self.line.draw(self.canv)
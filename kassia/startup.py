@@ -0,0 +1,89 @@
+from collections import defaultdict
+from io import BytesIO
+from typing import Dict, List, Tuple
+
+# Seconds from starting the server process to having rendered the first PDF (examples/sample.xml), on one
+# shared CPU, with the fonts and their configs in the startup snapshot
+TIME_TO_FIRST_PDF_TARGET = 1.5
+
+# Rendered once at startup, so that the first request doesn't fill ReportLab's caches (paragraph parsing,
+# glyph widths, font subsets) and the lazily imported modules
+WARM_UP_BNML = b"""<bnml>
+    <defaults>
+        <styles>
+            <score-style font_family="KA New Stathis" font_size="30" align="justify" word_spacing="4" leading="60" />
+            <neume-style type="ordinary" color="#000000" />
+            <neume-style type="accidental" color="#cf232b" />
+            <neume-style type="chronos" color="#cf232b" />
+            <neume-style type="martyria" color="#cf232b" />
+            <lyric-style font_family="Alegreya-Medium" font_size="14" color="#000000" space_before="26" />
+            <dropcap-style font_family="Alegreya-Bold" font_size="45" color="#cf232b" />
+        </styles>
+    </defaults>
+    <music>
+        <header-odd>Warm-up <page-number align="right" /></header-odd>
+        <footer>Warm-up</footer>
+        <para>Warm-up</para>
+        <score>
+            <dropcap>L</dropcap>
+            <syllable>
+                <lyric con="u">Lord</lyric>
+                <neume-group>
+                    <neume>bare</neume>
+                    <neume type="primary">olig</neume>
+                </neume-group>
+            </syllable>
+        </score>
+    </music>
+</bnml>
+"""
+
+
+def warm_up(renderer):
+    """Render a small document with renderer, and throw the PDF away."""
+    renderer.render(BytesIO(WARM_UP_BNML))
+
+
+def parse_import_times(importtime_output: str) -> List[Tuple[str, float]]:
+    """Add up the import time of each top-level package from the output of python -X importtime.
+
+    :return: (package, seconds) pairs, slowest first.
+    """
+    totals: Dict[str, float] = defaultdict(float)
+    for line in importtime_output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _, module = line[len('import time:'):].split('|')
+        totals[module.strip().split('.')[0]] += int(self_us) / 1e6
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)
+
+
+def print_startup_report(seconds: float, import_times: List[Tuple[str, float]], events: List[Dict],
+                         packages: int = 8) -> bool:
+    """Print where the time to the first PDF went.
+
+    :param seconds: Time from starting the process to having rendered the first PDF.
+    :param import_times: Import time by package, from parse_import_times.
+    :param events: Trace events of the warm-up and the first request.
+    :param packages: How many of the slowest packages to list, before adding up the rest.
+    :return: Whether the time to the first PDF met TIME_TO_FIRST_PDF_TARGET.
+    """
+    print('{:<50} {:>8.0f} ms'.format('imports (some during warm-up)', sum(t for _, t in import_times) * 1000))
+    for package, package_seconds in import_times[:packages]:
+        print('  {:<48} {:>8.0f} ms'.format(package, package_seconds * 1000))
+    print('  {:<48} {:>8.0f} ms'.format('other', sum(t for _, t in import_times[packages:]) * 1000))
+
+    # Events are complete spans, so a parent starts no later than its children and ends no earlier
+    stack = []
+    for event in sorted(events, key=lambda event: (event['ts'], -event['dur'])):
+        while stack and event['ts'] >= stack[-1]:
+            stack.pop()
+        args = ', '.join('{}={}'.format(key, value) for key, value in event['args'].items())
+        label = '  ' * len(stack) + event['name'] + (' ({})'.format(args) if args else '')
+        print('{:<50} {:>8.0f} ms'.format(label, event['dur'] / 1000))
+        stack.append(event['ts'] + event['dur'])
+
+    met = seconds <= TIME_TO_FIRST_PDF_TARGET
+    print('{:<50} {:>8.0f} ms (target {:.0f} ms{})'.format('time to first PDF', seconds * 1000,
+                                                           TIME_TO_FIRST_PDF_TARGET * 1000, '' if met else ', missed'))
+    return met
@@ -0,0 +1,120 @@
+from typing import Dict, List
+from xml.sax.saxutils import escape, quoteattr
+
+from reportlab.pdfbase import pdfmetrics
+
+from .display_list import FILL, GLYPHS, LINE, RECT, STROKE, DisplayList
+from .glyph_outlines import GlyphOutlines
+from .text_metrics import drawn_char_width
+
+
+# Glyph outlines are read once per process, as the registered fonts don't change
+_font_outlines: Dict[str, GlyphOutlines or None] = {}
+
+
+class SvgWriter:
+    """Writes the pages of a display list as standalone SVG documents.
+
+    Glyphs from TrueType fonts are drawn from their outlines: every glyph used on a page is defined once as
+    a <symbol>, and each glyph run is a group of <use> references scaled to the font size. Fonts without
+    outlines (the standard PDF fonts) fall back to <text>.
+    """
+    def __init__(self, display_list: DisplayList):
+        self.display_list: DisplayList = display_list
+        self._symbol_prefixes: Dict[str, str] = {}  # Font name to prefix of its glyph symbol ids
+        self._hex_colors: List[str] = ['#%02x%02x%02x' % tuple(round(c * 255) for c in rgba[:3])
+                                       for rgba in display_list.colors]
+
+    def pages(self) -> List[str]:
+        """Get every page as an SVG document.
+        """
+        return [self.page(i) for i in range(len(self.display_list))]
+
+    def page(self, page_index: int) -> str:
+        """Get a page as an SVG document.
+        """
+        display_list = self.display_list
+        width, height = display_list.page_sizes[page_index]
+        symbols: Dict[str, str] = {}  # Symbol id to path data, in order of first use
+        body: List[str] = []
+
+        for op in display_list.pages[page_index].tolist():
+            kind, flags, font, fill, stroke, text, x0, y0, x1, y1, line_width, radius, word_space = op
+            if kind == GLYPHS:
+                body.append(self._glyph_run(symbols, font, fill, display_list.strings[text], x0, height - y0,
+                                            word_space))
+            elif kind == LINE:
+                body.append('<line x1="%s" y1="%s" x2="%s" y2="%s"%s/>' % (
+                    _coord(x0), _coord(height - y0), _coord(x1), _coord(height - y1),
+                    self._stroke_attrs(stroke, line_width)))
+            elif kind == RECT:
+                attrs = ' fill="%s"' % self._hex_colors[fill] if flags & FILL else ' fill="none"'
+                if flags & STROKE:
+                    attrs += self._stroke_attrs(stroke, line_width)
+                if radius:
+                    attrs += ' rx="%s"' % _coord(radius)
+                body.append('<rect x="%s" y="%s" width="%s" height="%s"%s/>' % (
+                    _coord(min(x0, x1)), _coord(height - max(y0, y1)), _coord(abs(x1 - x0)), _coord(abs(y1 - y0)),
+                    attrs))
+
+        width, height = _coord(width), _coord(height)
+        parts = ['<svg xmlns="http://www.w3.org/2000/svg" width="%spt" height="%spt" viewBox="0 0 %s %s">' % (
+            width, height, width, height)]
+        if symbols:
+            parts.append('<defs>')
+            parts.extend('<symbol id="%s" overflow="visible"><path d="%s"/></symbol>' % item
+                         for item in symbols.items())
+            parts.append('</defs>')
+        parts.append('<rect width="100%" height="100%" fill="white"/>')
+        parts.extend(body)
+        parts.append('</svg>')
+        return '\n'.join(parts)
+
+    def _glyph_run(self, symbols: Dict[str, str], font: int, fill: int, text: str, x: float, y: float,
+                   word_space: float) -> str:
+        font_name, font_size = self.display_list.fonts[font]
+        outlines = self._font_outlines(font_name)
+        if outlines is None:
+            return '<text x="%s" y="%s" font-family=%s font-size="%s" fill="%s" xml:space="preserve">%s</text>' % (
+                _coord(x), _coord(y), quoteattr(font_name), _coord(font_size), self._hex_colors[fill], escape(text))
+
+        # Glyphs are placed in units of 1/1000 em, the units of the font's widths
+        face = outlines.face
+        word_space_units = word_space * 1000. / font_size
+        uses = []
+        advance = 0.
+        for char in text:
+            glyph_id = outlines.glyph_id(char)
+            symbol_id = '{}g{}'.format(self._symbol_prefixes[font_name], glyph_id)
+            if symbol_id not in symbols:
+                path = outlines.path(glyph_id)
+                if path:
+                    symbols[symbol_id] = path
+            if symbol_id in symbols:
+                uses.append('<use href="#%s"%s/>' % (symbol_id, ' x="%s"' % _format(advance, 1) if advance else ''))
+            advance += drawn_char_width(face, char)
+            if char in ' \xa0':
+                advance += word_space_units
+        return '<g transform="translate(%s %s) scale(%s)" fill="%s">%s</g>' % (
+            _coord(x), _coord(y), _format(font_size / 1000., 6), self._hex_colors[fill], ''.join(uses))
+
+    def _font_outlines(self, font_name: str) -> GlyphOutlines or None:
+        if font_name not in self._symbol_prefixes:
+            self._symbol_prefixes[font_name] = 'f{}'.format(len(self._symbol_prefixes))
+        if font_name not in _font_outlines:
+            face = getattr(pdfmetrics.getFont(font_name), 'face', None)
+            _font_outlines[font_name] = GlyphOutlines(face) if getattr(face, 'glyphPos', None) else None
+        return _font_outlines[font_name]
+
+    def _stroke_attrs(self, stroke: int, line_width: float) -> str:
+        return ' stroke="%s" stroke-width="%s"' % (self._hex_colors[stroke], _coord(line_width))
+
+
+def _coord(value: float) -> str:
+    """Format a page coordinate to a hundredth of a point."""
+    return _format(value, 2)
+
+
+def _format(value: float, decimals: int) -> str:
+    text = ('%.*f' % (decimals, value)).rstrip('0').rstrip('.')
+    return '0' if text == '-0' else text
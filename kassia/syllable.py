@@ -1,28 +1,32 @@
-from reportlab.platypus import Flowable
 from typing import Tuple
 
-from .coord import Coord
 from .lyric import Lyric
 from .neume import Neume
 from .neume_chunk import NeumeChunk
 from .neume_type import NeumeType
+from .pdf_writer import PdfWriter
 from .syllable_type import SyllableType
 
 
-class Syllable(Flowable):
+class Syllable:
+    """A neume chunk and the lyric under it, and where line breaking placed them.
+
+    A document can have many thousands of syllables, so positions are kept as plain floats in slots rather
+    than Coords, and a syllable is drawn by the line it is in rather than being a flowable itself.
+    """
+    __slots__ = 'neume_chunk', 'lyric', 'width', 'height', 'neume_x', 'neume_y', 'lyric_x', 'lyric_y'
+
     def __init__(self,
                  neume_chunk: NeumeChunk = None,
-                 neume_chunk_pos: Coord = None,
                  lyric: Lyric = None,
-                 lyric_pos: Coord = None,
                  ):
-        super().__init__()
         self.neume_chunk: NeumeChunk = neume_chunk
-        self.neume_chunk_pos: Coord = neume_chunk_pos if neume_chunk_pos is not None else Coord(0, 0)
         self.lyric: Lyric = lyric
-        self.lyric_pos: Coord = lyric_pos if lyric_pos is not None else Coord(0, 0)
         self.width, self.height = self.calc_size()
-        self.category: SyllableType = self.calc_category()
+        self.neume_x: float = 0  # Position of neume chunk
+        self.neume_y: float = 0
+        self.lyric_x: float = 0  # Position of lyric baseline
+        self.lyric_y: float = 0
 
     def calc_size(self) -> Tuple[float, float]:
         width = max(getattr(self.neume_chunk, 'width', 0), getattr(self.lyric, 'width', 0))
@@ -30,30 +34,32 @@ class Syllable(Flowable):
             + getattr(self.lyric, 'height', 0)
         return width, height
 
-    def calc_category(self) -> SyllableType:
-        """Calculate syllable category, based on contained neumechunk category.
+    @property
+    def category(self) -> SyllableType:
+        """Syllable category, based on contained neumechunk category.
         """
         if self.base_neume.category == NeumeType.martyria:
             return SyllableType.martyria
         else:
             return SyllableType.ordinary
 
-    def draw(self, canvas):
-        canvas.saveState()
-        canvas.translate(self.neume_chunk_pos.x, self.neume_chunk_pos.y)
-        pos_x: float = 0
-        for i, neume in enumerate(self.neume_chunk):
-            canvas.setFillColor(neume.color)
-            canvas.setFont(neume.font_fullname, neume.font_size)
-            if i > 0:
-                pos_x += self.neume_chunk[i - 1].width
-            canvas.drawString(pos_x, self.neume_chunk_pos.y, neume.char)
-        canvas.restoreState()
+    def draw(self, writer: PdfWriter):
+        """Draw neumes and lyric. Must be called while writer is collecting text.
+
+        :param writer: The writer for the line this syllable is in.
+        """
+        # Neumes are drawn at twice the chunk's y position, since the position was formerly applied
+        # both as a canvas translation and as the drawing position.
+        neume_y: float = self.neume_y * 2
+        pos_x: float = self.neume_x
+        for neume in self.neume_chunk:
+            writer.draw_string(pos_x, neume_y, neume.char, neume.font_fullname, neume.font_size, neume.color,
+                               neume.width)
+            pos_x += neume.width
 
         if self.lyric and self.lyric.text:
-            canvas.setFillColor(self.lyric.color)
-            canvas.setFont(self.lyric.font_family, self.lyric.font_size)
-            canvas.drawString(self.lyric_pos.x, self.lyric_pos.y, self.lyric.text)
+            writer.draw_string(self.lyric_x, self.lyric_y, self.lyric.text, self.lyric.font_family,
+                               self.lyric.font_size, self.lyric.color, self.lyric.width)
 
     def has_lyric_text(self) -> bool:
         return bool(self.lyric and self.lyric.text is not None)
@@ -1,21 +1,27 @@
 from collections.abc import MutableSequence
 from typing import List
 
-from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfgen.canvas import Canvas
-from reportlab.platypus import Flowable
 
 from .coord import Coord
 from .lyric import Lyric
+from .pdf_writer import PdfWriter
 from .syllable import Syllable
+from .text_metrics import space_width
 
 
-class SyllableLine(Flowable, MutableSequence):
+class SyllableLine(MutableSequence):
     """This class is a collection of Syllables.
+
+    A line isn't a flowable itself. If a score is split across pages, its lines are handed to platypus
+    wrapped in LineFlowables.
     """
+    __slots__ = 'list', 'leading', 'syllableSpacing', 'width', 'height'
+
     def __init__(self, leading=0, syllable_spacing=0, *args):
-        super().__init__(*args)
         self.list: List[Syllable] = list()
+        self.width: float = 0
+        self.height: float = 0
         self.extend(list(args))
         self.leading: float = leading
         self.syllableSpacing: float = syllable_spacing
@@ -24,32 +30,28 @@ class SyllableLine(Flowable, MutableSequence):
         self.set_size()
         return self.width, self.height
 
-    def draw(self, canvas: Canvas = None):
-        """This class is overloaded from Flowable's draw function.
+    def draw(self, canvas: Canvas):
+        """Draw the syllables, dashes and extenders of the line.
 
-        Note: If a score gets split, platypus will treat the syllableLine
-        as a Flowable and call this draw function without any parameters.
-
-        :param  canvas: The canvas to draw on. Canvas only gets received as an
-        argument when this draw function is called by Score directly.
+        :param canvas: The canvas to draw on.
         """
-        if not canvas:
-            canvas = self.canv
-
+        writer = PdfWriter(canvas)
+        writer.begin_text()
         for syl in self.list:
-            syl.draw(canvas)
+            syl.draw(writer)
+        self.draw_dashes(writer)
+        writer.end_text()
 
-        self.draw_dashes(canvas)
-        self.draw_extenders(canvas)
+        self.draw_extenders(writer)
 
-    def draw_dashes(self, canvas):
+    def draw_dashes(self, writer: PdfWriter):
         """Draw dashes connecting lyrics in a line of syllables.
 
         Loop through syllables in list. Draw dash whenever connector is found.
         Dashes after syllable come after lyric, while dashes on no lyric are
         centered under syllable.
 
-        :param canvas: The canvas to draw extender on.
+        :param writer: The writer to draw dashes with. Must be collecting text.
         """
         starting_lyric = None
         for syl in self.list:
@@ -63,10 +65,10 @@ class SyllableLine(Flowable, MutableSequence):
                     coord = self._get_initial_dash_position(syl)
                 # Middle of word
                 else:
-                    coord = syl.lyric_pos
+                    coord = Coord(syl.lyric_x, syl.lyric_y)
 
                 if syl.takes_lyric:
-                    self._draw_dash(canvas,
+                    self._draw_dash(writer,
                                     coord,
                                     starting_lyric.color,
                                     starting_lyric.font_family,
@@ -75,7 +77,7 @@ class SyllableLine(Flowable, MutableSequence):
             elif starting_lyric is not None:
                 starting_lyric = None
 
-    def draw_extenders(self, canvas):
+    def draw_extenders(self, writer: PdfWriter):
         """Draw extenders connecting two or more sets of lyrics in a line.
 
         Loop through syllables in list. Begin extender if necessary.
@@ -83,7 +85,7 @@ class SyllableLine(Flowable, MutableSequence):
         Keep adding end of neume pos as end of extender.
         Draw extender if get to end of line.
 
-        :param canvas: The canvas to draw extender on.
+        :param writer: The writer to draw extenders with. Must not be collecting text.
         """
         starting_lyric, x1, x2, y1, y2 = None, None, None, None, None
         for i, syl in enumerate(self.list):
@@ -91,12 +93,12 @@ class SyllableLine(Flowable, MutableSequence):
                 # Begin extender if necessary
                 if x1 is None:
                     starting_lyric = syl.lyric
-                    y1, y2 = (syl.lyric_pos.y, syl.lyric_pos.y)
+                    y1, y2 = (syl.lyric_y, syl.lyric_y)
 
                     # If starting new line with extender, begin extender at front of neume
                     # Otherwise begin right after current lyric
                     if i == 0 and syl.lyric.text is None:
-                        x1 = syl.neume_chunk_pos.x
+                        x1 = syl.neume_x
                     else:
                         x1 = self._get_extender_start_position(syl)
 
@@ -105,7 +107,7 @@ class SyllableLine(Flowable, MutableSequence):
                     # If syneches elafron, special case
                     if syl.lyric_offset:
                         x2 = self._get_special_extender_end_position(syl)
-                    self._draw_extender(canvas, x1, y1, x2, y2, starting_lyric)
+                    self._draw_extender(writer, x1, y1, x2, y2, starting_lyric)
                     starting_lyric = syl.lyric
                     x1 = self._get_extender_start_position(syl)
 
@@ -116,12 +118,12 @@ class SyllableLine(Flowable, MutableSequence):
             elif x1 is not None and x2 is not None:
                 if syl.base_neume.name == 'syne' and x1:
                     x2 = self._get_special_extender_end_position(syl)
-                self._draw_extender(canvas, x1, y1, x2, y2, starting_lyric)
+                self._draw_extender(writer, x1, y1, x2, y2, starting_lyric)
                 x1, x2 = None, None
 
         # If extender goes to end of line
         if x1 is not None:
-            self._draw_extender(canvas, x1, y1, x2, y2, starting_lyric)
+            self._draw_extender(writer, x1, y1, x2, y2, starting_lyric)
 
     @staticmethod
     def _get_initial_dash_position(syl: Syllable) -> Coord:
@@ -130,8 +132,8 @@ class SyllableLine(Flowable, MutableSequence):
         :param syl: Current syllable.
         :returns: Dash position as Coordinate
         """
-        lyric_space_width = pdfmetrics.stringWidth(' ', syl.lyric.font_family, syl.lyric.font_size)
-        return Coord(syl.lyric_pos.x + syl.lyric.width + (lyric_space_width * 2), syl.lyric_pos.y)
+        lyric_space_width = space_width(syl.lyric.font_family, syl.lyric.font_size)
+        return Coord(syl.lyric_x + syl.lyric.width + (lyric_space_width * 2), syl.lyric_y)
 
     @staticmethod
     def _get_extender_start_position(syl: Syllable) -> float:
@@ -139,8 +141,8 @@ class SyllableLine(Flowable, MutableSequence):
 
         :param syl: Current syllable.
         """
-        lyric_space_width = pdfmetrics.stringWidth(' ', syl.lyric.font_family, syl.lyric.font_size)
-        return syl.lyric_pos.x + syl.lyric.width + lyric_space_width
+        lyric_space_width = space_width(syl.lyric.font_family, syl.lyric.font_size)
+        return syl.lyric_x + syl.lyric.width + lyric_space_width
 
     @staticmethod
     def _get_extender_end_position(syl: Syllable) -> float:
@@ -148,19 +150,19 @@ class SyllableLine(Flowable, MutableSequence):
 
         :param syl: Current syllable.
         """
-        return syl.neume_chunk_pos.x + syl.width
+        return syl.neume_x + syl.width
 
     @staticmethod
     def _get_special_extender_end_position(syl: Syllable) -> float:
         """Return extender end position when special lyric offset.
         :param syl: Current syllable.
         """
-        return syl.neume_chunk_pos.x + syl.lyric_offset
+        return syl.neume_x + syl.lyric_offset
 
     @staticmethod
-    def _draw_extender(canvas: Canvas, x1: float, y1: float, x2: float, y2: float, starting_lyric: Lyric):
+    def _draw_extender(writer: PdfWriter, x1: float, y1: float, x2: float, y2: float, starting_lyric: Lyric):
         """Draw an underscore extender connecting two or more sets of lyrics.
-        :param canvas: The canvas to draw extender to.
+        :param writer: The writer to draw extender with.
         :param x1: Start of extender, x coordinate.
         :param y1: Start of extender, y coordinate.
         :param x2: End of extender, x coordinate.
@@ -168,26 +170,22 @@ class SyllableLine(Flowable, MutableSequence):
         :param starting_syllable: Syllable which starts the extender.
         """
         if x1 is not None and x2 is not None:
-            canvas.setStrokeColor(starting_lyric.color)
-            canvas.setFont(starting_lyric.font_family, starting_lyric.font_size)
-            canvas.line(x1, y1, x2, y2)
+            writer.draw_line(x1, y1, x2, y2, starting_lyric.color)
 
     @staticmethod
-    def _draw_dash(canvas: Canvas, dash_coord: Coord, color: str, font_family: str, font_size: int):
+    def _draw_dash(writer: PdfWriter, dash_coord: Coord, color: str, font_family: str, font_size: int):
         """Draw a set of dashes connecting two or more sets of lyrics.
-        :param canvas: The canvas to draw extender to.
+        :param writer: The writer to draw dash with.
         :param dash_coord: Position to draw dash at.
         :param color: Color of dash to draw.
         :param font_family: Font family of dash to draw.
         :param font_size: Font size of dash to draw.
         """
-        canvas.setFillColor(color)
-        canvas.setFont(font_family, font_size)
-        canvas.drawCentredString(dash_coord.x, dash_coord.y, '-')
+        writer.draw_centred_string(dash_coord.x, dash_coord.y, '-', font_family, font_size, color)
 
     def set_size(self):
         if self.list:
-            width = (self.list[-1].neume_chunk_pos.x + self.list[-1].width) - self.list[0].neume_chunk_pos.x
+            width = (self.list[-1].neume_x + self.list[-1].width) - self.list[0].neume_x
             self.width = width
             max_syl_height = max(syl.height for syl in self.list)
             self.height = max(max_syl_height, self.leading)
@@ -0,0 +1,134 @@
+import hashlib
+import logging
+import os
+from collections import defaultdict
+from functools import lru_cache
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont, TTFontFace
+
+from .font_reader import cache_dir
+
+# Fonts with characters above this are measured by ReportLab, rather than given a table that large
+MAX_TABLE_CODEPOINT = 0x2FFFF
+
+# Widths in a table must be whole multiples of 2 ** -WIDTH_FRACTION_BITS of 1/1000 em, so that adding them
+# up is exact in any order. That holds for fonts whose units per em divide 1000 * 2 ** WIDTH_FRACTION_BITS,
+# which includes any power of two up to 65536. Other fonts are measured by ReportLab.
+WIDTH_FRACTION_BITS = 16
+TABLE_VERSION = 2
+
+
+@lru_cache(maxsize=None)
+def _width_table(font: TTFont) -> np.ndarray or None:
+    """The advance width of every codepoint of a TrueType font, in 1/1000 em, indexed by codepoint.
+
+    The last entry is the font's default width, which any codepoint past the end of the table is clipped to.
+    Fonts are cached by object, so registering a font again under the same name gets a new table.
+
+    Tables are saved in Kassia's cache directory and mapped read-only, so every process measuring with a
+    font shares one copy of its table.
+    """
+    path = font.face.filename
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return _build_width_table(font)
+    key = hashlib.sha1('{}|{}|{}|{}|{}'.format(TABLE_VERSION, path, stat.st_size, stat.st_mtime_ns,
+                                               font.face.subfontNameX).encode())
+    table_path = os.path.join(cache_dir(), 'width-tables', key.hexdigest() + '.npy')
+    try:
+        return np.load(table_path, mmap_mode='r')
+    except (OSError, ValueError):
+        pass
+    table = _build_width_table(font)
+    if table is None:
+        return None
+    temp_path = '{}.{}.tmp.npy'.format(table_path, os.getpid())
+    try:
+        os.makedirs(os.path.dirname(table_path), exist_ok=True)
+        np.save(temp_path, table)
+        os.replace(temp_path, table_path)
+        return np.load(table_path, mmap_mode='r')
+    except OSError as e:
+        logging.warning("Failed to save width table {}. {}".format(table_path, e))
+        return table
+
+
+def _build_width_table(font: TTFont) -> np.ndarray or None:
+    """Make a font's width table, or None if its widths are too fine or its codepoints too high for one."""
+    char_widths = font.face.charWidths
+    top = max(char_widths, default=0)
+    if top > MAX_TABLE_CODEPOINT:
+        return None
+    table = np.full(top + 2, font.face.defaultWidth, dtype=np.float64)
+    table[np.fromiter(char_widths.keys(), np.int64, len(char_widths))] = list(char_widths.values())
+    if not np.all(np.modf(np.ldexp(table, WIDTH_FRACTION_BITS))[0] == 0):
+        return None
+    return table
+
+
+def string_widths(texts: Sequence[str], font_name: str, font_size: float) -> List[float]:
+    """Measure several strings in one font and size, as pdfmetrics.stringWidth would.
+
+    For TrueType fonts, the codepoints of all the strings are looked up in the font's width table and
+    summed per string at once, as differences of one running total. Tables only hold widths that are
+    multiples of 2 ** -WIDTH_FRACTION_BITS (see _build_width_table), so every partial sum is exact, and
+    each width comes out the same as ReportLab's sum of the same widths.
+    """
+    font = pdfmetrics.getFont(font_name)
+    table = _width_table(font) if isinstance(font, TTFont) else None
+    if table is None:
+        return [pdfmetrics.stringWidth(text, font_name, font_size) for text in texts]
+
+    codepoints = np.frombuffer(''.join(texts).encode('utf-32-le'), dtype='<u4')
+    totals = np.concatenate(([0], np.cumsum(table[np.minimum(codepoints, len(table) - 1)])))
+    lengths = np.fromiter(map(len, texts), np.int64, len(texts))
+    ends = np.cumsum(lengths)
+    return (0.001 * font_size * (totals[ends] - totals[ends - lengths])).tolist()
+
+
+def measure(items: Iterable[Tuple[str, str, float]]) -> List[float]:
+    """Measure (text, font name, font size) triples, batching those of the same font and size.
+
+    :return: The width of each, in the order given.
+    """
+    items = list(items)
+    batches: Dict[Tuple[str, float], List[int]] = defaultdict(list)
+    for index, (_, font_name, font_size) in enumerate(items):
+        batches[(font_name, font_size)].append(index)
+
+    widths = [0.0] * len(items)
+    for (font_name, font_size), indices in batches.items():
+        for index, width in zip(indices, string_widths([items[i][0] for i in indices], font_name, font_size)):
+            widths[index] = width
+    return widths
+
+
+def drawn_char_width(face: TTFontFace, char: str) -> float:
+    """How far a PDF viewer advances over a character of a TrueType font, in 1/1000 em.
+
+    ReportLab writes a no-break space as a space, and a character the font has no glyph for as code 0,
+    whose width is that of U+0000 rather than the font's default width that stringWidth uses.
+    """
+    code = 32 if char == '\xa0' else ord(char)
+    return face.getCharWidth(code if code in face.charToGlyph else 0)
+
+
+def drawn_width(text: str, font_name: str, font_size: float) -> float:
+    """How far a PDF viewer advances over text drawn in one font and size, without word or character spacing.
+
+    This is pdfmetrics.stringWidth, except where a TrueType font is missing a character (see drawn_char_width).
+    """
+    font = pdfmetrics.getFont(font_name)
+    if not isinstance(font, TTFont):
+        return pdfmetrics.stringWidth(text, font_name, font_size)
+    return 0.001 * font_size * sum(drawn_char_width(font.face, char) for char in text)
+
+
+@lru_cache(maxsize=None)
+def space_width(font_name: str, font_size: float) -> float:
+    """The width of a space, which dashes and extenders are placed by."""
+    return pdfmetrics.stringWidth(' ', font_name, font_size)
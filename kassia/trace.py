@@ -0,0 +1,114 @@
+import io
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from typing import Any, BinaryIO, Dict, List, TextIO, Union
+
+
+class Tracer:
+    """Records nested spans of a render, and writes them in the Chrome trace event format.
+
+    The JSON can be opened offline in chrome://tracing or https://ui.perfetto.dev. Each span is a complete
+    ("X") event, so nesting is shown from the timestamps. If tracemalloc is running, each span also records
+    how much traced memory grew while it was open (allocations minus frees, in bytes).
+    """
+    def __init__(self):
+        self.events: List[Dict[str, Any]] = []
+        self._stack: List[tuple] = []  # (name, args, start time in ns, traced memory at start)
+        self._pid: int = os.getpid()
+        self._started_tracemalloc: bool = False
+
+    @contextmanager
+    def span(self, name: str, **args):
+        depth = len(self._stack)
+        self.begin(name, **args)
+        try:
+            yield
+        finally:
+            # Spans opened inside this one and left open by an exception are closed with it
+            while len(self._stack) > depth:
+                self.end()
+
+    def begin(self, name: str, **args):
+        memory = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None
+        self._stack.append((name, args, time.perf_counter_ns(), memory))
+
+    def end(self, **args):
+        """Close the innermost open span. Any args are added to the ones it was opened with."""
+        end = time.perf_counter_ns()
+        name, span_args, start, memory = self._stack.pop()
+        span_args.update(args)
+        if memory is not None and tracemalloc.is_tracing():
+            span_args['memory_delta'] = tracemalloc.get_traced_memory()[0] - memory
+        self.events.append({'name': name, 'cat': 'kassia', 'ph': 'X', 'ts': start / 1000., 'dur': (end - start) / 1000.,
+                            'pid': self._pid, 'tid': threading.get_ident(), 'args': span_args})
+
+    def start_memory_tracing(self):
+        """Start tracemalloc, if it isn't running already, so that spans opened from now on record memory."""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+
+    def stop_memory_tracing(self):
+        """Stop tracemalloc, if start_memory_tracing started it."""
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def trace_pages(self, doc):
+        """Record a span for each page that a document template builds, including its onPage callbacks.
+
+        Platypus looks the page handlers up on the document each time, so they are wrapped on the instance.
+        """
+        handle_page_begin, handle_page_end = doc.handle_pageBegin, doc.handle_pageEnd
+
+        def page_begin():
+            self.begin('page', page=doc.page + 1)
+            handle_page_begin()
+
+        def page_end():
+            try:
+                handle_page_end()
+            finally:
+                self.end()
+
+        doc.handle_pageBegin = page_begin
+        doc.handle_pageEnd = page_end
+
+    def to_json(self) -> str:
+        return json.dumps({'traceEvents': sorted(self.events, key=lambda event: event['ts']), 'displayTimeUnit': 'ms'})
+
+    def write(self, output_file: Union[str, TextIO, BinaryIO]):
+        """Write the trace as JSON to a path or file object."""
+        trace_json = self.to_json()
+        if not hasattr(output_file, 'write'):
+            with open(output_file, 'w') as f:
+                f.write(trace_json)
+        elif isinstance(output_file, io.TextIOBase):
+            output_file.write(trace_json)
+        else:
+            output_file.write(trace_json.encode())
+
+
+class NullTracer(Tracer):
+    """A tracer that records nothing, used when a render isn't being profiled."""
+    def span(self, name: str, **args):
+        return _NO_SPAN
+
+    def begin(self, name: str, **args):
+        pass
+
+    def end(self, **args):
+        pass
+
+    def start_memory_tracing(self):
+        pass
+
+    def trace_pages(self, doc):
+        pass
+
+
+_NO_SPAN = nullcontext()
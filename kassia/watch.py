@@ -0,0 +1,133 @@
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from .font_reader import LOCAL_FONT_DIR
+from .parsed_score import ParsedScore
+from .renderer import Renderer
+
+
+class ScoreCache:
+    """Parsed scores kept from one render to the next.
+
+    Scores not used by the latest render are dropped at the start of the next one, so the cache doesn't
+    grow with every edit.
+    """
+    def __init__(self):
+        self._previous: Dict[tuple, ParsedScore] = {}
+        self._current: Dict[tuple, ParsedScore] = {}
+        self.hits: int = 0
+
+    def get(self, key: tuple) -> ParsedScore or None:
+        score = self._current.get(key) or self._previous.get(key)
+        if score is not None:
+            self._current[key] = score
+            self.hits += 1
+        return score
+
+    def __setitem__(self, key: tuple, score: ParsedScore):
+        self._current[key] = score
+
+    def __len__(self):
+        return len(self._current)
+
+    def next_render(self):
+        self._previous, self._current = self._current, {}
+        self.hits = 0
+
+    def clear(self):
+        self._previous, self._current = {}, {}
+
+
+class Watcher:
+    """Renders a BNML file again whenever it, or a font config, changes.
+
+    Files are polled, which works the same on every platform and filesystem. A change is only acted on
+    once the files have stopped changing for the debounce time, so an editor writing a file in several
+    steps causes a single render. The renderer stays warm between renders, and scores that didn't change
+    aren't parsed again.
+    """
+    def __init__(self, input_path: str, output_file: str, renderer: Renderer = None, interval: float = 0.25,
+                 debounce: float = 0.2):
+        """
+        :param input_path: BNML file to watch and render.
+        :param output_file: PDF file to write.
+        :param renderer: Renderer to use. A new one is created if None.
+        :param interval: Seconds between polls.
+        :param debounce: Seconds the files have to stay unchanged before rendering.
+        """
+        self.input_path: str = input_path
+        self.output_file: str = output_file
+        self.renderer: Renderer = renderer if renderer is not None else Renderer()
+        self.interval: float = interval
+        self.debounce: float = debounce
+        self.font_configs: List[str] = sorted(str(path) for path in Path(LOCAL_FONT_DIR).rglob('*.yaml'))
+        self.score_cache: ScoreCache = ScoreCache()
+        self._stats: Dict[str, Tuple[int, int] or None] = self._stat_files()
+
+    def _stat_files(self) -> Dict[str, Tuple[int, int] or None]:
+        stats = {}
+        for path in [self.input_path] + self.font_configs:
+            try:
+                stat = os.stat(path)
+                stats[path] = (stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                stats[path] = None  # Editors may delete and recreate a file when saving
+        return stats
+
+    def changed_files(self) -> List[str]:
+        """Get the files that changed since the last call, once they have settled."""
+        stats = self._stat_files()
+        if stats == self._stats:
+            return []
+        while True:
+            time.sleep(self.debounce)
+            settled = self._stat_files()
+            if settled == stats:
+                break
+            stats = settled
+        changed = [path for path in stats if stats[path] != self._stats.get(path)]
+        self._stats = stats
+        return changed
+
+    def render(self) -> bool:
+        """Render the input, logging rather than raising any error, since the file may be half edited.
+
+        :return: Whether the render succeeded.
+        """
+        self.score_cache.next_render()
+        start = time.perf_counter()
+        try:
+            self.renderer.render(self.input_path, self.output_file, score_cache=self.score_cache)
+        except (Exception, SystemExit) as e:  # Kassia exits on XML parse errors
+            logging.error("Failed to render {}: {}".format(self.input_path, e))
+            return False
+        logging.info("Rendered {} in {:.2f} s ({} of {} scores unchanged)".format(
+            self.output_file, time.perf_counter() - start, self.score_cache.hits, len(self.score_cache)))
+        return True
+
+    def poll(self) -> bool:
+        """Check the files once, and render if any changed.
+
+        :return: Whether a render was started.
+        """
+        changed = self.changed_files()
+        if not changed:
+            return False
+        if any(path in self.font_configs for path in changed):
+            self.renderer.reload_fonts()
+            self.score_cache.clear()
+        self.render()
+        return True
+
+    def run(self):
+        """Render once, then keep rendering on every change until interrupted."""
+        self.render()
+        try:
+            while True:
+                self.poll()
+                time.sleep(self.interval)
+        except KeyboardInterrupt:
+            pass
@@ -1,35 +1,85 @@
 #!/usr/bin/python
+import argparse
+import hashlib
 import logging
 import sys
-from copy import deepcopy
-from typing import Any, Dict, Iterator, List, Tuple
-from xml.etree.ElementTree import Element, ParseError, parse
+import time
+from concurrent.futures import ProcessPoolExecutor
+from copy import copy, deepcopy
+from io import BytesIO
+from itertools import chain
+from multiprocessing import get_start_method
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, List, Mapping, Tuple
+from xml.etree.ElementTree import Element, ParseError, parse, tostring
 
 from reportlab.lib.enums import TA_CENTER, TA_JUSTIFY, TA_LEFT, TA_RIGHT
 from reportlab.lib.styles import (ParagraphStyle, StyleSheet1,
                                   getSampleStyleSheet)
 from reportlab.pdfbase import pdfmetrics
-from reportlab.platypus import PageBreak, Paragraph, Spacer
+from reportlab.platypus import Flowable, PageBreak, Paragraph, Spacer
 
 from kassia.complex_doc_template import ComplexDocTemplate
 from kassia.coord import Coord
 from kassia.drop_cap import Dropcap
+from kassia.flowable_stream import FlowableStream
 from kassia.font_reader import find_and_register_fonts
-from kassia.lyric import Lyric
+from kassia.layout_target import LayoutTarget
+from kassia.lyric import Lyric, measure_lyrics
 from kassia.neume import Neume, NeumeBnml, NeumeType
 from kassia.neume_chunk import NeumeChunk
+from kassia.parsed_score import ParsedScore
 from kassia.score import Score
 from kassia.syllable import Syllable
 from kassia.syllable_line import SyllableLine
+from kassia.trace import NullTracer, Tracer
+
+if TYPE_CHECKING:
+    # Imported when used, since display lists need NumPy and Pillow, which PDF output doesn't
+    from kassia.display_list import DisplayList
 
 
 class Kassia:
     """Base class for package"""
 
-    def __init__(self, input_filename, output_file="examples/sample.pdf", use_system_fonts=False):
+    def __init__(self, input_filename, output_file="examples/sample.pdf", use_system_fonts=False,
+                 targets: List[LayoutTarget] = None, parallel: bool = False, output_format: str = None,
+                 music_elements: Iterable[Element] = None, profile=None, fonts: Dict = None, score_cache=None,
+                 first_page_number: int = 1):
+        """
+        :param input_filename: BNML file (path or file object) to read, or an already built bnml Element.
+        :param output_file: PDF file (path or file object) to write. Ignored if targets are given. For SVG output,
+                            the path of the SVG file to write, or None to only keep the pages in svg_pages.
+        :param use_system_fonts: Whether to search system for fonts.
+        :param targets: Page sizes and margins to render the document for. The document is parsed once,
+                        then laid out and written once per target.
+        :param parallel: Whether to render targets in worker processes.
+        :param output_format: 'pdf', 'svg', or 'display_list' to only lay the document out into display_list.
+                              Defaults to 'svg' if output_file is a path ending in .svg, else 'pdf'.
+        :param music_elements: More children of the music element, following those in the input. For PDF output
+                               they are parsed and laid out one at a time as the pages are built, so a long
+                               document never has to be held in memory as a whole.
+        :param profile: Path or file object to write a trace of the render to, as Chrome trace event JSON. Spans
+                        cover parsing, each score and neume group, line breaking, each page, and headers and
+                        footers. After font registration, tracemalloc is started (if it isn't running) and each
+                        span records how much traced memory grew.
+        :param fonts: Font configuration returned by find_and_register_fonts. Looked up if None.
+        :param score_cache: Mapping (with get and item assignment) of ParsedScores from earlier renders, by score
+                            element and document defaults. Scores found in it aren't parsed again, and newly
+                            parsed ones are added. Only share it between renders with the same fonts.
+        :param first_page_number: Number of the first page, for a document that is part of a book. Even and odd
+                                  page headers and footers follow it.
+        """
+        if output_format is None:
+            is_svg_path = isinstance(output_file, str) and output_file.lower().endswith('.svg')
+            output_format = 'svg' if is_svg_path else 'pdf'
         self.bnml = None
         self.doc = None  # SimpleDocTemplate()
-        self.story = []
+        self.story = []  # Scores are kept as ParsedScores until laid out for a page width
+        self._neumes: Dict[tuple, Neume] = {}  # Created neumes, by name, category, font family and style
+        self.score_cache = score_cache
+        self.first_page_number: int = first_page_number
+        self._defaults_key: bytes = b''  # The document defaults, which parsed scores depend on
+        self.use_system_fonts: bool = use_system_fonts
         self.styleSheet = getSampleStyleSheet()
         self.header_first_paragraph: Paragraph = None
         self.header_first_pagenum_style: ParagraphStyle = None
@@ -44,6 +94,8 @@ class Kassia:
         self.footer_odd_paragraph: Paragraph = None
         self.footer_odd_pagenum_style: ParagraphStyle = None
         self.scoreStyleSheet = StyleSheet1()
+        self.svg_pages: List[str] = []  # One SVG document per page, when rendering to SVG
+        self.display_list: 'DisplayList' or None = None  # The laid out pages, when rendering to a display list
         self.init_styles()
         self.input_filename: str = input_filename
 
@@ -53,12 +105,74 @@ class Kassia:
         #     logging.error("XML file not readable.")
         #     return
 
-        self.neume_info_dict: Dict = find_and_register_fonts(use_system_fonts)
-        self.parse_file()
-        self.build_document(output_file)
-        self.create_pdf()
+        self.tracer: Tracer = Tracer() if profile is not None else NullTracer()
+        try:
+            with self.tracer.span('render'):
+                self._render(output_file, targets, parallel, output_format, music_elements, fonts)
+        finally:
+            self.tracer.stop_memory_tracing()
+            if profile is not None:
+                self.tracer.write(profile)
+
+    def _render(self, output_file, targets: List[LayoutTarget], parallel: bool, output_format: str,
+                music_elements: Iterable[Element], fonts: Dict):
+        if fonts is None:
+            with self.tracer.span('find_and_register_fonts'):
+                fonts = find_and_register_fonts(self.use_system_fonts)
+        self.neume_info_dict: Mapping = fonts
+        # Font files and configs are parsed many times slower with tracemalloc on, so memory is traced after
+        self.tracer.start_memory_tracing()
+        with self.tracer.span('parse_file'):
+            self.parse_file()
+        with self.tracer.span('build_document'):
+            self.build_document(output_file)
+        self._music_elements: Iterator[Element] or None = None
+        if music_elements is not None:
+            if targets or output_format != 'pdf':
+                # The story is laid out more than once, or recorded, so it is parsed up front
+                for music_elem in music_elements:
+                    self.parse_music_element(music_elem)
+            else:
+                self._music_elements = iter(music_elements)
+        if targets:
+            self.render_targets(targets, parallel)
+        elif output_format == 'svg':
+            self.svg_pages = self.create_svg()
+            if output_file is not None:
+                self.write_svg(output_file)
+        elif output_format == 'display_list':
+            self.display_list = self.create_display_list()
+        else:
+            self.create_pdf()
+
+    def __getstate__(self):
+        # The input and document template may hold open files, so aren't sent to worker processes
+        state = self.__dict__.copy()
+        state['input_filename'] = None
+        state['doc'] = None
+        state['_music_elements'] = None
+        state['score_cache'] = None
+        state['tracer'] = NullTracer()
+        # The font configuration is read-only and can't be pickled; workers get it from their own registration
+        state['neume_info_dict'] = None
+        # StyleSheet1 can't be unpickled directly (its __getattr__ recurses before __dict__ is restored)
+        for sheet_name in ['styleSheet', 'scoreStyleSheet']:
+            state[sheet_name] = (state[sheet_name].byName, state[sheet_name].byAlias)
+        return state
+
+    def __setstate__(self, state):
+        for sheet_name in ['styleSheet', 'scoreStyleSheet']:
+            by_name, by_alias = state[sheet_name]
+            state[sheet_name] = StyleSheet1()
+            state[sheet_name].byName.update(by_name)
+            state[sheet_name].byAlias.update(by_alias)
+        self.__dict__.update(state)
+        self.neume_info_dict = find_and_register_fonts(self.use_system_fonts)
 
     def parse_file(self):
+        if isinstance(self.input_filename, Element):
+            self.bnml = self.input_filename
+            return
         try:
             bnml_tree = parse(self.input_filename)
             self.bnml = bnml_tree.getroot()
@@ -105,27 +219,12 @@ class Kassia:
     def build_document(self, output_filename: str):
         """Build a pdf document file with metadata.
         """
-        self.doc = ComplexDocTemplate(filename=output_filename)
-
-        metadata = self.bnml.find('identification')
-        if metadata is not None:
-            for meta_tag in ['title', 'author', 'subject']:
-                meta_value = metadata.find(meta_tag)
-                if meta_value is not None:
-                    setattr(self.doc, meta_tag, meta_value.text)
+        self.doc = self._new_document(output_filename)
 
         defaults = self.bnml.find('defaults')
         if defaults is not None:
-            page_layout = defaults.find('page-layout')
-            if page_layout is not None:
-                page_size_elem = page_layout.find('paper-size')
-                if page_size_elem is not None:
-                    self.doc.set_pagesize_by_name(page_size_elem.text)
-                page_margins = page_layout.find('page-margins')
-                if page_margins is not None:
-                    margin_dict = self.fill_attribute_dict(page_margins.attrib)
-                    self.doc.set_margins(margin_dict)
-
+            if self.score_cache is not None:
+                self._defaults_key = tostring(defaults)
             score_layout = defaults.find('score-layout')
             if score_layout is not None:
                 ligatures = score_layout.find('ligatures')
@@ -153,6 +252,33 @@ class Kassia:
 
         self.parse_music(self.bnml)
 
+    def _new_document(self, output_filename) -> ComplexDocTemplate:
+        """Create a document template with the metadata and page layout specified in bnml.
+        """
+        doc = ComplexDocTemplate(filename=output_filename)
+        doc.first_page_number = self.first_page_number
+
+        metadata = self.bnml.find('identification')
+        if metadata is not None:
+            for meta_tag in ['title', 'author', 'subject']:
+                meta_value = metadata.find(meta_tag)
+                if meta_value is not None:
+                    setattr(doc, meta_tag, meta_value.text)
+
+        defaults = self.bnml.find('defaults')
+        if defaults is not None:
+            page_layout = defaults.find('page-layout')
+            if page_layout is not None:
+                page_size_elem = page_layout.find('paper-size')
+                if page_size_elem is not None:
+                    doc.set_pagesize_by_name(page_size_elem.text)
+                page_margins = page_layout.find('page-margins')
+                if page_margins is not None:
+                    margin_dict = self.fill_attribute_dict(page_margins.attrib)
+                    doc.set_margins(margin_dict)
+
+        return doc
+
     def parse_para_style(self, para_style: Element):
         """Read paragraph-type styles and save them in stylesheet.
 
@@ -212,51 +338,65 @@ class Kassia:
         music = bnml_file.find('music')
         if music:
             for music_elem in music:
-                if music_elem.tag == 'header-even':
-                    self.header_even_paragraph, self.header_even_pagenum_style = self._parse_header_footer(
-                        music_elem,
-                        self.styleSheet['Header'])
-                elif music_elem.tag == 'header-odd':
-                    self.header_odd_paragraph, self.header_odd_pagenum_style = self._parse_header_footer(
-                        music_elem,
-                        self.styleSheet['Header'])
-                elif music_elem.tag == 'header-first':
-                    self.header_first_paragraph, self.header_first_pagenum_style = self._parse_header_footer(
-                        music_elem,
-                        self.styleSheet['Header'])
-                elif music_elem.tag == 'header':
-                    self.header_first_paragraph, self.header_first_pagenum_style = self._parse_header_footer(
-                        music_elem,
-                        self.styleSheet['Header'])
-                    self.header_even_paragraph = self.header_odd_paragraph = self.header_first_paragraph
-                    self.header_even_pagenum_style = self.header_odd_pagenum_style = self.header_first_pagenum_style
-                elif music_elem.tag == 'footer-even':
-                    self.footer_even_paragraph, self.footer_even_pagenum_style = self._parse_header_footer(
-                        music_elem,
-                        self.styleSheet['Footer'])
-                elif music_elem.tag == 'footer-odd':
-                    self.footer_odd_paragraph, self.footer_odd_pagenum_style = self._parse_header_footer(
-                        music_elem,
-                        self.styleSheet['Footer'])
-                elif music_elem.tag == 'footer-first':
-                    self.footer_first_paragraph, self.footer_first_pagenum_style = self._parse_header_footer(
-                        music_elem,
-                        self.styleSheet['Footer'])
-                elif music_elem.tag == 'footer':
-                    self.footer_first_paragraph, self.footer_first_pagenum_style = self._parse_header_footer(
-                        music_elem,
-                        self.styleSheet['Footer'])
-                    self.footer_even_paragraph = self.footer_odd_paragraph = self.footer_first_paragraph
-                    self.footer_even_pagenum_style = self.footer_odd_pagenum_style = self.footer_first_pagenum_style
-                elif music_elem.tag == 'pagebreak':
-                    self._parse_pagebreak(music_elem)
-                elif music_elem.tag == 'linebreak':
-                    self._parse_linebreak(music_elem)
-                elif music_elem.tag in ['para', 'paragraph']:
-                    self._parse_paragraph(music_elem)
-                elif music_elem.tag == 'score':
-                    score = self._parse_score(music_elem)
-                    self.story.append(score)
+                self.parse_music_element(music_elem)
+
+    def parse_music_element(self, music_elem: Element):
+        """Parse one child of the music element, adding it to the story or setting a header or footer.
+        """
+        if music_elem.tag == 'header-even':
+            self.header_even_paragraph, self.header_even_pagenum_style = self._parse_header_footer(
+                music_elem,
+                self.styleSheet['Header'])
+        elif music_elem.tag == 'header-odd':
+            self.header_odd_paragraph, self.header_odd_pagenum_style = self._parse_header_footer(
+                music_elem,
+                self.styleSheet['Header'])
+        elif music_elem.tag == 'header-first':
+            self.header_first_paragraph, self.header_first_pagenum_style = self._parse_header_footer(
+                music_elem,
+                self.styleSheet['Header'])
+        elif music_elem.tag == 'header':
+            self.header_first_paragraph, self.header_first_pagenum_style = self._parse_header_footer(
+                music_elem,
+                self.styleSheet['Header'])
+            self.header_even_paragraph = self.header_odd_paragraph = self.header_first_paragraph
+            self.header_even_pagenum_style = self.header_odd_pagenum_style = self.header_first_pagenum_style
+        elif music_elem.tag == 'footer-even':
+            self.footer_even_paragraph, self.footer_even_pagenum_style = self._parse_header_footer(
+                music_elem,
+                self.styleSheet['Footer'])
+        elif music_elem.tag == 'footer-odd':
+            self.footer_odd_paragraph, self.footer_odd_pagenum_style = self._parse_header_footer(
+                music_elem,
+                self.styleSheet['Footer'])
+        elif music_elem.tag == 'footer-first':
+            self.footer_first_paragraph, self.footer_first_pagenum_style = self._parse_header_footer(
+                music_elem,
+                self.styleSheet['Footer'])
+        elif music_elem.tag == 'footer':
+            self.footer_first_paragraph, self.footer_first_pagenum_style = self._parse_header_footer(
+                music_elem,
+                self.styleSheet['Footer'])
+            self.footer_even_paragraph = self.footer_odd_paragraph = self.footer_first_paragraph
+            self.footer_even_pagenum_style = self.footer_odd_pagenum_style = self.footer_first_pagenum_style
+        elif music_elem.tag == 'pagebreak':
+            self._parse_pagebreak(music_elem)
+        elif music_elem.tag == 'linebreak':
+            self._parse_linebreak(music_elem)
+        elif music_elem.tag in ['para', 'paragraph']:
+            self._parse_paragraph(music_elem)
+        elif music_elem.tag == 'score':
+            if self.score_cache is None:
+                with self.tracer.span('score', story_index=len(self.story)):
+                    parsed_score = self._parse_score(music_elem)
+            else:
+                score_key = (self._defaults_key, tostring(music_elem))
+                parsed_score = self.score_cache.get(score_key)
+                if parsed_score is None:
+                    with self.tracer.span('score', story_index=len(self.story)):
+                        parsed_score = self._parse_score(music_elem)
+                    self.score_cache[score_key] = parsed_score
+            self.story.append(parsed_score)
 
     def _parse_header_footer(self, elem: Element, default_style: ParagraphStyle) -> Tuple[Paragraph, ParagraphStyle]:
         """Parse either the header or footer. Checks for local style overrides.
@@ -309,7 +449,7 @@ class Kassia:
         para = Paragraph(paragraph_text, paragraph_style)
         self.story.append(para)
 
-    def _parse_score(self, score_elem: Element) -> Score:
+    def _parse_score(self, score_elem: Element) -> ParsedScore:
         syl_list: List[Syllable] = []
         dropcap = None
         dropcap_offset = 0
@@ -318,6 +458,11 @@ class Kassia:
             syllable = self._parse_syllable(syl_elem)
             syl_list.append(syllable)
 
+        # Lyrics are measured together, then the syllables sized by them
+        measure_lyrics([syllable.lyric for syllable in syl_list if syllable.lyric])
+        for syllable in syl_list:
+            syllable.width, syllable.height = syllable.calc_size()
+
         dropcap_elem = score_elem.find('dropcap')
         if dropcap_elem is not None:
             dropcap = self._parse_dropcap(dropcap_elem)
@@ -329,17 +474,58 @@ class Kassia:
             first_lyric.recalc_width()
             dropcap_offset = dropcap.width + dropcap.x_padding
 
-        lines_list: List[SyllableLine] = self.line_break(syl_list,
-                                                         Coord(dropcap_offset, 0),
-                                                         self.doc.width,
-                                                         self.scoreStyleSheet['score'].leading,
-                                                         self.scoreStyleSheet['score'].wordSpace)
+        return ParsedScore(syl_list, dropcap, dropcap_offset)
+
+    def _layout_score(self, parsed_score: ParsedScore, width: float) -> Score:
+        """Break a parsed score into lines for the passed width.
+
+        :param parsed_score: Score with neumes and lyrics already resolved.
+        :param width: Width of a line (usually page width minus margins).
+        :return: A Score flowable.
+        """
+        with self.tracer.span('layout_score', syllables=len(parsed_score.syllables)):
+            with self.tracer.span('line_break', syllables=len(parsed_score.syllables)):
+                lines_list: List[SyllableLine] = self.line_break(parsed_score.syllables,
+                                                                 Coord(parsed_score.dropcap_offset, 0),
+                                                                 width,
+                                                                 self.scoreStyleSheet['score'].leading,
+                                                                 self.scoreStyleSheet['score'].wordSpace)
+
+            # TODO: Dropcap space is wrong if this isn't called
+            if self.scoreStyleSheet['score'].alignment == TA_JUSTIFY and len(lines_list) > 1:
+                with self.tracer.span('line_justify', lines=len(lines_list)):
+                    lines_list: List[SyllableLine] = self.line_justify(lines_list, width, parsed_score.dropcap_offset)
+
+        return Score(lines_list, parsed_score.dropcap, width)
 
-        # TODO: Dropcap space is wrong if this isn't called
-        if self.scoreStyleSheet['score'].alignment == TA_JUSTIFY and len(lines_list) > 1:
-            lines_list: List[SyllableLine] = self.line_justify(lines_list, self.doc.width, dropcap_offset)
+    def layout_story(self, width: float) -> List[Flowable]:
+        """Lay out the parsed story for the passed width.
 
-        return Score(lines_list, dropcap, self.doc.width)
+        Other flowables are copied, since platypus marks flowables it has handled, and the
+        story may be built more than once.
+
+        If music elements are being streamed, they are parsed and laid out as platypus reaches them, and
+        can only be laid out once.
+
+        :param width: Width of a line (usually page width minus margins).
+        :return: A list of flowables, ready to be built into a document.
+        """
+        story = [self._layout_score(flowable, width) if isinstance(flowable, ParsedScore) else copy(flowable)
+                 for flowable in self.story]
+        if self._music_elements is None:
+            return story
+        return FlowableStream(chain(story, self._stream_flowables(width)))
+
+    def _stream_flowables(self, width: float) -> Iterator[Flowable]:
+        music_elements, self._music_elements = self._music_elements, None
+        story_length = len(self.story)
+        for music_elem in music_elements:
+            self.parse_music_element(music_elem)
+            # Hand the new flowables straight to layout, so the story doesn't grow
+            flowables = self.story[story_length:]
+            del self.story[story_length:]
+            for flowable in flowables:
+                yield self._layout_score(flowable, width) if isinstance(flowable, ParsedScore) else flowable
 
     def _parse_dropcap(self, dc_elem: Element) -> Dropcap:
         dropcap_style = self.scoreStyleSheet['dropcap']
@@ -363,7 +549,8 @@ class Kassia:
 
         neume_group_elem = syl_elem.find('neume-group')
         if neume_group_elem is not None:
-            neume_group = self._parse_neume_group(neume_group_elem)
+            with self.tracer.span('neume_group'):
+                neume_group = self._parse_neume_group(neume_group_elem)
 
         return Syllable(neume_chunk=neume_group, lyric=lyric)
 
@@ -381,7 +568,8 @@ class Kassia:
                      font_size=lyrics_style.fontSize,
                      color=lyrics_style.textColor,
                      top_margin=lyrics_style.spaceBefore,
-                     connector=attribs_from_bnml.get('con'))
+                     connector=attribs_from_bnml.get('con'),
+                     width=0)  # Measured with the rest of the score's lyrics, in _parse_score
 
     def _parse_neume_group(self, neume_group_elem: Element) -> NeumeChunk:
         """Read neume-group element in bnml and create NeumeChunk object.
@@ -422,9 +610,14 @@ class Kassia:
             elif neumebnml.category == NeumeType.martyria:
                 neume_type_style = self.scoreStyleSheet['neume-martyria']
 
+            # Neumes don't change once created, so one is shared by every chunk using the same glyph and style
+            neume_key = (neumebnml.name, neumebnml.category, font_family_name, neume_type_style)
             try:
-                neume = self.create_neume(neumebnml, font_lookup, neume_type_style)
+                neume = self._neumes.get(neume_key)
+                if neume is None:
+                    neume = self.create_neume(neumebnml, font_lookup, neume_type_style)
                 if neume:  # neume will be None if neume not found
+                    self._neumes[neume_key] = neume
                     neume_chunk.append(neume)
             except KeyError as ke:
                 logging.error("Couldn't add neume: {}. Check bnml for bad symbol and verify glyphnames.yaml is correct.".format(ke))
@@ -450,15 +643,108 @@ class Kassia:
                 neume_cat = NeumeType.secondary
         return NeumeBnml(neume_name_str, neume_cat)
 
-    def create_pdf(self):
+    def create_pdf(self, doc: ComplexDocTemplate = None):
+        if doc is None:
+            doc = self.doc
+        self.tracer.trace_pages(doc)
         try:
-            self.doc.build(self.story,
-                           onFirstPage=self.draw_header_footer,
-                           onEvenPages=self.draw_header_footer,
-                           onOddPages=self.draw_header_footer)
+            with self.tracer.span('build_pdf'):
+                doc.build(self.layout_story(doc.width),
+                          onFirstPage=self.draw_header_footer,
+                          onEvenPages=self.draw_header_footer,
+                          onOddPages=self.draw_header_footer)
         except IOError as ioerror:
             logging.error("Failed to save score. {}".format(ioerror))
 
+    def create_display_list(self, target: LayoutTarget = None) -> 'DisplayList':
+        """Lay out the document and record what would be drawn on each page, without writing a PDF.
+
+        :param target: Page size and margins to lay out for. Defaults to the bnml page layout.
+        :return: The display list, which can be replayed into a PDF or rasterized.
+        """
+        from kassia.display_list_canvas import DisplayListCanvas
+        doc = self._target_document(target, None) if target else self._new_document(None)
+        self.tracer.trace_pages(doc)
+        doc.build(self.layout_story(doc.width),
+                  onFirstPage=self.draw_header_footer,
+                  onEvenPages=self.draw_header_footer,
+                  onOddPages=self.draw_header_footer,
+                  canvasmaker=DisplayListCanvas)
+        return doc.canv.display_list
+
+    def create_svg(self, target: LayoutTarget = None) -> List[str]:
+        """Lay out the document and draw it as SVG.
+
+        :param target: Page size and margins to lay out for. Defaults to the bnml page layout.
+        :return: One SVG document per page.
+        """
+        from kassia.svg_writer import SvgWriter
+        return SvgWriter(self.create_display_list(target)).pages()
+
+    def write_svg(self, output_filename: str):
+        """Write the SVG pages to files. A single page is written to output_filename, several pages to
+        output_filename with the page number added (sample-1.svg, sample-2.svg, ...).
+        """
+        filenames = [output_filename]
+        if len(self.svg_pages) > 1:
+            stem = output_filename[:-4] if output_filename.lower().endswith('.svg') else output_filename
+            filenames = ['{}-{}.svg'.format(stem, page_number) for page_number in range(1, len(self.svg_pages) + 1)]
+        for filename, svg in zip(filenames, self.svg_pages):
+            try:
+                with open(filename, 'w', encoding='utf-8') as fp:
+                    fp.write(svg)
+            except IOError as ioerror:
+                logging.error("Failed to save score. {}".format(ioerror))
+
+    def render_targets(self, targets: List[LayoutTarget], parallel: bool = False):
+        """Lay out and write the parsed document once per target.
+
+        :param targets: Page sizes and margins to render the document for.
+        :param parallel: Whether to render targets in worker processes.
+        """
+        if parallel and len(targets) > 1:
+            # Forked workers inherit the registered fonts, spawned ones have to register them again
+            initializer = None if get_start_method() == 'fork' else find_and_register_fonts
+            with ProcessPoolExecutor(max_workers=len(targets),
+                                     initializer=initializer,
+                                     initargs=(self.use_system_fonts,)) as executor:
+                rendered = list(executor.map(self._render_target, targets))
+            for target, pdf_bytes in zip(targets, rendered):
+                self._write_output(target.output_file, pdf_bytes)
+        else:
+            for target in targets:
+                self.create_pdf(self._target_document(target, target.output_file))
+
+    def _render_target(self, target: LayoutTarget) -> bytes:
+        """Render a single target in memory. Used by worker processes, which get their own copy of the document.
+        """
+        pdf_stream = BytesIO()
+        self.create_pdf(self._target_document(target, pdf_stream))
+        return pdf_stream.getvalue()
+
+    @staticmethod
+    def _write_output(output_file, pdf_bytes: bytes):
+        if hasattr(output_file, 'write'):
+            output_file.write(pdf_bytes)
+        else:
+            with open(output_file, 'wb') as fp:
+                fp.write(pdf_bytes)
+
+    def _target_document(self, target: LayoutTarget, output_file) -> ComplexDocTemplate:
+        """Create a document template for a target, starting from the bnml page layout and metadata.
+        """
+        doc = self._new_document(output_file)
+        if target.paper_size is not None:
+            doc.set_pagesize(target.paper_size)
+        if target.page_margins is not None:
+            margins = {'top_margin': doc.topMargin,
+                       'bottom_margin': doc.bottomMargin,
+                       'left_margin': doc.leftMargin,
+                       'right_margin': doc.rightMargin}
+            margins.update(target.page_margins)
+            doc.set_margins(margins)
+        return doc
+
     def replace_neume_names(self, neume_group: List[NeumeBnml], font_lookup: Dict) -> List[NeumeBnml]:
         """Check for conditional neumes and replace them if necessary.
 
@@ -722,15 +1008,54 @@ class Kassia:
         return default_style
 
     def draw_header_footer(self, canvas, doc):
-        if doc.pageTemplate.id == 'Even':
-            self.draw_header(canvas, doc, self.header_even_paragraph, self.header_even_pagenum_style)
-            self.draw_footer(canvas, doc, self.footer_even_paragraph, self.footer_even_pagenum_style)
-        elif doc.pageTemplate.id == 'Odd':
-            self.draw_header(canvas, doc, self.header_odd_paragraph, self.header_odd_pagenum_style)
-            self.draw_footer(canvas, doc, self.footer_odd_paragraph, self.footer_odd_pagenum_style)
-        elif doc.pageTemplate.id == 'First':
-            self.draw_header(canvas, doc, self.header_first_paragraph, self.header_first_pagenum_style)
-            self.draw_footer(canvas, doc, self.footer_first_paragraph, self.footer_first_pagenum_style)
+        """Draws the header and footer for the page template (First, Even or Odd) of the current page.
+
+        Everything but the page number is the same on every page with the same template, so it is drawn once
+        into a PDF form, which is placed on each page. The page number is drawn live.
+        """
+        template_id = doc.pageTemplate.id
+        if template_id == 'Even':
+            header, header_pagenum_style = self.header_even_paragraph, self.header_even_pagenum_style
+            footer, footer_pagenum_style = self.footer_even_paragraph, self.footer_even_pagenum_style
+        elif template_id == 'Odd':
+            header, header_pagenum_style = self.header_odd_paragraph, self.header_odd_pagenum_style
+            footer, footer_pagenum_style = self.footer_odd_paragraph, self.footer_odd_pagenum_style
+        elif template_id == 'First':
+            header, header_pagenum_style = self.header_first_paragraph, self.header_first_pagenum_style
+            footer, footer_pagenum_style = self.footer_first_paragraph, self.footer_first_pagenum_style
+        else:
+            return
+
+        if not header and not footer:
+            return
+
+        with self.tracer.span('header_footer', template=template_id):
+            form_name = 'HeaderFooter' + template_id + self._header_footer_key(header, footer)
+            if not canvas.hasForm(form_name):
+                canvas.beginForm(form_name)
+                self.draw_header(canvas, doc, header, None)
+                self.draw_footer(canvas, doc, footer, None)
+                canvas.endForm()
+            canvas.doForm(form_name)
+
+            if header:
+                self._draw_page_number(canvas, doc, header.style, header_pagenum_style, self._header_y_pos(doc))
+            if footer:
+                self._draw_page_number(canvas, doc, footer.style, footer_pagenum_style, self._footer_y_pos(doc))
+
+    @staticmethod
+    def _header_footer_key(header: Paragraph or None, footer: Paragraph or None) -> str:
+        """A digest of the text and style of a header and footer, so that a header or footer that changes
+        partway through the document is drawn into a form of its own.
+        """
+        digest = hashlib.sha1()
+        for paragraph in (header, footer):
+            if paragraph:
+                style = paragraph.style
+                digest.update(repr((paragraph.text, style.name,
+                                    [(key, getattr(style, key)) for key in sorted(style.defaults)])).encode())
+            digest.update(b'\0')
+        return digest.hexdigest()
 
     def draw_header(self, canvas, doc, paragraph: Paragraph, pagenum_style: ParagraphStyle):
         """Draws the header onto the canvas.
@@ -753,28 +1078,9 @@ class Kassia:
                 doc.right,
                 doc.top)
 
-        canvas.setFont(style.fontName, style.fontSize)
-        canvas.setFillColor(style.textColor)
-
-        y_pos = doc.pagesize[1] - (doc.topMargin * 0.85)
-
-        if style.alignment == TA_LEFT:
-            x_pos = doc.left
-            canvas.drawString(x_pos, y_pos, paragraph.text)
-        elif style.alignment == TA_RIGHT:
-            x_pos = doc.right
-            canvas.drawRightString(x_pos, y_pos, paragraph.text)
-        elif style.alignment == TA_CENTER:
-            x_pos = doc.center
-            canvas.drawCentredString(x_pos, y_pos, paragraph.text)
-
-        if pagenum_style is not None:
-            if pagenum_style.alignment == TA_LEFT:
-                canvas.drawString(doc.left, y_pos, str(canvas.getPageNumber()))
-            elif pagenum_style.alignment == TA_RIGHT:
-                canvas.drawRightString(doc.right, y_pos, str(canvas.getPageNumber()))
-            elif pagenum_style.alignment == TA_CENTER:
-                canvas.drawCentredString(doc.center, y_pos, str(canvas.getPageNumber()))
+        y_pos = self._header_y_pos(doc)
+        self._draw_header_footer_text(canvas, doc, paragraph, y_pos)
+        self._draw_page_number(canvas, doc, style, pagenum_style, y_pos)
 
     def draw_footer(self, canvas, doc, paragraph: Paragraph, pagenum_style: ParagraphStyle):
         """Draws the footer onto the canvas.
@@ -796,11 +1102,24 @@ class Kassia:
                 doc.right,
                 doc.bottom)
 
+        y_pos = self._footer_y_pos(doc)
+        self._draw_header_footer_text(canvas, doc, paragraph, y_pos)
+        self._draw_page_number(canvas, doc, style, pagenum_style, y_pos)
+
+    @staticmethod
+    def _header_y_pos(doc) -> float:
+        return doc.pagesize[1] - (doc.topMargin * 0.85)
+
+    @staticmethod
+    def _footer_y_pos(doc) -> float:
+        return doc.bottomMargin / 2
+
+    @staticmethod
+    def _draw_header_footer_text(canvas, doc, paragraph: Paragraph, y_pos: float):
+        style = paragraph.style
         canvas.setFont(style.fontName, style.fontSize)
         canvas.setFillColor(style.textColor)
 
-        y_pos = doc.bottomMargin / 2
-
         if style.alignment == TA_LEFT:
             x_pos = doc.left
             canvas.drawString(x_pos, y_pos, paragraph.text)
@@ -811,13 +1130,27 @@ class Kassia:
             x_pos = doc.center
             canvas.drawCentredString(x_pos, y_pos, paragraph.text)
 
-        if pagenum_style is not None:
-            if pagenum_style.alignment == TA_LEFT:
-                canvas.drawString(doc.left, y_pos, str(canvas.getPageNumber()))
-            elif pagenum_style.alignment == TA_RIGHT:
-                canvas.drawRightString(doc.right, y_pos, str(canvas.getPageNumber()))
-            elif pagenum_style.alignment == TA_CENTER:
-                canvas.drawCentredString(doc.center, y_pos, str(canvas.getPageNumber()))
+    @staticmethod
+    def _draw_page_number(canvas, doc, style: ParagraphStyle, pagenum_style: ParagraphStyle, y_pos: float):
+        """Draws the page number in the font and color of the header or footer it belongs to.
+        """
+        if pagenum_style is None:
+            return
+
+        canvas.setFont(style.fontName, style.fontSize)
+        canvas.setFillColor(style.textColor)
+
+        if hasattr(canvas, 'draw_page_number'):
+            # Display lists keep the page number live, so pages can be numbered again when combined into a book
+            x_pos = {TA_LEFT: doc.left, TA_RIGHT: doc.right, TA_CENTER: doc.center}.get(pagenum_style.alignment)
+            if x_pos is not None:
+                canvas.draw_page_number(x_pos, y_pos, pagenum_style.alignment)
+        elif pagenum_style.alignment == TA_LEFT:
+            canvas.drawString(doc.left, y_pos, str(canvas.getPageNumber()))
+        elif pagenum_style.alignment == TA_RIGHT:
+            canvas.drawRightString(doc.right, y_pos, str(canvas.getPageNumber()))
+        elif pagenum_style.alignment == TA_CENTER:
+            canvas.drawCentredString(doc.center, y_pos, str(canvas.getPageNumber()))
 
     def line_break(self, syl_list: List[Syllable], starting_pos: Coord, line_width: int, line_spacing: int,
                    syl_spacing: int) -> List[SyllableLine]:
@@ -867,10 +1200,10 @@ class Kassia:
                 # center neume
                 adj_neume_pos = (syl.width - neume_width) / 2.
 
-            syl.neume_chunk_pos.x = cr.x + adj_neume_pos
-            syl.neume_chunk_pos.y = y_offset / 2.
-            syl.lyric_pos.x = cr.x + adj_lyric_pos
-            syl.lyric_pos.y = cr.y
+            syl.neume_x = cr.x + adj_neume_pos
+            syl.neume_y = y_offset / 2.
+            syl.lyric_x = cr.x + adj_lyric_pos
+            syl.lyric_y = cr.y
             cr.x += syl.width + syl_spacing
 
             if new_line:
@@ -904,7 +1237,7 @@ class Kassia:
             # Divide by number of chunks in line
             syl_spacing = space_remaining / len(line)
 
-            cr = Coord(0, 0)
+            x = 0
 
             for syl in line:
                 adj_lyric_pos, adj_neume_pos = 0, 0
@@ -926,10 +1259,10 @@ class Kassia:
                     # center neume
                     adj_neume_pos = (syl.width - neume_width) / 2.
 
-                syl.neume_chunk_pos.x = cr.x + adj_neume_pos
-                syl.lyric_pos.x = cr.x + adj_lyric_pos
+                syl.neume_x = x + adj_neume_pos
+                syl.lyric_x = x + adj_lyric_pos
 
-                cr.x += syl.width + syl_spacing
+                x += syl.width + syl_spacing
 
             # After first line (dropcap), set first line offset to zero
             first_line_x_offset = 0
@@ -983,15 +1316,63 @@ class Kassia:
 
 
 def main(argv):
-    if len(argv) == 1:
-        Kassia(argv[0])
-    elif len(argv) > 1:
-        Kassia(argv[0], argv[1])
+    # Imported here, since kassia.renderer imports this module
+    from kassia import book
+    from kassia.batch import print_summary, render_batch
+    from kassia.project_organizer import Project
+    from kassia.renderer import Renderer
+    from kassia.watch import Watcher
+
+    parser = argparse.ArgumentParser(description='Typeset BNML scores as PDF.')
+    parser.add_argument('inputs', nargs='+', metavar='input',
+                        help='BNML file, then optionally the PDF (or .svg) to write. With --output-dir, '
+                             'any number of BNML files, directories and glob patterns.')
+    parser.add_argument('-o', '--output-dir', help='Render every input into this directory, skipping unchanged ones')
+    parser.add_argument('-j', '--jobs', type=int,
+                        help='Worker processes for --output-dir and --book (default: number of CPUs)')
+    parser.add_argument('--force', action='store_true', help='With --output-dir or --book, render inputs even if unchanged')
+    parser.add_argument('--system-fonts', action='store_true', help='Also search the system for fonts')
+    parser.add_argument('-w', '--watch', action='store_true',
+                        help='Render again whenever the input or a font config changes, until interrupted')
+    parser.add_argument('--book', action='store_true',
+                        help='Render the scores of a project file (the input) into one PDF, with continuous page '
+                             'numbers, bookmarks and a table of contents')
+    parser.add_argument('--header', help='With --book, BNML header file for scores written as txt')
+    args = parser.parse_args(argv)
+
+    if args.output_dir:
+        start = time.perf_counter()
+        batch = render_batch(args.inputs, args.output_dir, args.jobs, args.force, args.system_fonts)
+        print_summary(batch, time.perf_counter() - start)
+        return 1 if any(job.error for job in batch) else 0
+
+    if len(args.inputs) > 2:
+        parser.error('Only one input and one output are allowed without --output-dir')
+    output_file = args.inputs[1] if len(args.inputs) > 1 else "examples/sample.pdf"
+
+    if args.book:
+        header = ''
+        if args.header:
+            with open(args.header, encoding='utf-8') as f:
+                header = f.read()
+        start = time.perf_counter()
+        cache_dir = None if args.force else book.default_cache_dir(output_file)
+        fragments = Project.from_file(args.inputs[0]).build_book(output_file, header, jobs=args.jobs,
+                                                                 use_system_fonts=args.system_fonts,
+                                                                 cache_dir=cache_dir)
+        book.print_summary(fragments, time.perf_counter() - start)
+        return 1 if any(fragment.error for fragment in fragments) else 0
+
+    renderer = Renderer(args.system_fonts)
+    if args.watch:
+        Watcher(args.inputs[0], output_file, renderer).run()
+    elif output_file.lower().endswith('.svg'):
+        Kassia(args.inputs[0], output_file, use_system_fonts=args.system_fonts, fonts=renderer.fonts)
+    else:
+        renderer.render(args.inputs[0], output_file)
+    return 0
 
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
-    if len(sys.argv) == 1:
-        logging.error("Input XML file required.")
-        sys.exit(1)
-    main(sys.argv[1:])
+    sys.exit(main(sys.argv[1:]))
@@ -1,5 +1,10 @@
+import copy
 import subprocess
 import io
+import re
+from functools import lru_cache
+from typing import Iterator, TextIO, Tuple
+from xml.etree.ElementTree import Element, SubElement, fromstring
 
 def tag(content: str, tag: str, params: dict = None) -> str:
 
@@ -34,6 +39,86 @@ def tag(content: str, tag: str, params: dict = None) -> str:
     return ''.join(output)
 
 
+def element(content: str, tag: str, params: dict = None, parent: Element = None) -> Element:
+
+    '''
+    The ElementTree counterpart of tag(). Content containing markup is parsed into child elements,
+    anything else becomes the element's text. Text and tails are never None, as Kassia expects strings
+    wherever parsed XML would have whitespace.
+
+    '''
+
+    elem = Element(tag, params or {}) if parent is None else SubElement(parent, tag, params or {})
+    elem.text = ''
+    elem.tail = ''
+
+    if '<' in content:
+        fragment = fromstring(f'<{tag}>{content}</{tag}>')
+        elem.text = fragment.text or ''
+        for child in fragment:
+            child.tail = child.tail or ''
+            elem.append(child)
+    else:
+        elem.text = content
+
+    return elem
+
+
+class BnmlWriter:
+
+    '''
+    Writes the same XML as tag(), element by element, to a text stream.
+
+    tag() indents the content of an element that contains markup by one tab per line, so a line ends up
+    indented once for every such element around it. The writer keeps that depth instead, and indents
+    each line once as it is written, so nothing is re-split and the whole document is never held in memory.
+
+    '''
+
+    def __init__(self, stream: TextIO) -> None:
+        self.stream = stream
+        self.depth = 0
+        self._indent = ''
+        self._started = False
+
+    def line(self, text: str):
+        if self._started:
+            self.stream.write('\n' + self._indent + text)
+        else:
+            self.stream.write(self._indent + text)
+            self._started = True
+
+    def text(self, content: str):
+        for line in content.split('\n'):
+            self.line(line)
+
+    def start(self, tag: str, params: dict = None):
+        param_list = [f' {k}="{v}"' for k,v in params.items()] if params else []
+        self.line(f"<{tag}{''.join(param_list)}>")
+        self.depth += 1
+        self._indent = '\t' * self.depth
+
+    def end(self, tag: str):
+        self.depth -= 1
+        self._indent = '\t' * self.depth
+        self.line(f'</{tag}>')
+
+    def element(self, content: str, tag: str, params: dict = None):
+
+        if '<' in content:
+            self.start(tag, params)
+            self.text(content)
+            self.end(tag)
+            return
+
+        param_list = [f' {k}="{v}"' for k,v in params.items()] if params else []
+        if not content:
+            self.line(f"<{tag}{''.join(param_list)}/>")
+        else:
+            content = content.replace('\n', '\n' + self._indent)
+            self.line(f"<{tag}{''.join(param_list)}>{content}</{tag}>")
+
+
 class Syllable:
 
     '''
@@ -52,14 +137,7 @@ class Syllable:
         
         neume_group = []
         for nm in self.neumes:
-            params = {}
-            if nm.startswith('m'):
-                params['type'] = 'martyria'
-
-            if nm.startswith('f'):
-                params['type'] = 'accidental'
-            
-            neume_render = tag(nm, 'neume', params)
+            neume_render = tag(nm, 'neume', self.neume_params(nm))
             neume_group.append(neume_render)
         neume_group = '\n'.join(neume_group)
         neume_group = tag(neume_group, 'neume-group')
@@ -69,6 +147,35 @@ class Syllable:
 
         return syllable
 
+    def neume_params(self, nm: str) -> dict:
+        params = {}
+        if nm.startswith('m'):
+            params['type'] = 'martyria'
+
+        if nm.startswith('f'):
+            params['type'] = 'accidental'
+
+        return params
+
+    def write_to(self, writer: BnmlWriter):
+        writer.start('syllable')
+        writer.element(self.text, 'lyric')
+        writer.start('neume-group')
+        for nm in self.neumes:
+            writer.element(nm, 'neume', self.neume_params(nm))
+        writer.end('neume-group')
+        writer.end('syllable')
+
+    def to_element(self) -> Element:
+        syllable = element('', 'syllable')
+        element(self.text, 'lyric', parent=syllable)
+
+        neume_group = element('', 'neume-group', parent=syllable)
+        for nm in self.neumes:
+            element(nm, 'neume', self.neume_params(nm), parent=neume_group)
+
+        return syllable
+
 class Score:
 
     '''
@@ -101,12 +208,30 @@ class Score:
             size: int = 30, 
             font_family: str = "KA New Stathis Martyria"
         ) -> str:
-        
-        lang = self.lang.upper()
 
         if self.mode is None:
             return ''
+
+        return tag(self.mode_content(size, font_family), 'para', params={'style':"h2"})
+
+    def write_mode_to(self, writer: BnmlWriter, size: int = 30, font_family: str = "KA New Stathis Martyria"):
+
+        if self.mode is None:
+            writer.line('')
+            return
+
+        writer.element(self.mode_content(size, font_family), 'para', params={'style':"h2"})
+
+    def mode_to_element(self, size: int = 30, font_family: str = "KA New Stathis Martyria") -> Element:
+
+        if self.mode is None:
+            return None
+
+        return element(self.mode_content(size, font_family), 'para', params={'style':"h2"})
+
+    def mode_content(self, size: int, font_family: str) -> str:
         
+        lang = self.lang.upper()
         
 
         mode_terms = {
@@ -143,9 +268,7 @@ class Score:
         if self.mode_base:
             content.append(self.mode_base)
 
-        output = tag('\n'.join(content), 'para', params={'style':"h2"})
-
-        return output
+        return '\n'.join(content)
 
 
     def render(self) -> str:
@@ -174,6 +297,24 @@ class Score:
 
         return rend
 
+    def write_to(self, writer: BnmlWriter):
+        writer.start('score')
+        if self.dropcap:
+            writer.element(self.syllables[0].text[0], 'dropcap')
+        for s in self.syllables:
+            s.write_to(writer)
+        writer.end('score')
+
+    def to_element(self) -> Element:
+        score = element('', 'score')
+
+        if self.dropcap:
+            element(self.syllables[0].text[0], 'dropcap', parent=score)
+
+        score.extend(s.to_element() for s in self.syllables)
+
+        return score
+
 class Paragraph:
 
     def __init__(self, content: str, style: str) -> None:
@@ -195,6 +336,12 @@ class Paragraph:
 
         return output
 
+    def write_to(self, writer: BnmlWriter):
+        writer.element(self.content, 'para', params={'style': self.style})
+
+    def to_element(self) -> Element:
+        return element(self.content, 'para', params={'style': self.style})
+
 class Music:
 
     '''
@@ -223,133 +370,293 @@ class Music:
     def render(
             self,
             render_title_martyria = True
-        ):
+        ) -> str:
 
-        music_content = []
+        output = io.StringIO()
+        self.write_to(BnmlWriter(output), render_title_martyria)
 
-        #hardcoding bottom page numbering. TODO: Develop a headers and footers infrastructure.
-        music_content.append(
-            tag(
-                tag(
-                    '',
-                    'page-number',
-                    {'align':'center'}
-                ),
-                'footer'
-            )
-        )
+        return output.getvalue()
 
+    def write_to(self, writer: BnmlWriter, render_title_martyria = True):
+
+        writer.start('bnml', params = {'bnml_version': self.bnml_version})
+        writer.text(self.header)
+        writer.start('music')
+
+        #hardcoding bottom page numbering. TODO: Develop a headers and footers infrastructure.
+        writer.start('footer')
+        writer.element('', 'page-number', {'align':'center'})
+        writer.end('footer')
 
         for object in self.objects:
             if isinstance(object, Score) and render_title_martyria:
-                music_content.append(object.render_mode())
-            
-            music_content.append(object.render())
-        
+                object.write_mode_to(writer)
 
+            object.write_to(writer)
 
-        content = []
-        content.append(self.header)
-        content.append(
-            tag(
-                '\n'.join(music_content),
-                'music'
-            )
-        )
+        writer.end('music')
+        writer.end('bnml')
+    
+    def to_element(
+            self,
+            render_title_martyria = True
+        ) -> Element:
 
-        output = tag('\n'.join(content), 'bnml', params = {'bnml_version': self.bnml_version})
+        '''
+        Build the same document as render(), as an ElementTree element that Kassia can lay out directly,
+        without writing and re-parsing XML text.
+        '''
+
+        bnml = copy.deepcopy(_header_element(self.header))
+        bnml.set('bnml_version', self.bnml_version)
+
+        music = element('', 'music', parent=bnml)
+        footer = element('', 'footer', parent=music)
+        element('', 'page-number', {'align':'center'}, parent=footer)
+
+        for object in self.objects:
+            music.extend(self.object_elements(object, render_title_martyria))
+
+        return bnml
+
+    def object_elements(self, object, render_title_martyria = True) -> Iterator[Element]:
+
+        '''
+        The music elements of a score or paragraph: its mode heading, if any, then the object itself.
+        '''
+
+        if isinstance(object, Score) and render_title_martyria and object.mode is not None:
+            yield object.mode_to_element()
+
+        yield object.to_element()
 
-        return output
-    
     def write_to_file(self, output_file: str):
         with open(output_file, 'wb') as f:
-            f.write(self.render().encode())
+            self.write(f)
 
     def write(self, buffer):
-        buffer.write(self.render().encode())
 
+        '''
+        Stream the BNML to a binary buffer (a file, socket file or BytesIO), one element at a time.
+        '''
 
-def score_from_txt(raw_score:str):
+        stream = io.TextIOWrapper(buffer, encoding='utf-8', newline='')
+        try:
+            self.write_to(BnmlWriter(stream))
+            stream.flush()
+        finally:
+            stream.detach()
 
-    to_clean = [' ', '\n', '\t']
-    for char in to_clean:
-        raw_score = raw_score.replace(char, '')
 
-    raw_params = raw_score.split('(')[1:]
-    raw_params = [p[:p.find(')')] for p in raw_params]
-    params = {v.split(':')[0]:v.split(':')[1] for v in raw_params}
-    
-    split = raw_score.split('[')
-    split = split[1:]
-    groups = [i[:i.find(']')] for i in split]
+@lru_cache(maxsize=16)
+def _header_element(header: str) -> Element:
 
-    syls = []
-    for s in groups:
-        s = s.split(':')
-        lyr = s[0]
-        neumes = s[1]
-        syl = Syllable(lyr, neumes)
-        syls.append(syl)
+    '''
+    A bnml element holding the parsed header, kept so that a header used for every preview is parsed once.
+    Copy it before adding to it.
+    '''
 
-    base = params.get('base')
-    mode = params.get('mode')
-    lang = params.get('lang', 'EN')
-    dropcap = params.get('dropcap', 'True').lower() == 'true'
+    return element(header, 'bnml')
 
-    if isinstance(mode, str) and mode.isdigit():
-        mode = int(mode)
 
-    score = Score(syls, mode = mode, dropcap = dropcap, mode_base=base, lang=lang)
+class TxtSyntaxError(ValueError):
 
-    return score
+    '''
+    A mistake in a txt score, with the line and column (both from 1) where it was found.
+    '''
 
-def para_from_txt(raw_para:str):
+    def __init__(self, message: str, line: int, column: int) -> None:
+        super().__init__(f'{message} (line {line}, column {column})')
+        self.line = line
+        self.column = column
 
-    # to_clean = [' ', '\n', '\t']
-    # for char in to_clean:
-    #     raw_para = raw_para.replace(char, '')
 
-    
-    raw_params = raw_para.split('(')[1:]
-    raw_params = [p[:p.find(')')].strip() for p in raw_params]
-    params = {v.split(':')[0].strip():v.split(':')[1].strip() for v in raw_params}
-    
-    content = raw_para.split(')')[-1].strip()
+_SPACE = re.compile(r'\s*')
 
-    style = params.get('style')
-    if style is None:
-        style =params.get('s')
 
-    # print(style)
+class TxtParser:
 
-    para = Paragraph(
-        content = content,
-        style = style
-    )
+    '''
+    Reads the txt score format in a single scan:
 
-    return para
+        (key: value)            a parameter of the current object
+        [lyric: neume-neume]    a syllable of a score
+        ---                     the separator between objects
 
-def music_from_txt(raw_music: str, header: str, separator: str = '---'):
+    An object with an `s` or `style` parameter is a paragraph, whose text is everything after its
+    parameters up to the next separator. Any other object is a score. Objects are built as they are
+    reached, so iterating the parser yields them one at a time.
+    '''
 
-    music = Music(header)
-    raw_objects = raw_music.split(separator)
+    def __init__(self, text: str, separator: str = '---', first_line: int = 1, first_column: int = 1) -> None:
+        self.text = text
+        self.separator = separator
+        self.pos = 0
+        self.first_line = first_line  # Where the text starts in the document, for error positions
+        self.first_column = first_column
+        separator_token = f'|(?P<separator>{re.escape(separator)})' if separator else ''
+        # Syllables without whitespace inside the lyric or neumes are matched first, as they need no cleaning
+        self._token = re.compile(r'\s*(?:\[\s*(?P<lyric>[^\]:\s]*)\s*:\s*(?P<neumes>[^\]\s]*)\s*\]'
+                                 r'|\[(?P<spaced_lyric>[^\]:]*):(?P<spaced_neumes>[^\]]*)\]'
+                                 r'|\((?P<key>[^):]*):(?P<value>[^)]*)\)'
+                                 + separator_token + r'|(?P<other>\S)|\Z)')
+
+    def __iter__(self) -> Iterator:
+        while self.pos < len(self.text):
+            obj = self.parse_object()
+            if obj is not None:
+                yield obj
+
+    def parse_object(self, kind: str = None):
+
+        '''
+        Parse the object at the current position, and move past its separator.
+
+        :param kind: 'score' or 'para' to read the object as that kind whatever its parameters are.
+        :return: A Score or Paragraph, or None if the object is empty.
+        '''
+
+        text, separator = self.text, self.separator
+        start = self.pos
+        params = {}
+        syllables = []
+        content = None
+        is_para = kind == 'para'
+
+        pos = start
+        next_token = self._token.match
+        while True:
+            match = next_token(text, pos)
+            token = match.lastgroup
+            if token == 'neumes' and not is_para:
+                syllables.append(Syllable(*match.group('lyric', 'neumes')))
+            elif token == 'spaced_neumes' and not is_para:
+                lyric, neumes = match.group('spaced_lyric', 'spaced_neumes')
+                syllables.append(Syllable(''.join(lyric.split()), ''.join(neumes.split())))
+            elif token is None:  # End of text
+                pos = match.end()
+                break
+            elif token == 'value':
+                key, value = match.group('key', 'value')
+                params[''.join(key.split())] = ' '.join(value.split())
+                is_para = kind == 'para' or (kind is None and ('s' in params or 'style' in params))
+            elif is_para and token != 'separator':
+                # The text runs to the next separator, whatever it contains
+                pos = _SPACE.match(text, pos).end()
+                end = text.find(separator, pos) if separator else -1
+                end = len(text) if end < 0 else end
+                content = text[pos:end].strip()
+                match = next_token(text, end)
+            elif token == 'other':
+                self._unexpected(match.start(token))
+            pos = match.end()
+            if match.lastgroup == 'separator':
+                break
+
+        self.pos = pos
+
+        if is_para:
+            style = params.get('style')
+            if style is None:
+                style = params.get('s')
+            return Paragraph(content=content or '', style=style)
+
+        if not syllables:
+            if params or kind == 'score':
+                self.error('Score has no syllables', start)
+            return None
+
+        mode = params.get('mode')
+        if isinstance(mode, str) and mode.isdigit():
+            mode = int(mode)
+        dropcap = params.get('dropcap', 'True').lower() == 'true'
+
+        return Score(syllables, mode = mode, dropcap = dropcap, mode_base=params.get('base'),
+                     lang=params.get('lang', 'EN'))
+
+    def _unexpected(self, pos: int):
+        text = self.text
+        char = text[pos]
+        if char in '([':
+            closing = ')' if char == '(' else ']'
+            end = text.find(closing, pos + 1)
+            if end < 0:
+                self.error(f'{char!r} is never closed', pos)
+            if char == '(':
+                self.error('Parameter needs a "key: value" pair', pos + 1)
+            self.error('Syllable needs a "lyric: neumes" pair', pos + 1)
+        self.error(f'Unexpected {char!r} in score', pos)
+
+    def error(self, message: str, pos: int):
+        line_start = self.text.rfind('\n', 0, pos)
+        if line_start < 0:
+            raise TxtSyntaxError(message, self.first_line, self.first_column + pos)
+        raise TxtSyntaxError(message, self.first_line + self.text.count('\n', 0, pos), pos - line_start)
+
+
+def iter_txt(raw_music: str, separator: str = '---') -> Iterator:
 
-    for raw_obj in raw_objects:
+    '''
+    Yield the scores and paragraphs of a txt score, one at a time.
+    '''
+
+    return iter(TxtParser(raw_music, separator))
+
+
+def section_at(raw_music: str, position: int, separator: str = '---') -> Tuple[int, int]:
+
+    '''
+    Get the start and end of the section (score or paragraph) of a txt score that position is in: the
+    text between the separators around it.
+    '''
 
-        # extract metadata
-        # TODO: Make more robust
-        raw_params = raw_obj.split('(')[1:]
-        raw_params = [p[:p.find(')')].strip() for p in raw_params]
-        params = {v.split(':')[0]:v.split(':')[1] for v in raw_params}
+    start = raw_music.rfind(separator, 0, position)
+    start = 0 if start < 0 else start + len(separator)
+    end = raw_music.find(separator, max(position - len(separator) + 1, start))  # Or the separator it is in
+    return start, len(raw_music) if end < 0 else end
 
-        if 's' in params.keys() or 'style' in params.keys():
-            obj_type = 'para'
-            obj = para_from_txt(raw_obj)
+
+def iter_txt_stream(stream: TextIO, separator: str = '---', chunk_size: int = 1 << 16) -> Iterator:
+
+    '''
+    Yield the scores and paragraphs of a txt score as it is read from a text stream. Each section is
+    parsed as soon as the separator after it has been read, so only one section is held at a time.
+    '''
+
+    pending = ''
+    line, column = 1, 1  # Position of the start of pending in the document
+    while True:
+        chunk = stream.read(chunk_size)
+        search_from = max(0, len(pending) - len(separator) + 1)
+        pending += chunk
+        end = pending.rfind(separator, search_from) if chunk else len(pending)
+        if end < 0:
+            continue
+
+        yield from TxtParser(pending[:end], separator, line, column)
+        if not chunk:
+            return
+
+        consumed = end + len(separator)
+        newlines = pending.count('\n', 0, consumed)
+        if newlines:
+            line += newlines
+            column = consumed - pending.rfind('\n', 0, consumed)
         else:
-            obj_type = 'score'
-            obj = score_from_txt(raw_obj)
+            column += consumed
+        pending = pending[consumed:]
+
+
+def score_from_txt(raw_score:str):
+    return TxtParser(raw_score, separator=None).parse_object('score')
+
+def para_from_txt(raw_para:str):
+    return TxtParser(raw_para, separator=None).parse_object('para')
 
+def music_from_txt(raw_music: str, header: str, separator: str = '---'):
+
+    music = Music(header)
+    for obj in iter_txt(raw_music, separator):
         music.add_object(obj)
 
     return music
-
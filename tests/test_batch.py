@@ -0,0 +1,36 @@
+import os
+import shutil
+
+from kassia.batch import render_batch
+
+
+def test_batch_skips_unchanged(tmp_path):
+    inputs = tmp_path / 'in'
+    inputs.mkdir()
+    for name in ['dash_test.xml', 'paragraph_test.xml']:
+        shutil.copy('tests/' + name, inputs / name)
+    output_dir = str(tmp_path / 'out')
+
+    first = render_batch([str(inputs)], output_dir, jobs=1)
+    assert [job.skipped for job in first] == [False, False]
+    assert all(job.error is None for job in first)
+    assert (tmp_path / 'out' / 'dash_test.pdf').exists()
+
+    with open(inputs / 'paragraph_test.xml', 'a') as f:
+        f.write('\n')
+    second = render_batch([str(inputs)], output_dir, jobs=1)
+    assert {job.input_path.split('/')[-1]: job.skipped for job in second} == {'dash_test.xml': True,
+                                                                              'paragraph_test.xml': False}
+
+
+def test_batch_reports_clashing_outputs(tmp_path):
+    for directory in ['a', 'b']:
+        (tmp_path / directory).mkdir()
+        shutil.copy('tests/dash_test.xml', tmp_path / directory / 'score.xml')
+    shutil.copy('tests/paragraph_test.xml', tmp_path / 'a' / 'other.xml')
+
+    batch = render_batch([str(tmp_path / '*' / '*.xml')], str(tmp_path / 'out'), jobs=1)
+    errors = {os.path.relpath(job.input_path, tmp_path): job.error for job in batch}
+    assert errors['a/other.xml'] is None
+    assert 'b/score.xml' in errors['a/score.xml'] and 'a/score.xml' in errors['b/score.xml']
+    assert not (tmp_path / 'out' / 'score.pdf').exists()
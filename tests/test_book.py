@@ -0,0 +1,93 @@
+from io import BytesIO
+
+import fitz
+import pytest
+from reportlab import rl_config
+
+from kassia import book
+from kassia.display_list_canvas import DisplayListCanvas
+from kassia.project_organizer import Project, ScoreSession
+from kassia.renderer import Renderer
+from kassia_main import Kassia
+
+
+def test_book_numbers_pages_continuously(monkeypatch):
+    monkeypatch.setattr(rl_config, 'invariant', 1)
+    project = Project({'title': 'Book'}, [ScoreSession('Vespers', bnml_path='examples/sample.xml'),
+                                          ScoreSession('Dashes', bnml_path='tests/dash_test.xml'),
+                                          ScoreSession('Headers', bnml_path='tests/header_footer_test.xml')])
+    pdf = BytesIO()
+    fragments = project.build_book(pdf, jobs=1)
+
+    assert [fragment.error for fragment in fragments] == [None, None, None]
+    page_number = 2  # After the table of contents
+    for fragment in fragments:
+        assert fragment.first_page_number == page_number
+        assert fragment.laid_out_as % 2 == page_number % 2
+        page_number += fragment.page_count
+    assert pdf.getvalue().count(b"/Type /Page\n") == page_number - 1
+    assert b"/Outlines" in pdf.getvalue()
+
+
+def test_book_reuses_unchanged_fragments(monkeypatch, tmp_path):
+    monkeypatch.setattr(rl_config, 'invariant', 1)
+    (tmp_path / 'dashes.xml').write_bytes(open('tests/dash_test.xml', 'rb').read())
+    project = Project({'title': 'Book'}, [ScoreSession('Vespers', bnml_path='examples/sample.xml'),
+                                          ScoreSession('Dashes', bnml_path=str(tmp_path / 'dashes.xml')),
+                                          ScoreSession('Headers', bnml_path='tests/header_footer_test.xml')])
+    cache_dir = str(tmp_path / 'cache')
+    cold, warm = BytesIO(), BytesIO()
+    project.build_book(cold, jobs=1, cache_dir=cache_dir)
+    with monkeypatch.context() as patch:
+        patch.setattr(book, 'ProcessPoolExecutor', None)  # Nothing to lay out, so no pool is started
+        fragments = project.build_book(warm, jobs=2, cache_dir=cache_dir)
+    assert [fragment.cached for fragment in fragments] == [True, True, True]
+    assert warm.getvalue() == cold.getvalue()
+
+    (tmp_path / 'dashes.xml').write_bytes(open('tests/dash_test.xml', 'rb').read().replace(b'</bnml>', b' </bnml>'))
+    fragments = project.build_book(BytesIO(), jobs=1, cache_dir=cache_dir)
+    assert [fragment.cached for fragment in fragments] == [True, False, True]
+    assert len(list((tmp_path / 'cache').iterdir())) == 3
+
+
+def test_replayed_page_numbers_continue():
+    display_list = Kassia("tests/header_footer_test.xml", None, output_format='display_list').display_list
+    canvas = DisplayListCanvas(None)
+    display_list.replay(canvas)
+    display_list.replay(canvas)
+    canvas.save()
+
+    book = canvas.display_list
+    last_page = book.pages[2 * len(display_list) - 1]
+    assert str(2 * len(display_list)) in [book.strings[i] for i in last_page['text'] if i >= 0]
+
+
+def test_move_score():
+    scores = [ScoreSession(title) for title in 'abc']
+    project = Project(scores=list(scores))
+    project.move_score(scores[0], 1)
+    project.move_score(scores[2], -5)
+    assert [score.title for score in project.scores] == ['c', 'b', 'a']
+
+
+def _assert_same_text(actual: bytes, expected: bytes):
+    """Check that two PDFs draw the same text spans, in the same fonts, at the same positions on each page."""
+    def spans(pdf):
+        return [[(span['font'], span['text'], span['origin'])
+                 for block in page.get_text('dict')['blocks'] for line in block.get('lines', [])
+                 for span in line['spans']]
+                for page in fitz.open(stream=pdf, filetype='pdf')]
+
+    actual, expected = spans(actual), spans(expected)
+    assert [[span[:2] for span in page] for page in actual] == [[span[:2] for span in page] for page in expected]
+    # Positions are written to the PDFs rounded, and differently
+    actual_coords = [coord for page in actual for span in page for coord in span[2]]
+    assert actual_coords == pytest.approx([coord for page in expected for span in page for coord in span[2]], abs=0.01)
+
+
+def test_one_score_book_matches_score():
+    # sampleOut has paragraphs that mix fonts, and characters its text font has no glyph for
+    project = Project({'title': 'Book'}, [ScoreSession('Out', bnml_path='examples/sampleOut.xml')])
+    pdf = BytesIO()
+    project.build_book(pdf, jobs=1, toc=False)
+    _assert_same_text(pdf.getvalue(), Renderer().render('examples/sampleOut.xml'))
@@ -0,0 +1,12 @@
+import music_parser as prs
+from benchmarks.corpus import CorpusGenerator, write_bnml, write_txt
+
+
+def test_corpus_is_seeded_and_txt_matches_bnml(tmp_path):
+    music = CorpusGenerator(seed=7, complexity=1).music(scores=3, syllables_per_score=50)
+    assert music.render() == CorpusGenerator(seed=7, complexity=1).music(scores=3, syllables_per_score=50).render()
+
+    write_txt(music, str(tmp_path / 'corpus.txt'))
+    write_bnml(music, str(tmp_path / 'corpus.xml'), headers=False)
+    reparsed = prs.music_from_txt((tmp_path / 'corpus.txt').read_text(encoding='utf-8'), music.header)
+    assert reparsed.render() == music.render() == (tmp_path / 'corpus.xml').read_text(encoding='utf-8')
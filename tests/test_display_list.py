@@ -0,0 +1,54 @@
+from glob import glob
+from io import BytesIO
+
+import fitz
+import pytest
+
+from kassia.display_list import GLYPHS, LINE, DisplayList
+from kassia.display_list_canvas import DisplayListCanvas
+from kassia.renderer import Renderer
+from kassia_main import Kassia
+
+
+def test_display_list_records_pages():
+    display_list = Kassia("tests/underscore_test.xml", BytesIO()).create_display_list()
+    assert len(display_list) == 3  # On letter paper, as its page layout asks
+    ops = display_list.pages[0]
+    assert (ops['op'] == GLYPHS).any()
+    assert (ops['op'] == LINE).any()
+
+
+def test_replay_matches_layout():
+    display_list = Kassia("tests/dash_test.xml", BytesIO()).create_display_list()
+    replay_canvas = DisplayListCanvas(None)
+    display_list.replay(replay_canvas)
+    replay_canvas.save()
+    assert display_list.diff(replay_canvas.display_list) == []
+
+    saved = BytesIO()
+    display_list.save(saved)
+    saved.seek(0)
+    assert display_list.diff(DisplayList.load(saved)) == []
+
+
+def _assert_same_text(actual: bytes, expected: bytes):
+    """Check that two PDFs draw the same text spans, in the same fonts, at the same positions on each page."""
+    def spans(pdf):
+        return [[(span['font'], span['text'], span['origin'])
+                 for block in page.get_text('dict')['blocks'] for line in block.get('lines', [])
+                 for span in line['spans']]
+                for page in fitz.open(stream=pdf, filetype='pdf')]
+
+    actual, expected = spans(actual), spans(expected)
+    assert [[span[:2] for span in page] for page in actual] == [[span[:2] for span in page] for page in expected]
+    # Positions are written to the PDFs rounded, and differently
+    actual_coords = [coord for page in actual for span in page for coord in span[2]]
+    assert actual_coords == pytest.approx([coord for page in expected for span in page for coord in span[2]], abs=0.01)
+
+
+@pytest.mark.parametrize('source', sorted(glob('examples/*.xml')))
+def test_replayed_pdf_matches_direct(source):
+    renderer = Renderer()
+    replayed = BytesIO()
+    renderer.layout(source).write_pdf(replayed)
+    _assert_same_text(replayed.getvalue(), renderer.render(source))
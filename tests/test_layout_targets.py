@@ -0,0 +1,48 @@
+from io import BytesIO
+
+import pytest
+
+from reportlab import rl_config
+
+from kassia.complex_doc_template import ComplexDocTemplate
+from kassia.layout_target import LayoutTarget
+from kassia_main import Kassia
+
+
+def test_targets_use_own_page_size():
+    letter, phone = BytesIO(), BytesIO()
+    Kassia("tests/dash_test.xml", targets=[LayoutTarget(letter, 'letter'),
+                                           LayoutTarget(phone, (300, 560), {'left_margin': 20, 'right_margin': 20})])
+    assert b"/MediaBox [ 0 0 612 792 ]" in letter.getvalue()
+    assert b"/MediaBox [ 0 0 300 560 ]" in phone.getvalue()
+    assert phone.getvalue().count(b"/Type /Page\n") > letter.getvalue().count(b"/Type /Page\n")
+
+
+def test_parallel_targets_match_serial(monkeypatch):
+    # No timestamps or random IDs, so the PDFs can be compared. Spawned workers read it from the environment.
+    monkeypatch.setattr(rl_config, 'invariant', 1)
+    monkeypatch.setenv('RL_invariant', '1')
+    serial, parallel = [BytesIO(), BytesIO()], [BytesIO(), BytesIO()]
+    Kassia("tests/dash_test.xml", targets=[LayoutTarget(serial[0], 'A4'), LayoutTarget(serial[1], (300, 560))])
+    Kassia("tests/dash_test.xml", targets=[LayoutTarget(parallel[0], 'A4'), LayoutTarget(parallel[1], (300, 560))],
+           parallel=True)
+    for serial_pdf, parallel_pdf in zip(serial, parallel):
+        assert serial_pdf.getvalue() == parallel_pdf.getvalue()
+
+
+@pytest.mark.parametrize('pagesize', ['landscape', 'portrait', 'nonsense', (300,), ('a', 'b')])
+def test_bad_page_sizes_rejected(pagesize):
+    with pytest.raises(ValueError):
+        ComplexDocTemplate(BytesIO()).set_pagesize(pagesize)
+
+
+def test_page_size_by_name_matches_set_pagesize():
+    doc = ComplexDocTemplate(BytesIO())
+    doc.set_pagesize_by_name('a5')
+    assert doc.pagesize == (419.52755905511816, 595.2755905511812)
+    doc.set_pagesize_by_name('landscape')  # Not a size, so it is left as it was
+    assert doc.pagesize == (419.52755905511816, 595.2755905511812)
+
+    pdf = BytesIO()
+    Kassia("tests/dash_test.xml", pdf)  # Its page layout asks for letter
+    assert b"/MediaBox [ 0 0 612 792 ]" in pdf.getvalue()
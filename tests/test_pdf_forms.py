@@ -0,0 +1,38 @@
+from io import BytesIO
+from xml.etree.ElementTree import fromstring
+
+import fitz
+from reportlab import rl_config
+from reportlab.pdfgen.canvas import Canvas
+
+from kassia_main import Kassia
+
+
+def test_reportlab_private_attributes():
+    # PdfWriter writes runs without measuring them through _textOut, and DisplayListCanvas reads the page size
+    # from _pagesize. If this fails, the ReportLab pinned in requirements.txt was changed, and they need updating.
+    canvas = Canvas(BytesIO(), pagesize=(300, 560))
+    assert canvas._pagesize == (300, 560), "Canvas._pagesize is gone"
+    text = canvas.beginText()
+    text._textOut('abc')
+    assert '(abc) Tj' in text.getCode(), "PDFTextObject._textOut is gone"
+
+
+def test_header_footer_drawn_once_per_template():
+    pdf = BytesIO()
+    Kassia("tests/header_footer_test.xml", pdf)
+    assert pdf.getvalue().count(b"/Type /Page\n") == 5
+    assert 0 < pdf.getvalue().count(b"/Subtype /Form") <= 3
+
+
+def test_header_change_gets_new_form(monkeypatch):
+    monkeypatch.setattr(rl_config, 'invariant', 1)
+    bnml = fromstring('<bnml><music><header>Header A</header><para>Page 1</para></music></bnml>')
+    # Page 3 is longer than the stream's lookahead, so Header B is parsed after page 2 is drawn
+    streamed = ['<pagebreak/>', '<para>Page 2</para>', '<pagebreak/>'] + ['<para>Page 3</para>'] * 20
+    streamed += ['<header>Header B</header>', '<pagebreak/>', '<para>Page 4</para>']
+    pdf = BytesIO()
+    Kassia(bnml, pdf, music_elements=(fromstring(elem) for elem in streamed))
+    pages = [page.get_text() for page in fitz.open(stream=pdf.getvalue(), filetype='pdf')]
+    assert len(pages) == 4
+    assert 'Header A' in pages[1] and 'Header B' in pages[3]  # Both even pages
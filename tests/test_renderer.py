@@ -0,0 +1,53 @@
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import pytest
+
+from reportlab import rl_config
+from reportlab.pdfbase.ttfonts import TTFont, TTFontFile
+
+from kassia.font_reader import LazyTTFont
+from kassia.renderer import Renderer
+from kassia_main import Kassia
+
+
+def test_render_matches_kassia(monkeypatch):
+    monkeypatch.setattr(rl_config, 'invariant', 1)
+    kassia_pdf = BytesIO()
+    Kassia('tests/dash_test.xml', kassia_pdf)
+    assert Renderer().render('tests/dash_test.xml') == kassia_pdf.getvalue()
+
+
+def test_renders_dont_share_state(monkeypatch):
+    monkeypatch.setattr(rl_config, 'invariant', 1)
+    renderer = Renderer()
+    first = renderer.render('tests/paragraph_test.xml')
+    renderer.render('examples/sample.xml')
+    assert renderer.render('tests/paragraph_test.xml') == first
+
+
+def test_renderers_keep_first_font_search():
+    Renderer()
+    with pytest.raises(RuntimeError):
+        Renderer(use_system_fonts=True)  # Would register fonts while other renderers may be running
+
+
+def test_layout_pages():
+    assert len(Renderer().layout('tests/dash_test.xml')) >= 1
+
+
+def test_threaded_renders_match_serial(monkeypatch):
+    monkeypatch.setattr(rl_config, 'invariant', 1)
+    renderer = Renderer()
+    sources = ['tests/dash_test.xml', 'tests/paragraph_test.xml', 'examples/sample.xml', 'tests/martyria_test.xml'] * 2
+    serial = [renderer.render(source) for source in sources]
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        assert list(executor.map(renderer.render, sources)) == serial
+
+
+def test_fonts_are_parsed_when_used():
+    path = 'kassia/fonts/Alegreya-2_008/Alegreya-Bold.ttf'
+    lazy = LazyTTFont('Lazy Alegreya', path, TTFontFile(path).name)
+    assert lazy.face._face is None
+    assert lazy.stringWidth('Lord', 14) == TTFont('Eager Alegreya', path).stringWidth('Lord', 14)
+    assert lazy.face.name == lazy.face._face.name
@@ -0,0 +1,41 @@
+import pytest
+import ruyaml
+from reportlab.lib.fonts import ps2tt, tt2ps
+
+from kassia import startup
+from kassia.font_reader import LOCAL_FONT_DIR, find_and_register_fonts, _get_neume_dict, _Snapshot
+from kassia.renderer import Renderer
+
+
+def test_font_configs_load_from_snapshot(tmp_path, monkeypatch):
+    monkeypatch.setenv('KASSIA_CACHE_DIR', str(tmp_path))
+    configs = _get_neume_dict(LOCAL_FONT_DIR)
+    assert (tmp_path / 'startup-snapshot.json').exists()
+
+    def fail(*args, **kwargs):
+        raise AssertionError('YAML parsed although the snapshot is up to date')
+
+    monkeypatch.setattr(ruyaml, 'YAML', fail)
+    assert _get_neume_dict(LOCAL_FONT_DIR) == configs
+    assert not _Snapshot.read().changed
+
+
+def test_parse_import_times():
+    output = ('import time: self [us] | cumulative | imported package\n'
+              'import time:      1000 |       1000 |     reportlab.lib\n'
+              'import time:      2000 |       3000 |   reportlab\n'
+              'import time:       500 |        500 | fastapi\n')
+    assert startup.parse_import_times(output) == [('reportlab', 0.003), ('fastapi', 0.0005)]
+
+
+def test_warm_up_renders():
+    startup.warm_up(Renderer())
+
+
+@pytest.mark.parametrize('family', ['EB Garamond', 'Alegreya', 'Alegreya SC'])
+def test_families_map_to_their_named_styles(family):
+    find_and_register_fonts()
+    family = family.encode()
+    assert [tt2ps(family, bold, italic) for bold in (0, 1) for italic in (0, 1)] == [
+        '{}-{}'.format(family.decode(), style) for style in ['Regular', 'Italic', 'Bold', 'Bold Italic']]
+    assert ps2tt(family.decode() + '-Medium') == (family.lower(), 0, 0)  # Drawn as the regular face, as before
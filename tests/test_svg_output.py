@@ -0,0 +1,34 @@
+import re
+
+import fitz
+
+from kassia.renderer import Renderer
+
+from kassia_main import Kassia
+
+
+def test_svg_page_per_pdf_page():
+    kassia = Kassia("tests/dash_test.xml", None, output_format='svg')
+    assert len(kassia.svg_pages) == 2
+    assert all(svg.startswith('<svg ') and svg.endswith('</svg>') for svg in kassia.svg_pages)
+
+
+def test_glyphs_defined_once():
+    svg = Kassia("tests/fthora_test.xml", None, output_format='svg').svg_pages[0]
+    symbol_ids = re.findall(r'<symbol id="([^"]+)"', svg)
+    uses = re.findall(r'<use href="#([^"]+)"', svg)
+    assert len(symbol_ids) == len(set(symbol_ids))
+    assert set(uses) == set(symbol_ids)
+    assert len(uses) > len(symbol_ids)
+
+
+def test_glyphs_placed_as_in_pdf():
+    # The mode keys of sampleOut draw a martyria sign after text with characters its font has no glyph for
+    svg = Kassia("examples/sampleOut.xml", None, output_format='svg').svg_pages[0]
+    runs = {(float(x), float(y)) for x, y in re.findall(r'<g transform="translate\(([\d.]+) ([\d.]+)\)', svg)}
+    page = fitz.open(stream=Renderer().render('examples/sampleOut.xml'), filetype='pdf')[0]
+    martyria = [span['origin'] for block in page.get_text('dict')['blocks'] for line in block.get('lines', [])
+                for span in line['spans'] if 'Martyria' in span['font']]
+    assert martyria
+    for x, y in martyria:
+        assert (round(x, 2), round(y, 2)) in runs
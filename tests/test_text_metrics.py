@@ -0,0 +1,22 @@
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+
+from kassia import text_metrics
+from kassia.font_reader import find_and_register_fonts
+
+
+def test_widths_match_reportlab():
+    find_and_register_fonts()
+    texts = ['Lord', '', 'Господи', 'воз҅звахъ', '\U0001F600', 'a b', 'Gentium widths are fractions of 1/1000 em' * 20]
+    for font_name in ['Alegreya-Medium', 'Gentium Plus-Regular', 'Gentium Book Plus-Italic', 'Helvetica']:
+        expected = [pdfmetrics.stringWidth(text, font_name, 14) for text in texts]
+        assert text_metrics.string_widths(texts, font_name, 14) == expected
+    assert text_metrics.measure([('Lord', 'Alegreya-Medium', 14), ('Lord', 'Helvetica', 12), ('', 'Helvetica', 12)]) == [
+        pdfmetrics.stringWidth('Lord', 'Alegreya-Medium', 14), pdfmetrics.stringWidth('Lord', 'Helvetica', 12), 0]
+
+
+def test_inexact_widths_get_no_table():
+    font = TTFont('Thirds', 'kassia/fonts/GentiumPlus/GentiumPlus-Regular.ttf')
+    assert text_metrics._build_width_table(font) is not None
+    font.face.charWidths = {ord('a'): 1000 / 3}
+    assert text_metrics._build_width_table(font) is None
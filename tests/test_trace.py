@@ -0,0 +1,23 @@
+import json
+from io import BytesIO
+
+from kassia_main import Kassia
+
+
+def test_profile_writes_nested_trace():
+    trace = BytesIO()
+    pdf = BytesIO()
+    Kassia('examples/sample.xml', pdf, profile=trace)
+    assert pdf.getvalue().startswith(b'%PDF')
+
+    events = json.loads(trace.getvalue())['traceEvents']
+    names = {event['name'] for event in events}
+    assert {'render', 'score', 'neume_group', 'line_break', 'page', 'header_footer'} <= names
+    assert all(event['ph'] == 'X' for event in events)
+
+    render = next(event for event in events if event['name'] == 'render')
+    for event in events:
+        assert render['ts'] <= event['ts'] and event['ts'] + event['dur'] <= render['ts'] + render['dur'] + 1
+    pages = [event for event in events if event['name'] == 'page']
+    assert [page['args']['page'] for page in pages] == list(range(1, len(pages) + 1))
+    assert all('memory_delta' in page['args'] for page in pages)
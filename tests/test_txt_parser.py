@@ -0,0 +1,29 @@
+import pytest
+
+import music_parser as prs
+
+
+def test_objects_are_parsed_in_one_scan():
+    objects = list(prs.iter_txt('(s: h1)\nTitle (with notes)\n---\n(mode: 5)(base: Па)\n[a: ison][b c: olig - kentU]\n---\n'))
+    para, score = objects
+    assert (para.style, para.content) == ('h1', 'Title (with notes)')
+    assert (score.mode, score.mode_base) == (5, 'Па')
+    assert [(s.text, s.neumes) for s in score.syllables] == [('a', ['ison']), ('bc', ['olig', 'kentU'])]
+
+
+@pytest.mark.parametrize('text, message, line, column', [
+    ('(mode: 5)\n[a: ison][b ison]', 'Syllable needs', 2, 11),
+    ('(s: h1)\nok\n---\n(mode 5)', 'Parameter needs', 4, 2),
+    ('[a: ison]\n  x', 'Unexpected', 2, 3),
+    ('[a: ison', 'never closed', 1, 1),
+])
+def test_errors_give_position(text, message, line, column):
+    with pytest.raises(prs.TxtSyntaxError, match=message) as error:
+        prs.music_from_txt(text, '')
+    assert (error.value.line, error.value.column) == (line, column)
+
+
+def test_section_at():
+    text = '(s: h1)\nTitle\n---\n[a: ison]\n---\n(s: p)\nEnd'
+    assert [text[slice(*prs.section_at(text, position))].strip() for position in (0, 15, 20, 31, len(text))] == [
+        '(s: h1)\nTitle', '(s: h1)\nTitle', '[a: ison]', '(s: p)\nEnd', '(s: p)\nEnd']
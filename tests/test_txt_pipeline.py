@@ -0,0 +1,61 @@
+from io import BytesIO
+
+from fastapi.testclient import TestClient
+from reportlab import rl_config
+
+import app
+import music_parser as prs
+from kassia_main import Kassia
+
+
+def test_elements_match_rendered_bnml():
+    with open('tests/txt/воскресениѧ.txt', encoding='utf-8') as txt, open('tests/headers/header1.xml') as header:
+        music = prs.music_from_txt(txt.read(), header.read())
+    bnml = BytesIO()
+    music.write(bnml)
+    bnml.seek(0)
+
+    from_text = Kassia(bnml, None, output_format='svg').svg_pages
+    from_elements = Kassia(music.to_element(), None, output_format='svg').svg_pages
+    assert from_elements == from_text
+    # The second document gets its own copy of the cached header
+    assert Kassia(music.to_element(), None, output_format='svg').svg_pages == from_text
+
+
+def test_streamed_bnml_matches_tag():
+    with open('tests/txt/воскресениѧ.txt', encoding='utf-8') as txt, open('tests/headers/header1.xml') as header:
+        music = prs.music_from_txt(txt.read(), header.read())
+    music.add_object(prs.Paragraph('two\nlines', 'h1'))
+    music.add_object(prs.Score([prs.Syllable('a', 'ison-mke')], dropcap=False))
+
+    music_content = [prs.tag(prs.tag('', 'page-number', {'align': 'center'}), 'footer')]
+    for obj in music.objects:
+        if isinstance(obj, prs.Score):
+            music_content.append(obj.render_mode())
+        music_content.append(obj.render())
+    expected = prs.tag(music.header + '\n' + prs.tag('\n'.join(music_content), 'music'), 'bnml',
+                       {'bnml_version': music.bnml_version})
+
+    streamed = BytesIO()
+    music.write(streamed)
+    assert music.render() == expected
+    assert streamed.getvalue().decode() == expected
+
+
+def test_streamed_txt_matches_whole_document(monkeypatch):
+    monkeypatch.setattr(rl_config, 'invariant', 1)
+    with open('tests/txt/воскресениѧ.txt', 'rb') as txt, open('tests/headers/header1.xml') as header:
+        txt_bytes, header_text = txt.read(), header.read()
+
+    whole = BytesIO()
+    Kassia(prs.music_from_txt(txt_bytes.decode(), header_text).to_element(), whole)
+    streamed = app.txt_stream_to_pdf(BytesIO(txt_bytes), header_text)
+    assert streamed == whole.getvalue()
+
+
+def test_txt_syntax_error_is_a_bad_request():
+    with open('tests/headers/header1.xml', 'rb') as header:
+        files = {'file': ('score.txt', b'(s: h1)\nok\n---\n(mode 5)'), 'header': ('header.xml', header.read())}
+    response = TestClient(app.app).post('/txt-to-pdf', files=files)
+    assert response.status_code == 400
+    assert 'line 4, column 2' in response.json()['detail']
@@ -0,0 +1,25 @@
+import shutil
+
+from reportlab import rl_config
+
+from kassia.renderer import Renderer
+from kassia.watch import Watcher
+
+
+def test_watch_renders_changes_with_cached_scores(tmp_path, monkeypatch):
+    monkeypatch.setattr(rl_config, 'invariant', 1)
+    input_path, output_path = str(tmp_path / 'score.xml'), str(tmp_path / 'score.pdf')
+    shutil.copy('examples/sample.xml', input_path)
+    renderer = Renderer()
+    watcher = Watcher(input_path, output_path, renderer, interval=0, debounce=0)
+    assert watcher.render()
+    assert not watcher.poll()
+
+    with open(input_path, encoding='utf-8') as f:
+        bnml = f.read()
+    with open(input_path, 'w', encoding='utf-8') as f:
+        f.write(bnml.replace('<syllable>', '<syllable>\n', 1))
+    assert watcher.poll()
+    assert 0 < watcher.score_cache.hits < len(watcher.score_cache)
+    with open(output_path, 'rb') as f:
+        assert f.read() == renderer.render(input_path)